@@ -0,0 +1,8 @@
+# ASGI: gunicorn управляет процессами uvicorn, представления чтения асинхронные
+# (mysite/asgi.py включает FILMBLOG_ASYNC_VIEWS). Сравнение с WSGI:
+# manage.py loadtest --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001
+bind = "127.0.0.1:8001"
+workers = 3
+worker_class = "uvicorn.workers.UvicornWorker"
+user = "paul"
+timeout = 120
@@ -0,0 +1,63 @@
+"""
+Быстрый путь для анонимных читателей
+
+Публичные представления (атрибут класса public = True) одинаковы для всех
+анонимных посетителей. Если у запроса нет cookie сессии, пользователь
+сразу считается анонимным: сессия не загружается, SessionMiddleware
+не добавляет Vary: Cookie и не ставит cookie. Такой ответ получает
+Cache-Control: public, max-age=FILMBLOG_PUBLIC_MAX_AGE, и его может
+кэшировать фронтовый прокси (см. config/nginx_static.conf), а ответ
+вошедшему пользователю - Cache-Control: private.
+
+Сообщения хранятся в подписанной cookie (MESSAGE_STORAGE), а не в сессии.
+"""
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.cache import patch_cache_control
+from django.utils.deprecation import MiddlewareMixin
+
+
+CACHEABLE_STATUSES = (200, 304)
+
+
+def is_public(view_func):
+    """Объявлено ли представление публичным атрибутом public"""
+    view = getattr(view_func, 'view_class', view_func)
+    return getattr(view, 'public', False)
+
+
+class AnonymousFastPathMiddleware(MiddlewareMixin):
+    """
+    Отдает публичные страницы анонимным посетителям без сессии
+
+    Стоит в MIDDLEWARE перед SessionMiddleware, чтобы видеть итоговые
+    cookie и Vary ответа.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or not is_public(view_func):
+            return None
+        request.filmblog_public = True
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            user = AnonymousUser()
+            request.user = user
+
+            async def auser():
+                return user
+
+            request.auser = auser
+            request.filmblog_anonymous = True
+        return None
+
+    def process_response(self, request, response):
+        if not getattr(request, 'filmblog_public', False) or response.has_header('Cache-Control'):
+            return response
+        session = getattr(request, 'session', None)
+        anonymous = getattr(request, 'filmblog_anonymous', False) \
+            and not (session is not None and session.accessed) and not response.cookies
+        if anonymous and response.status_code in CACHEABLE_STATUSES:
+            patch_cache_control(response, public=True,
+                                max_age=getattr(settings, 'FILMBLOG_PUBLIC_MAX_AGE', 60))
+        else:
+            patch_cache_control(response, private=True)
+        return response
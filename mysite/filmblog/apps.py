@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FilmblogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'filmblog'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,414 @@
+"""
+Импорт архива отсканированных пленок
+
+Архив описывается манифестом - JSON-массивом или JSON Lines (по записи
+на строку, читается потоково) - либо каталогом, где каждый подкаталог -
+одна пленка: первое изображение становится изображением поста,
+а поля можно задать в post.json рядом с ним. Поля записи манифеста:
+
+    {"id": "1987-03", "title": "Весна", "slug": "spring-1987",
+     "publish": "1987-03-14", "status": "published", "tags": ["bw", "city"],
+     "preview": "...", "body": "<p>...</p>", "original_author": "Зенит-Е",
+     "image": "scans/1987-03/01.jpg", "image_preview": "scans/1987-03/01.jpg"}
+
+Пути к изображениям - относительно манифеста. Файлы копируются потоком
+в хранилище с адресацией по содержимому, посты, теги и поисковые
+документы создаются пачками через bulk_create, без сигналов и форм,
+а уменьшенные копии изображений считаются в пуле процессов, пока
+импортируется следующая пачка.
+
+Вместе с постами пачки в очередь (filmblog.jobs) ставятся их задачи
+renditions с отсрочкой RENDITIONS_JOB_DELAY; пул отмечает их выполненными.
+Если импорт прервется раньше, чем пул закончит, копии и метаданные
+недостающих постов создаст manage.py run_jobs.
+
+Каждая импортированная запись отмечается в ImportedPost в той же
+транзакции, что и ее пост, поэтому прерванный импорт можно запустить
+заново: готовые записи пропускаются. Скопированные файлы повторно
+не записываются, так как имя файла - хэш содержимого.
+"""
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+import django
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from . import conditional, export, facets, fragments, jobs, media, tags
+from .images import update_renditions
+from .models import ImportedPost, Job, Post
+from .search import get_search_backend
+from .storage import content_storage
+from .text import render_preview
+
+
+BATCH_SIZE = 500
+# Через сколько задачу копий пачки может взять run_jobs, если пул импорта ее не выполнил
+RENDITIONS_JOB_DELAY = datetime.timedelta(minutes=30)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp')
+MANIFEST_NAMES = ('manifest.jsonl', 'manifest.json')
+POST_METADATA = 'post.json'
+POST_FIELDS = ('title', 'slug', 'publish', 'status', 'preview', 'body', 'original_author')
+
+ImportResult = namedtuple('ImportResult', 'imported skipped failed renditions elapsed')
+
+
+def _resolve_images(entry, base):
+    # Без id запись узнается по пути к изображению внутри архива
+    if not entry.get('id') and entry.get('image'):
+        entry['id'] = entry['image']
+    for field_name in media.MEDIA_FIELDS:
+        if entry.get(field_name):
+            entry[field_name] = os.path.join(base, entry[field_name])
+    return entry
+
+
+def _directory_entries(root):
+    for name in sorted(os.listdir(root)):
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory):
+            continue
+        images = sorted(file_name for file_name in os.listdir(directory)
+                        if file_name.lower().endswith(IMAGE_EXTENSIONS))
+        entry = {'id': name, 'title': name, 'image': images[0] if images else None}
+        metadata = os.path.join(directory, POST_METADATA)
+        if os.path.exists(metadata):
+            with open(metadata, encoding='utf-8') as file:
+                entry.update(json.load(file))
+        yield _resolve_images(entry, directory)
+
+
+def read_manifest(path):
+    """
+    Записи архива
+
+    Args:
+        path (str): Файл манифеста (.json или .jsonl) или каталог архива
+
+    Returns:
+        iterator: Словари записей с абсолютными путями к изображениям
+
+    Raises:
+        ValueError: Если манифест не разбирается
+    """
+    if os.path.isdir(path):
+        for name in MANIFEST_NAMES:
+            if os.path.exists(os.path.join(path, name)):
+                return read_manifest(os.path.join(path, name))
+        return _directory_entries(path)
+
+    base = os.path.dirname(os.path.abspath(path))
+    if path.endswith('.jsonl'):
+        def entries():
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        yield _resolve_images(json.loads(line), base)
+        return entries()
+
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    if not isinstance(data, list):
+        raise ValueError('Манифест должен быть JSON-массивом записей')
+    return (_resolve_images(entry, base) for entry in data)
+
+
+def entry_key(source, entry):
+    """Ключ записи в ImportedPost: имя архива и id записи (или ее заголовок)"""
+    entry_id = entry.get('id') or entry.get('title')
+    if not entry_id:
+        raise ValueError('У записи нет id и заголовка')
+    key = f'{source}:{entry_id}'
+    if len(key) > 255:
+        key = f'{source[:150]}:sha256:{hashlib.sha256(str(entry_id).encode()).hexdigest()}'
+    return key
+
+
+def parse_publish(value):
+    """Дата публикации из ISO-строки даты или даты и времени"""
+    if not value:
+        return timezone.now()
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Неверная дата публикации: {value}')
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class ArchiveImporter:
+    """
+    Импорт записей архива пачками
+
+    Атрибуты:
+        author (User): Автор постов
+        source (str): Имя архива для ключей ImportedPost
+        workers (int): Процессов для уменьшенных копий (0 - в этом процессе)
+    """
+
+    def __init__(self, author, source, workers=0, log=None):
+        self.author = author
+        self.source = source
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.search_backend = get_search_backend()
+        self.content_type = ContentType.objects.get_for_model(Post)
+        self.stored = {}
+        self.failed = []
+        self.imported = self.skipped = self.renditions = 0
+
+    def store_image(self, path):
+        """Копирует файл в хранилище потоком и возвращает его имя"""
+        if path not in self.stored:
+            with open(path, 'rb') as file:
+                self.stored[path] = content_storage.save(os.path.basename(path), File(file))
+        return self.stored[path]
+
+    def build_post(self, key, entry):
+        values = {field: entry[field] for field in POST_FIELDS if entry.get(field) is not None}
+        if not values.get('title'):
+            raise ValueError('Нет заголовка')
+        values['publish'] = parse_publish(values.get('publish'))
+        values.setdefault('status', 'published')
+        if values['status'] not in dict(Post.STATUS_CHOICES):
+            raise ValueError(f'Неверный статус: {values["status"]}')
+        values['slug'] = (slugify(values.get('slug') or values['title'])
+                          or f'roll-{hashlib.sha256(key.encode()).hexdigest()[:10]}')[:250]
+        image = self.store_image(entry['image']) if entry.get('image') else None
+        preview = entry.get('image_preview')
+        post = Post(author=self.author, image=image,
+                    image_preview=self.store_image(preview) if preview else image, **values)
+        post.preview_html = render_preview(post.preview)
+        post.render_body()
+        return post
+
+    @staticmethod
+    def unique_slugs(posts):
+        """
+        Делает слаги новых постов уникальными
+
+        bulk_create не проверяет unique_for_date, а редактирование
+        и удаление находят пост по одному слагу. Поэтому слаг, занятый
+        в базе или предыдущим постом пачки, получает суффикс из хэша ключа записи.
+
+        Args:
+            posts (list): Пары (ключ записи, Post)
+        """
+        bases = {key: post.slug for key, post in posts}
+        assigned, pending, attempt = set(), posts, 0
+        while pending:
+            taken = set(Post.objects.filter(slug__in=[post.slug for key, post in pending])
+                        .values_list('slug', flat=True)) | assigned
+            retry = []
+            for key, post in pending:
+                if post.slug in taken:
+                    attempt_key = f'{key}:{attempt}' if attempt else key
+                    digest = hashlib.sha256(attempt_key.encode()).hexdigest()[:8]
+                    post.slug = f'{bases[key][:241]}-{digest}'
+                    retry.append((key, post))
+                else:
+                    assigned.add(post.slug)
+                    taken.add(post.slug)
+            pending, attempt = retry, attempt + 1
+
+    @staticmethod
+    def tag_ids(names):
+        """
+        Идентификаторы тегов по именам, недостающие теги создаются
+
+        Слаги - только ASCII, как требует адрес списка тега (taggit
+        оставил бы в слаге кириллицу).
+        """
+        known = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+        missing = [name for name in names if name not in known]
+        digests = {name: hashlib.sha256(name.encode()).hexdigest()[:8] for name in missing}
+        slugs = {name: slugify(name) or f'tag-{digests[name]}' for name in missing}
+        Tag.objects.bulk_create([Tag(name=name, slug=slugs[name]) for name in missing],
+                                ignore_conflicts=True)
+        known.update(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+        for name in missing:
+            if name not in known:
+                # Слаг занят тегом с другим именем
+                known[name] = Tag.objects.create(name=name, slug=f'{slugs[name]}-{digests[name]}').pk
+        return known
+
+    def import_batch(self, entries):
+        """
+        Импортирует пачку записей
+
+        Returns:
+            list: Идентификаторы новых постов с изображениями
+        """
+        keyed = []
+        for entry in entries:
+            try:
+                keyed.append((entry_key(self.source, entry), entry))
+            except ValueError as e:
+                self.failed.append((repr(entry)[:100], str(e)))
+        done = set(ImportedPost.objects.filter(key__in=[key for key, entry in keyed])
+                   .values_list('key', flat=True))
+        self.skipped += len(done)
+
+        posts, post_tags, seen = [], [], set()
+        for key, entry in keyed:
+            if key in done or key in seen:
+                continue
+            seen.add(key)
+            try:
+                posts.append((key, self.build_post(key, entry)))
+            except (OSError, ValueError, TypeError) as e:
+                self.failed.append((key, str(e)))
+                continue
+            post_tags.append([str(name) for name in entry.get('tags') or []])
+        if not posts:
+            return []
+
+        with transaction.atomic():
+            self.unique_slugs(posts)
+            created = Post.objects.bulk_create([post for key, post in posts])
+            ImportedPost.objects.bulk_create([
+                ImportedPost(key=key, post=post) for (key, _), post in zip(posts, created)
+            ])
+            tag_ids = self.tag_ids({name for names in post_tags for name in names})
+            TaggedItem.objects.bulk_create([
+                TaggedItem(tag_id=tag_ids[name], content_type=self.content_type, object_id=post.pk)
+                for post, names in zip(created, post_tags) for name in set(names)
+            ])
+            references = Counter()
+            for post in created:
+                references.update(media.file_names({
+                    field: getattr(post, field).name for field in media.MEDIA_FIELDS
+                }))
+            for name, count in references.items():
+                media.retain(name, count)
+            self.search_backend.update_many(created)
+            tags.refresh(tag_ids.values())
+            with_images = [post for post in created if post.image or post.image_preview]
+            run_after = timezone.now() + RENDITIONS_JOB_DELAY
+            Job.objects.bulk_create([Job(name='renditions', post=post, run_after=run_after)
+                                     for post in with_images])
+
+        self.imported += len(created)
+        return [post.pk for post in with_images]
+
+    def finish(self):
+        """Сбрасывает кэши страниц и ставит в очередь статическую копию"""
+        if not self.imported:
+            return
+        fragments.get_fragment_cache().clear()
+        conditional.bump()
+        if export.enabled():
+            export.mark_all()
+            jobs.enqueue('static_export')
+
+    def run(self, entries, batch_size=BATCH_SIZE):
+        """
+        Импортирует записи и создает уменьшенные копии их изображений
+
+        Returns:
+            ImportResult: Итоги импорта
+        """
+        start = time.monotonic()
+        entries = iter(entries)
+        executor, pending = None, set()
+        if self.workers:
+            # Процессы запускаются через spawn и настраивают Django сами
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=self.workers,
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=django.setup)
+        try:
+            while True:
+                batch = list(islice(entries, batch_size))
+                if not batch:
+                    break
+                post_ids = self.import_batch(batch)
+                if executor is None:
+                    self.renditions += build_renditions(post_ids)
+                elif post_ids:
+                    pending.add(executor.submit(build_renditions, post_ids))
+                    # Импорт не уходит далеко вперед копий
+                    while len(pending) > self.workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._collect(done)
+                elapsed = time.monotonic() - start
+                self.log(f'Импортировано: {self.imported}, пропущено: {self.skipped}, '
+                         f'ошибок: {len(self.failed)}, {self.imported / elapsed:.1f} постов/с')
+            if pending:
+                self.log('Ожидание уменьшенных копий...')
+                self._collect(wait(pending).done)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self.finish()
+        return ImportResult(self.imported, self.skipped, self.failed, self.renditions,
+                            time.monotonic() - start)
+
+    def _collect(self, futures):
+        for future in futures:
+            error = future.exception()
+            if error is None:
+                self.renditions += future.result()
+            else:
+                self.failed.append(('renditions', repr(error)))
+
+
+def build_renditions(post_ids):
+    """
+    Создает уменьшенные копии изображений постов и извлекает их метаданные
+
+    Выполняется в процессах пула импорта, поэтому принимает id, а не объекты.
+    Задачи renditions этих постов в очереди отмечаются выполненными.
+
+    Returns:
+        int: Количество постов, у которых появились копии
+    """
+    updated = 0
+    pairs, done = set(), []
+    for post in Post.objects.filter(pk__in=post_ids):
+        pairs |= facets.update_metadata(post) or set()
+        try:
+            updated += update_renditions(post)
+        except OSError:
+            # Задача останется в очереди, и ошибка будет видна в ее статусе
+            continue
+        done.append(post.pk)
+    facets.refresh(pairs)
+    Job.objects.filter(name='renditions', post_id__in=done, status='queued') \
+        .update(status='done', updated=timezone.now())
+    return updated
+
+
+def import_archive(path, author, source=None, batch_size=BATCH_SIZE, workers=0, log=None):
+    """
+    Импортирует архив
+
+    Args:
+        path (str): Манифест или каталог архива (см. read_manifest)
+        author (User): Автор постов
+        source (str|None): Имя архива для ключей возобновления, по умолчанию имя файла
+        batch_size (int): Записей в пачке
+        workers (int): Процессов для уменьшенных копий (0 - в этом процессе)
+        log (callable|None): Функция для вывода прогресса
+
+    Returns:
+        ImportResult: Итоги импорта
+    """
+    source = source or os.path.basename(os.path.normpath(path))
+    importer = ArchiveImporter(author, source, workers=workers, log=log)
+    return importer.run(read_manifest(path), batch_size=batch_size)
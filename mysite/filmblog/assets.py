@@ -0,0 +1,275 @@
+"""
+Сборка статических файлов страниц
+
+Стили и скрипты страниц склеиваются в бандлы по типу страницы
+и минифицируются при manage.py collectstatic (хранилище
+BundledStaticFilesStorage). Имена бандлов и остальных
+файлов получают хэш содержимого (ManifestStaticFilesStorage), рядом
+кладутся сжатые варианты .gz и .br (если установлен пакет brotli),
+и фронтовый веб-сервер отдает их с Cache-Control: immutable
+(см. config/nginx_static.conf).
+
+Тег {% asset_bundle %} выводит бандл, если статика собрана этим
+хранилищем, и исходные файлы по отдельности - при разработке.
+
+Отчет об экономии по типам страниц: manage.py benchmark --assets.
+"""
+import gzip
+import logging
+import re
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+# Бандл лежит в каталоге исходных стилей, чтобы не менялись относительные url()
+BUNDLES = {
+    'filmblog/css/site.bundle.css': [
+        'filmblog/css/base.css',
+        'filmblog/css/vendor.css',
+        'filmblog/css/main.css',
+    ],
+    'filmblog/js/head.bundle.js': [
+        'filmblog/js/modernizr.js',
+    ],
+    'filmblog/js/site.bundle.js': [
+        'filmblog/js/jquery-3.2.1.min.js',
+        'filmblog/js/plugins.js',
+        'filmblog/js/main.js',
+    ],
+    'filmblog/js/editor.bundle.js': [
+        'filmblog/js/jquery-3.2.1.min.js',
+        'filmblog/js/plugins.js',
+        'filmblog/js/main.js',
+        'filmblog/js/chunked-upload.js',
+    ],
+}
+
+# Бандлы, которые загружает страница каждого типа
+PAGES = {
+    'site': ['filmblog/css/site.bundle.css', 'filmblog/js/head.bundle.js',
+             'filmblog/js/site.bundle.js'],
+    'editor': ['filmblog/css/site.bundle.css', 'filmblog/js/head.bundle.js',
+               'filmblog/js/editor.bundle.js'],
+}
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.webmanifest', '.txt', '.xml')
+
+_CSS_STRING_OR_COMMENT = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*.*?\*/', re.S)
+_CSS_IMPORT = re.compile(r'@import\s[^;]+;|@charset\s[^;]+;')
+
+
+def _compact_css(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r' ?([{};,]) ?', r'\1', code)
+    return re.sub(r': ', ':', code).replace(';}', '}')
+
+
+def minify_css(source):
+    """
+    Удаляет из CSS комментарии (кроме /*! ... */) и лишние пробелы
+
+    Строки в кавычках не меняются; пробелы вокруг + и - в calc() остаются.
+    """
+    parts, code, position = [], [], 0
+    for match in _CSS_STRING_OR_COMMENT.finditer(source):
+        code.append(source[position:match.start()])
+        token = match.group()
+        if token.startswith('/*') and not token.startswith('/*!'):
+            code.append(' ')
+        else:
+            parts.extend([_compact_css(''.join(code)), token])
+            code = []
+        position = match.end()
+    code.append(source[position:])
+    parts.append(_compact_css(''.join(code)))
+    return ''.join(parts).strip() + '\n'
+
+
+def minify_js(source):
+    """
+    Удаляет из JavaScript отступы, пустые строки и строки-комментарии
+
+    Без разбора синтаксиса: код внутри строк не трогается, кроме
+    отступов многострочных строк, а файлы с шаблонными строками
+    (`...`) не меняются вовсе.
+    """
+    if '`' in source:
+        return source.strip() + '\n'
+    lines, in_comment = [], False
+    for line in source.splitlines():
+        line = line.strip()
+        if in_comment:
+            if '*/' not in line:
+                continue
+            line, in_comment = line.split('*/', 1)[1].strip(), False
+        elif line.startswith('/*') and not line.startswith('/*!'):
+            if '*/' not in line:
+                in_comment = True
+                continue
+            line = line.split('*/', 1)[1].strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def build_bundle(name, read):
+    """
+    Склеивает и минифицирует исходные файлы бандла
+
+    Args:
+        name (str): Имя бандла из BUNDLES
+        read (callable): Возвращает текст исходного файла по его имени
+
+    Returns:
+        str: Содержимое бандла
+    """
+    sources = [read(path) for path in BUNDLES[name]]
+    if name.endswith('.css'):
+        code = ''.join(minify_css(source) for source in sources)
+        # @import действует только в начале файла
+        imports = list(dict.fromkeys(_CSS_IMPORT.findall(code)))
+        return ''.join(imports) + '\n' + _CSS_IMPORT.sub('', code)
+    # ; на случай файла без точки с запятой в конце
+    return ';\n'.join(minify_js(source) for source in sources)
+
+
+def read_source(path):
+    """Текст исходного статического файла через finders"""
+    with open(finders.find(path), encoding='utf-8') as file:
+        return file.read()
+
+
+def compress(data):
+    """
+    Сжатые варианты содержимого
+
+    Returns:
+        dict: Расширение (.gz, .br) -> сжатые байты
+    """
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data)
+    return variants
+
+
+def bundles_enabled():
+    """Собрана ли статика хранилищем с бандлами"""
+    return isinstance(staticfiles_storage, BundledStaticFilesStorage)
+
+
+def render_bundle(name):
+    """
+    HTML для подключения бандла
+
+    Returns:
+        str: Один тег для бандла или теги исходных файлов при разработке
+    """
+    paths = [name] if bundles_enabled() else BUNDLES[name]
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link href="{}" rel="stylesheet">',
+                                ((static(path),) for path in paths))
+    return format_html_join('\n', '<script src="{}"></script>', ((static(path),) for path in paths))
+
+
+def report():
+    """
+    Экономия на каждом типе страниц
+
+    Returns:
+        dict: По типу страницы - число запросов и байты исходных файлов
+              и бандлов, без сжатия и сжатых
+    """
+    sources = {}
+
+    def read(path):
+        if path not in sources:
+            sources[path] = read_source(path).encode()
+        return sources[path].decode()
+
+    bundles = {name: build_bundle(name, read).encode() for name in BUNDLES}
+    result = {}
+    for page, names in PAGES.items():
+        files = [sources[path] for path in dict.fromkeys(
+            path for name in names for path in BUNDLES[name])]
+        data = [bundles[name] for name in names]
+        row = {
+            'requests': len(files),
+            'bundle_requests': len(data),
+            'original_bytes': sum(map(len, files)),
+            'bundle_bytes': sum(map(len, data)),
+        }
+        for extension, label in (('.gz', 'gzip'), ('.br', 'brotli')):
+            if extension == '.br' and brotli is None:
+                continue
+            row[f'original_{label}_bytes'] = sum(len(compress(item)[extension]) for item in files)
+            row[f'bundle_{label}_bytes'] = sum(len(compress(item)[extension]) for item in data)
+        row['saved_bytes'] = row['original_bytes'] - row['bundle_bytes']
+        row['saved_gzip_bytes'] = row['original_gzip_bytes'] - row['bundle_gzip_bytes']
+        result[page] = row
+    return result
+
+
+class BundledStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хранилище статики для collectstatic
+
+    Перед расчетом хэшей собирает бандлы из BUNDLES,
+    после - кладет рядом с файлами, имена которых содержат хэш,
+    сжатые варианты .gz и .br.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for name in BUNDLES:
+                content = build_bundle(name, lambda path: self._read_source(paths, path))
+                if self.exists(name):
+                    self.delete(name)
+                self.save(name, ContentFile(content.encode()))
+                paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if not dry_run:
+            self.compress_hashed_files()
+
+    def url_converter(self, name, hashed_files, template=None):
+        """Ссылки на отсутствующие файлы (например, из css/old) оставляет как есть"""
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError as e:
+                logger.warning('%s: %s', name, e)
+                return matchobj['matched']
+
+        return convert
+
+    @staticmethod
+    def _read_source(paths, path):
+        storage, source_path = paths[path]
+        with storage.open(source_path) as file:
+            return file.read().decode()
+
+    def compress_hashed_files(self):
+        """Записывает .gz и .br рядом с файлами, имена которых содержат хэш"""
+        if brotli is None:
+            logger.warning('Пакет brotli не установлен (requirements.txt): пишутся только .gz')
+        for name in set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as file:
+                data = file.read()
+            for extension, compressed in compress(data).items():
+                if len(compressed) < len(data):
+                    with open(self.path(name) + extension, 'wb') as file:
+                        file.write(compressed)
@@ -0,0 +1,54 @@
+"""
+Бэкенд PostgreSQL с пулом соединений процесса (см. filmblog.pool)
+
+Используется с CONN_MAX_AGE = 0: Django закрывает соединение в конце
+запроса, а бэкенд вместо закрытия возвращает его в пул.
+
+    'ENGINE': 'filmblog.backends.postgresql_pool',
+    'CONN_MAX_AGE': 0,
+    'POOL': {'size': 5, 'max_overflow': 5},
+"""
+from django.db.backends.postgresql.base import Database
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+
+from ... import instrumentation, pool
+from .creation import DatabaseCreation
+
+
+def _is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+def _reset(connection):
+    # Незавершенная транзакция не должна достаться следующему запросу
+    connection.rollback()
+
+
+def _close(connection):
+    connection.close()
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        settings_dict = self.settings_dict
+        key = '{}:{}@{}:{}/{}'.format(self.alias, settings_dict['USER'], settings_dict['HOST'],
+                                      settings_dict['PORT'], settings_dict['NAME'])
+        options = {**pool.DEFAULTS, **settings_dict.get('POOL', {})}
+        return pool.get_pool(key, lambda: pool.ConnectionPool(_is_usable, _reset, _close, **options))
+
+    def get_new_connection(self, conn_params):
+        with instrumentation.span('db_pool'):
+            return self.pool.checkout(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
@@ -0,0 +1,11 @@
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgresDatabaseCreation
+
+from ... import pool
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Соединения, оставшиеся в пуле, не дают удалить тестовую базу
+        pool.dispose_all()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,506 @@
+"""
+Синтетический архив пленочных снимков и замер производительности представлений
+
+generate_dataset() детерминированно (по seed) создает пользователей, теги,
+посты и изображения-заглушки пачками через bulk_create, без сигналов,
+поэтому подходит и для 1 000, и для 1 000 000 постов. Посты набора
+отличаются слагом с префиксом DATASET_PREFIX.
+
+run_benchmark() запрашивает страницы через тестовый клиент Django
+(без сети и отдельного сервера) и возвращает пропускную способность,
+перцентили задержки и среднее число SQL-запросов по сценариям.
+
+run_load_test() нагружает запущенные серверы (например, gunicorn с WSGI
+и с ASGI) параллельными HTTP-запросами по одним и тем же адресам и
+сравнивает пропускную способность и хвосты задержки при заданной
+конкурентности.
+
+run_render_benchmark() замеряет процессорное время рендеринга шаблона
+страницы каждого представления: без кэша шаблонов и общих частей страниц
+(до) и с кэширующим загрузчиком и кэшем фрагментов (после).
+
+run_connection_benchmark() сравнивает цикл "соединение - SELECT 1 -
+закрытие", который Django проходит на каждый запрос, у обычного бэкенда
+PostgreSQL и у бэкенда с пулом (filmblog.pool).
+"""
+import math
+import platform
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+import django
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import connection, connections, transaction
+from django.db.models import QuerySet
+from django.db.utils import load_backend
+from django.template import Engine, RequestContext, engines
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve, reverse
+from django.utils.http import urlencode
+from PIL import Image
+from taggit.models import Tag, TaggedItem
+
+from . import fragments, media
+from . import pool as db_pool
+from .tags import recount as recount_tag_stats
+from .text import render_preview
+from .models import Post
+from .pagination import KeysetPaginationMixin, encode_cursor
+from .search import get_search_backend
+from .storage import content_storage
+
+
+DATASET_PREFIX = 'bench-'
+DATASET_START = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+FILM_STOCKS = (
+    'Kodak Portra 400', 'Kodak Ektar 100', 'Kodak Gold 200', 'Kodak Tri-X 400',
+    'Ilford HP5 Plus', 'Ilford Delta 3200', 'Ilford FP4 Plus', 'Fuji Superia 400',
+    'Fuji Velvia 50', 'Fuji Pro 400H', 'Cinestill 800T', 'Foma 100',
+)
+CAMERAS = (
+    'Zenit-E', 'Kiev 88', 'Smena 8M', 'Nikon FM2', 'Canon AE-1', 'Pentax K1000',
+    'Olympus OM-1', 'Leica M6', 'Mamiya RB67', 'Yashica Mat-124G',
+)
+WORDS = (
+    'пленка', 'проявка', 'кадр', 'зерно', 'экспозиция', 'объектив', 'диафрагма',
+    'выдержка', 'сканирование', 'негатив', 'слайд', 'город', 'портрет', 'пейзаж',
+    'свет', 'тень', 'улица', 'море', 'осень', 'вечер', 'камера', 'фотограф',
+)
+TAG_WORDS = ('film', 'bw', 'color', 'portrait', 'street', 'landscape', 'medium-format', 'slide')
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _placeholder(rng, index):
+    """JPEG-заглушка с неповторяющимся цветом"""
+    color = (rng.randrange(256), rng.randrange(256), index % 256)
+    buffer = BytesIO()
+    Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG', quality=70)
+    return ContentFile(buffer.getvalue(), name=f'placeholder-{index}.jpg')
+
+
+def dataset_posts():
+    return Post.objects.filter(slug__startswith=DATASET_PREFIX)
+
+
+def generate_dataset(posts, users=10, tags=50, images=20, seed=1, batch_size=1000, log=None):
+    """
+    Создает синтетический архив постов
+
+    Повторный вызов с тем же seed дает те же заголовки, даты, теги
+    и изображения. Если набор уже создан, он не пересоздается.
+
+    Args:
+        posts (int): Количество постов
+        users (int): Количество авторов
+        tags (int): Количество тегов
+        images (int): Количество разных изображений-заглушек (0 - без изображений)
+        seed (int): Зерно генератора случайных чисел
+        batch_size (int): Размер пачки bulk_create
+        log (callable|None): Функция для вывода прогресса
+
+    Returns:
+        int: Количество созданных постов
+    """
+    log = log or (lambda message: None)
+    if dataset_posts().exists():
+        log('Набор данных уже создан')
+        return 0
+
+    # Отдельные генераторы, чтобы результат не зависел от размера пачки
+    rng, tag_rng = random.Random(f'{seed}-posts'), random.Random(f'{seed}-tags')
+    User.objects.bulk_create([
+        User(username=f'{DATASET_PREFIX}user-{i}', is_staff=(i == 0)) for i in range(users)
+    ], ignore_conflicts=True)
+    authors = list(User.objects.filter(username__startswith=f'{DATASET_PREFIX}user-').order_by('pk'))
+    Tag.objects.bulk_create([
+        Tag(name=f'{TAG_WORDS[i % len(TAG_WORDS)]}-{i}', slug=f'{TAG_WORDS[i % len(TAG_WORDS)]}-{i}')
+        for i in range(tags)
+    ], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.filter(slug__in=[
+        f'{TAG_WORDS[i % len(TAG_WORDS)]}-{i}' for i in range(tags)
+    ]).order_by('pk').values_list('pk', flat=True))
+    image_rng = random.Random(f'{seed}-images')
+    image_names = [content_storage.save(f'placeholder-{i}.jpg', _placeholder(image_rng, i))
+                   for i in range(images)]
+
+    content_type = ContentType.objects.get_for_model(Post)
+    backend = get_search_backend()
+    # Равномерно по времени, от старых к новым
+    step = timedelta(days=365 * 20) / max(posts, 1)
+    created = 0
+    while created < posts:
+        count = min(batch_size, posts - created)
+        batch = []
+        for i in range(created, created + count):
+            stock, camera = rng.choice(FILM_STOCKS), rng.choice(CAMERAS)
+            image = rng.choice(image_names) if image_names else None
+            preview = _text(rng, 25)
+            post = Post(
+                title=f'{stock}, {camera} #{i}',
+                slug=f'{DATASET_PREFIX}{i}',
+                author=rng.choice(authors),
+                preview=preview,
+                preview_html=render_preview(preview),
+                original_author=camera,
+                body=''.join(f'<p>{_text(rng, 60)}</p>' for _ in range(rng.randint(2, 6))),
+                image=image,
+                image_preview=image,
+                status='published' if rng.random() < 0.9 else 'draft',
+                publish=DATASET_START + step * i,
+            )
+            post.render_body()
+            batch.append(post)
+        with transaction.atomic():
+            batch = Post.objects.bulk_create(batch)
+            TaggedItem.objects.bulk_create([
+                TaggedItem(tag_id=tag_id, content_type=content_type, object_id=post.pk)
+                for post in batch
+                for tag_id in tag_rng.sample(tag_ids, min(len(tag_ids), tag_rng.randint(1, 4)))
+            ])
+            backend.update_many(batch)
+        created += count
+        log(f'Создано постов: {created}/{posts}')
+
+    media.recount()
+    recount_tag_stats()
+    fragments.get_fragment_cache().clear()
+    return created
+
+
+def percentile(values, q):
+    """Перцентиль q (0-100) по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def scenario_urls(rng, requests):
+    """
+    Адреса запросов по сценариям
+
+    Returns:
+        dict: Имя сценария -> (список адресов, нужен ли вход)
+    """
+    published = Post.published.filter(slug__startswith=DATASET_PREFIX)
+    total = published.count()
+    pages = max(min(total // fragments.POST_LIST_PAGE_SIZE, KeysetPaginationMixin.keyset_numbered_pages), 1)
+    tag_slugs = list(Tag.objects.filter(
+        taggit_taggeditem_items__content_type=ContentType.objects.get_for_model(Post)
+    ).values_list('slug', flat=True).distinct()[:50])
+    samples = [
+        published.order_by('pk').only('slug', 'publish')[rng.randrange(total)]
+        for _ in range(requests)
+    ] if total else []
+    return {
+        'index': ([f"{reverse('filmblog:index')}?page={rng.randint(1, pages)}"
+                   for _ in range(requests)], False),
+        'tag': ([reverse('filmblog:post_list_by_tag', args=[rng.choice(tag_slugs)])
+                 for _ in range(requests)] if tag_slugs else [], False),
+        'index_deep': ([f"{reverse('filmblog:index')}?cursor={encode_cursor('n', post.publish, post.pk)}"
+                        for post in samples], False),
+        'detail': ([post.get_absolute_url() for post in samples], False),
+        'search': ([f"{reverse('filmblog:search_results')}?{urlencode({'query': rng.choice(WORDS)})}"
+                    for _ in range(requests)], False),
+        'manage': ([reverse('filmblog:post_manage') for _ in range(requests)], True),
+    }
+
+
+def run_benchmark(requests=200, warmup=10, seed=1, cold=False, scenarios=None, log=None):
+    """
+    Замеряет задержку и пропускную способность представлений
+
+    Args:
+        requests (int): Количество замеряемых запросов на сценарий
+        warmup (int): Количество запросов прогрева (не учитываются)
+        seed (int): Зерно выбора адресов
+        cold (bool): Очищать кэш перед каждым запросом
+        scenarios (list|None): Имена сценариев или None для всех
+        log (callable|None): Функция для вывода прогресса
+
+    Returns:
+        dict: Описание окружения и результаты по сценариям
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    staff = User.objects.filter(username__startswith=DATASET_PREFIX, is_staff=True).first()
+    results = {}
+    for name, (urls, login) in scenario_urls(rng, requests + warmup).items():
+        if scenarios and name not in scenarios or not urls:
+            continue
+        client = Client()
+        if login:
+            client.force_login(staff)
+        durations, queries = [], []
+        for number, url in enumerate(urls):
+            if cold:
+                for cache in caches.all():
+                    cache.clear()
+            start = time.perf_counter()
+            response = client.get(url)
+            duration = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: HTTP {response.status_code}')
+            if number >= warmup:
+                durations.append(duration)
+                queries.append(getattr(response, 'metrics', None) and response.metrics.queries)
+        counted = [value for value in queries if value is not None]
+        results[name] = {
+            'requests': len(durations),
+            'throughput_rps': round(len(durations) / sum(durations), 1),
+            'mean_ms': round(sum(durations) / len(durations) * 1000, 2),
+            'p50_ms': round(percentile(durations, 50) * 1000, 2),
+            'p90_ms': round(percentile(durations, 90) * 1000, 2),
+            'p99_ms': round(percentile(durations, 99) * 1000, 2),
+            'max_ms': round(max(durations) * 1000, 2),
+            'avg_queries': round(sum(counted) / len(counted), 2) if counted else None,
+        }
+        log(f'{name}: p50 {results[name]["p50_ms"]} мс, p99 {results[name]["p99_ms"]} мс')
+
+    return {'environment': environment(cold=cold, seed=seed), 'results': results}
+
+
+RENDER_SCENARIOS = ('index', 'tag', 'detail', 'search')
+
+
+def _view_context(url):
+    """Имя шаблона, запрос и контекст, с которыми представление рендерит страницу"""
+    request = RequestFactory().get(url)
+    request.user = AnonymousUser()
+    match = resolve(urlsplit(url).path)
+    view = match.func.view_class(**match.func.view_initkwargs)
+    view.setup(request, *match.args, **match.kwargs)
+    if hasattr(view, 'get_object'):
+        view.object = view.get_object()
+        context = view.get_context_data(object=view.object)
+    else:
+        view.object_list = view.get_queryset()
+        context = view.get_context_data()
+    # Запросы выполняются до замера, чтобы мерить только шаблон
+    context = {key: list(value) if isinstance(value, QuerySet) else value
+               for key, value in context.items()}
+    return view.get_template_names()[0], request, context
+
+
+def _uncached_engine(engine):
+    """Копия движка шаблонов без кэширующего загрузчика"""
+    loaders = []
+    for loader in engine.loaders:
+        if isinstance(loader, (tuple, list)) and loader[0].endswith('cached.Loader'):
+            loaders.extend(loader[1])
+        else:
+            loaders.append(loader)
+    return Engine(dirs=engine.dirs, loaders=loaders, context_processors=engine.context_processors,
+                  debug=engine.debug, string_if_invalid=engine.string_if_invalid,
+                  file_charset=engine.file_charset, libraries=engine.libraries,
+                  builtins=[name for name in engine.builtins if name not in Engine.default_builtins],
+                  autoescape=engine.autoescape)
+
+
+def run_render_benchmark(renders=200, seed=1, scenarios=None, log=None):
+    """
+    Замеряет процессорное время рендеринга страниц до и после кэширования шаблонов
+
+    "До" - шаблоны читаются и компилируются при каждом рендеринге, а шапка,
+    меню и подвал рендерятся заново (новая версия деплоя на каждый рендеринг).
+    "После" - кэширующий загрузчик из настроек и общие части из кэша фрагментов.
+    Контекст готовится представлением заранее, запросы к базе не замеряются.
+
+    Args:
+        renders (int): Рендерингов на сценарий и вариант
+        seed (int): Зерно выбора адресов
+        scenarios (list|None): Имена сценариев или None для всех
+        log (callable|None): Функция для вывода прогресса
+
+    Returns:
+        dict: Описание окружения и время рендеринга по сценариям
+    """
+    log = log or (lambda message: None)
+    cached = engines['django'].engine
+    variants = {'before': (_uncached_engine(cached), True), 'after': (cached, False)}
+    results = {}
+    for name, (urls, login) in scenario_urls(random.Random(seed), 1).items():
+        if name not in RENDER_SCENARIOS or scenarios and name not in scenarios or not urls:
+            continue
+        template_name, request, context = _view_context(urls[0])
+        results[name] = {'template': template_name}
+        for variant, (engine, cold) in variants.items():
+            durations = []
+            for number in range(renders):
+                version = f'{DATASET_PREFIX}{number}' if cold else None
+                with override_settings(FILMBLOG_DEPLOY_VERSION=version) if cold else nullcontext():
+                    start = time.process_time()
+                    engine.get_template(template_name).render(RequestContext(request, context))
+                    durations.append(time.process_time() - start)
+            results[name][variant] = {
+                'renders': renders,
+                'mean_cpu_ms': round(sum(durations) / renders * 1000, 3),
+                'p50_cpu_ms': round(percentile(durations, 50) * 1000, 3),
+                'p99_cpu_ms': round(percentile(durations, 99) * 1000, 3),
+            }
+        before, after = results[name]['before']['mean_cpu_ms'], results[name]['after']['mean_cpu_ms']
+        results[name]['speedup'] = round(before / after, 2) if after else None
+        log(f'{name}: {before} -> {after} мс CPU на рендеринг')
+
+    return {'environment': environment(seed=seed, renders=renders), 'results': results}
+
+
+def _fetch(url, timeout):
+    """Запрашивает адрес и возвращает (длительность, код ответа или None при сбое)"""
+    start = time.perf_counter()
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except HTTPError as e:
+        status = e.code
+    except (URLError, OSError):
+        status = None
+    return time.perf_counter() - start, status
+
+
+def run_load_test(targets, requests=500, concurrency=50, seed=1, scenarios=None,
+                  timeout=30, log=None):
+    """
+    Нагружает запущенные серверы параллельными запросами
+
+    Каждый сервер получает одни и те же адреса в одном порядке. Сценарии,
+    требующие входа, пропускаются.
+
+    Args:
+        targets (dict): Имя сервера -> базовый адрес (http://127.0.0.1:8000)
+        requests (int): Количество запросов на сценарий
+        concurrency (int): Количество одновременных запросов
+        seed (int): Зерно выбора адресов
+        scenarios (list|None): Имена сценариев или None для всех
+        timeout (float): Таймаут запроса, секунды
+        log (callable|None): Функция для вывода прогресса
+
+    Returns:
+        dict: Описание окружения и результаты по серверам и сценариям
+    """
+    log = log or (lambda message: None)
+    urls = scenario_urls(random.Random(seed), requests)
+    results = {}
+    for target, base_url in targets.items():
+        results[target] = {}
+        for name, (paths, login) in urls.items():
+            if login or scenarios and name not in scenarios or not paths:
+                continue
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                responses = list(pool.map(
+                    lambda path: _fetch(base_url.rstrip('/') + path, timeout), paths
+                ))
+            elapsed = time.perf_counter() - start
+            durations = [duration for duration, status in responses]
+            results[target][name] = {
+                'requests': len(responses),
+                'errors': sum(status != 200 for duration, status in responses),
+                'throughput_rps': round(len(responses) / elapsed, 1),
+                'p50_ms': round(percentile(durations, 50) * 1000, 2),
+                'p90_ms': round(percentile(durations, 90) * 1000, 2),
+                'p99_ms': round(percentile(durations, 99) * 1000, 2),
+                'max_ms': round(max(durations) * 1000, 2),
+            }
+            log(f'{target} {name}: {results[target][name]["throughput_rps"]} rps, '
+                f'p99 {results[target][name]["p99_ms"]} мс')
+
+    return {
+        'environment': environment(seed=seed, concurrency=concurrency, targets=targets),
+        'results': results,
+    }
+
+
+CONNECTION_BACKENDS = {
+    'direct': 'django.db.backends.postgresql',
+    'pooled': 'filmblog.backends.postgresql_pool',
+}
+
+
+def run_connection_benchmark(requests=500, concurrency=1, alias='default', log=None):
+    """
+    Замеряет задержку получения соединения с пулом и без него
+
+    Каждый запрос создает обертку соединения, как поток Django, выполняет
+    SELECT 1 и закрывает соединение, как в конце запроса.
+
+    Args:
+        requests (int): Циклов на бэкенд
+        concurrency (int): Параллельных потоков
+        alias (str): База из DATABASES
+        log (callable|None): Функция для вывода прогресса
+
+    Returns:
+        dict: Описание окружения, задержки по бэкендам и метрики пула
+    """
+    log = log or (lambda message: None)
+    settings_dict = connections.settings[alias]
+    results = {}
+    for name, engine in CONNECTION_BACKENDS.items():
+        wrapper_class = load_backend(engine).DatabaseWrapper
+
+        def cycle(index):
+            wrapper = wrapper_class({**settings_dict, 'ENGINE': engine}, alias)
+            start = time.perf_counter()
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                wrapper.close()
+            return time.perf_counter() - start
+
+        # Первое соединение пула открывается до замера
+        cycle(0)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            durations = list(pool.map(cycle, range(requests)))
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'requests': requests,
+            'throughput_rps': round(requests / elapsed, 1),
+            'p50_ms': round(percentile(durations, 50) * 1000, 3),
+            'p90_ms': round(percentile(durations, 90) * 1000, 3),
+            'p99_ms': round(percentile(durations, 99) * 1000, 3),
+            'max_ms': round(max(durations) * 1000, 3),
+        }
+        log(f'{name}: p50 {results[name]["p50_ms"]} мс, p99 {results[name]["p99_ms"]} мс')
+
+    return {
+        'environment': environment(requests=requests, concurrency=concurrency),
+        'results': results,
+        'pools': db_pool.all_stats(),
+    }
+
+
+def environment(**extra):
+    """Сведения об окружении для сравнения результатов между коммитами"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return dict({
+        'commit': commit,
+        'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'posts': Post.objects.count(),
+        'published_posts': Post.published.count(),
+    }, **extra)
@@ -0,0 +1,110 @@
+"""
+Валидаторы условных запросов (ETag и Last-Modified) для публичных страниц
+
+Страницы списков, поиска и постов не зависят от пользователя и меняются
+только вместе с постами и тегами. Поэтому валидатор всех таких страниц -
+одна версия содержимого: время последнего изменения поста или тега.
+Она хранится в кэше фрагментов и обновляется сигналами, поэтому ответ 304
+для списков не требует запросов к базе.
+
+Для страницы поста к версии добавляется время изменения самого поста;
+найденный пост сохраняется в request и повторно не запрашивается.
+Асинхронные представления находят пост заранее через aget_post(),
+после чего валидаторы не обращаются к базе и годятся для async-кода.
+Валидаторы считаются до вызова представления, и ответ 304 отдается
+без рендеринга шаблонов (см. django.views.decorators.http.condition).
+"""
+from django.http import Http404
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .fragments import get_fragment_cache
+from .models import Post
+
+
+VERSION_KEY = 'filmblog:content_version'
+
+
+def content_version():
+    """
+    Время последнего изменения постов или тегов
+
+    Если версии нет в кэше (кэш очищен), ею становится текущее время:
+    удаление поста по таблицам не восстановить, а лишний ответ 200
+    лучше, чем устаревший ответ 304.
+
+    Returns:
+        datetime: Версия содержимого
+    """
+    cache = get_fragment_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, timezone.now(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump():
+    """Отмечает изменение содержимого публичных страниц"""
+    get_fragment_cache().set(VERSION_KEY, timezone.now(), timeout=None)
+
+
+def _version_tag(version):
+    return f'{version.timestamp():.6f}'
+
+
+def list_etag(request, *args, **kwargs):
+    return f'list-{_version_tag(content_version())}'
+
+
+def list_last_modified(request, *args, **kwargs):
+    return content_version()
+
+
+def get_post(request, year, month, day, post):
+    """
+    Опубликованный пост по параметрам URL страницы поста
+
+    Результат запоминается в request, его использует PostDetailView.get_object.
+
+    Raises:
+        Http404: Если поста нет
+    """
+    if not hasattr(request, 'filmblog_post'):
+        try:
+            queryset = Post.published.published_on(year, month, day)
+        except ValueError:
+            raise Http404('Неверная дата')
+        # Исходное тело не выводится, страница показывает body_html;
+        # метаданные снимка выводятся рядом с датой
+        request.filmblog_post = queryset.filter(slug=post) \
+            .select_related('metadata').defer('body').first()
+    if request.filmblog_post is None:
+        raise Http404('Пост не найден')
+    return request.filmblog_post
+
+
+async def aget_post(request, year, month, day, post):
+    """Асинхронный вариант get_post() на асинхронном ORM"""
+    if not hasattr(request, 'filmblog_post'):
+        try:
+            queryset = Post.published.published_on(year, month, day)
+        except ValueError:
+            raise Http404('Неверная дата')
+        request.filmblog_post = await queryset.filter(slug=post) \
+            .select_related('metadata').defer('body').afirst()
+    return get_post(request, year, month, day, post)
+
+
+def post_etag(request, *args, **kwargs):
+    post = get_post(request, *args, **kwargs)
+    return f'post-{post.pk}-{_version_tag(post.updated)}-{_version_tag(content_version())}'
+
+
+def post_last_modified(request, *args, **kwargs):
+    post = get_post(request, *args, **kwargs)
+    return max(post.updated, content_version())
+
+
+list_condition = condition(etag_func=list_etag, last_modified_func=list_last_modified)
+post_condition = condition(etag_func=post_etag, last_modified_func=post_last_modified)
@@ -0,0 +1,199 @@
+"""
+Скачивание исходных сканов
+
+Права на скачивание проверяет Django (PostDownloadView), а байты файла
+отдает не он. При FILMBLOG_SENDFILE = 'nginx' ответ содержит только
+заголовок X-Accel-Redirect с путем файла во внутреннем location
+FILMBLOG_SENDFILE_URL (см. config/nginx_static.conf), при 'xsendfile' -
+X-Sendfile с путем на диске (Apache mod_xsendfile, lighttpd). Диапазоны,
+докачку и условные запросы тогда обслуживает веб-сервер.
+
+Без них файл отдается FileResponse с поддержкой Range и If-Range.
+Файл не читается в память: gunicorn передает его через wsgi.file_wrapper
+системным вызовом sendfile, начиная с текущей позиции файла и не дальше
+Content-Length, поэтому для диапазона файл просто сдвигается на его начало.
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .storage import digest_from_name
+
+
+SENDFILE_BACKENDS = ('nginx', 'xsendfile')
+
+# Размер блока, если файл все же передается чтением (runserver, ASGI)
+BLOCK_SIZE = 256 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sendfile_backend():
+    """
+    Способ передачи файла веб-сервером
+
+    Returns:
+        str|None: 'nginx', 'xsendfile' или None - файл отдает Django
+    """
+    backend = getattr(settings, 'FILMBLOG_SENDFILE', None)
+    if backend is not None and backend not in SENDFILE_BACKENDS:
+        raise ValueError(f'Неизвестный FILMBLOG_SENDFILE: {backend}')
+    return backend
+
+
+def parse_range(header, size):
+    """
+    Диапазон байтов из заголовка Range
+
+    Поддерживается один диапазон; для нескольких диапазонов и неверного
+    заголовка отдается весь файл, как разрешает RFC 9110.
+
+    Args:
+        header (str): Значение заголовка Range
+        size (int): Размер файла
+
+    Returns:
+        tuple|None: (начало, конец включительно) или None - отдать весь файл
+
+    Raises:
+        ValueError: Если диапазон целиком за концом файла (ответ 416)
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-500: последние 500 байтов
+        length = int(end)
+        if length == 0:
+            raise ValueError('Пустой диапазон')
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise ValueError('Диапазон за концом файла')
+    if end < start:
+        return None
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    Выполняется ли условие If-Range
+
+    Валидатор должен совпасть точно: ETag сравнивается строго,
+    дата - с Last-Modified файла.
+    """
+    condition = request.headers.get('If-Range')
+    if not condition:
+        return True
+    condition = condition.strip()
+    if condition.startswith(('"', 'W/')):
+        return not condition.startswith('W/') and condition == etag
+    return parse_http_date_safe(condition) == int(last_modified)
+
+
+class FileRange:
+    """
+    Часть открытого файла для FileResponse
+
+    read() не заходит за конец диапазона. fileno() отдает дескриптор
+    файла, уже сдвинутого на начало диапазона: sendfile в gunicorn
+    начинает с текущей позиции и передает Content-Length байтов.
+    """
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.remaining = end - start + 1
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _sendfile_response(storage, name, backend):
+    response = HttpResponse()
+    if backend == 'nginx':
+        location = getattr(settings, 'FILMBLOG_SENDFILE_URL', '/protected-images/')
+        response['X-Accel-Redirect'] = location + quote(name)
+    else:
+        response['X-Sendfile'] = storage.path(name)
+    # Тип файла определит веб-сервер
+    del response['Content-Type']
+    return response
+
+
+def _file_response(request, storage, name, etag, last_modified):
+    size = storage.size(name)
+    file = storage.open(name, 'rb')
+    status, start, end = 200, 0, size - 1
+    header = request.headers.get('Range')
+    if header and size and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            status, (start, end) = 206, byte_range
+    response = FileResponse(FileRange(file, start, end), status=status,
+                            content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    response.block_size = BLOCK_SIZE
+    response['Content-Length'] = end - start + 1 if size else 0
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def download_response(request, storage, name, filename):
+    """
+    Ответ со скачиваемым файлом хранилища
+
+    Args:
+        request (HttpRequest): Запрос
+        storage (Storage): Хранилище файла
+        name (str): Имя файла в хранилище
+        filename (str): Имя файла для сохранения у пользователя
+
+    Returns:
+        HttpResponse: Ответ веб-сервера (X-Accel-Redirect, X-Sendfile),
+                      FileResponse с файлом или его диапазоном или 304
+
+    Raises:
+        OSError: Если файла нет в хранилище
+    """
+    backend = sendfile_backend()
+    if backend is not None:
+        response = _sendfile_response(storage, name, backend)
+    else:
+        last_modified = storage.get_modified_time(name).timestamp()
+        # Имя файла в хранилище - хэш содержимого (см. filmblog.storage)
+        digest = digest_from_name(name)
+        etag = quote_etag(digest) if digest else None
+        response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+        if response is not None:
+            return response
+        response = _file_response(request, storage, name, etag, last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response['ETag'] = etag
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
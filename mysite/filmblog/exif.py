@@ -0,0 +1,138 @@
+"""
+Метаданные снимка из EXIF
+
+Камера - Make и Model, объектив - LensModel, ISO - ISOSpeedRatings,
+дата скана - DateTimeDigitized или DateTime (сканер пишет их при
+оцифровке). Пленки в EXIF нет: ее берут из описания или комментария
+снимка в виде "Film: Portra 400", а иначе ищут там известные названия
+пленок из FILM_STOCKS. Pillow читает только заголовок файла,
+изображение не декодируется.
+"""
+import re
+from datetime import datetime
+
+from PIL import ExifTags, Image
+from django.utils import timezone
+
+
+FILM_STOCKS = (
+    'Portra 160', 'Portra 400', 'Portra 800', 'Ektar 100', 'Gold 200', 'UltraMax 400',
+    'ColorPlus 200', 'ProImage 100', 'Ektachrome E100', 'Tri-X 400', 'T-Max 100', 'T-Max 400',
+    'T-Max 3200', 'HP5 Plus', 'FP4 Plus', 'Delta 100', 'Delta 400', 'Delta 3200', 'XP2 Super',
+    'Pan F Plus', 'Kentmere 100', 'Kentmere 400', 'Superia 400', 'Superia X-TRA 400', 'C200',
+    'Pro 400H', 'Velvia 50', 'Velvia 100', 'Provia 100F', 'Acros 100', 'CineStill 800T',
+    'CineStill 50D', 'CineStill 400D', 'Fomapan 100', 'Fomapan 200', 'Fomapan 400',
+    'Lomography 400', 'Svema 64', 'Svema 125', 'Tasma 64',
+)
+# Краткие названия, которые пишут вместо полных
+FILM_ALIASES = {'HP5': 'HP5 Plus', 'FP4': 'FP4 Plus', 'Tri-X': 'Tri-X 400', 'Ektar': 'Ektar 100'}
+
+MAX_VALUE_LENGTH = 100
+
+_FILM_LABEL = re.compile(r'(?:film|пленка|плёнка)\s*[:=]\s*([^;\n\r]+)', re.IGNORECASE)
+# Длинные названия раньше коротких: "Superia X-TRA 400" раньше "Superia 400"
+_FILM_STOCK = re.compile(
+    r'\b(' + '|'.join(
+        r'[\s-]?'.join(re.escape(part) for part in re.split(r'[\s-]', stock))
+        for stock in sorted([*FILM_STOCKS, *FILM_ALIASES], key=len, reverse=True)
+    ) + r')\b',
+    re.IGNORECASE,
+)
+_STOCK_BY_KEY = {re.sub(r'[\s-]', '', name).lower(): FILM_ALIASES.get(name, name)
+                 for name in [*FILM_STOCKS, *FILM_ALIASES]}
+
+# Префиксы кодировки UserComment
+_COMMENT_CODES = {b'ASCII\x00\x00\x00': 'ascii', b'UNICODE\x00': 'utf-16',
+                  b'JIS\x00\x00\x00\x00\x00': 'shift_jis'}
+
+
+def _clean(value):
+    """Текстовое значение тега без нулевых байтов и лишних пробелов"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    return ' '.join(str(value).replace('\x00', ' ').split())[:MAX_VALUE_LENGTH]
+
+
+def _decode_comment(value):
+    if not isinstance(value, bytes):
+        return _clean(value)
+    code, text = value[:8], value[8:]
+    return _clean(text.decode(_COMMENT_CODES.get(code, 'utf-8'), 'replace'))
+
+
+def _parse_datetime(value):
+    try:
+        parsed = datetime.strptime(_clean(value)[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+    return timezone.make_aware(parsed)
+
+
+def camera_name(make, model):
+    """
+    Название камеры из производителя и модели
+
+    Производитель не дублируется, если модель уже с него начинается
+    ("NIKON CORPORATION", "NIKON F3" -> "NIKON F3").
+    """
+    make, model = _clean(make), _clean(model)
+    if not make or model.lower().startswith(make.split()[0].lower()):
+        return model
+    return f'{make} {model}'.strip()
+
+
+def film_stock(*texts):
+    """
+    Пленка из описания снимка
+
+    Returns:
+        str: Явно указанная (Film: ...) или известная пленка, иначе ''
+    """
+    for text in texts:
+        match = _FILM_LABEL.search(text or '')
+        if match:
+            return _clean(match.group(1))
+    for text in texts:
+        match = _FILM_STOCK.search(text or '')
+        if match:
+            return _STOCK_BY_KEY.get(re.sub(r'[\s-]', '', match.group(1)).lower(), match.group(1))
+    return ''
+
+
+def read_metadata(file):
+    """
+    Извлекает метаданные из изображения
+
+    Args:
+        file: Путь или файловый объект изображения
+
+    Returns:
+        dict: camera, lens, film, iso (int|None), scanned (datetime|None)
+
+    Raises:
+        OSError: Если файл не читается как изображение
+    """
+    with Image.open(file) as image:
+        exif = image.getexif()
+        details = exif.get_ifd(ExifTags.IFD.Exif)
+    tags = ExifTags.Base
+    iso = details.get(tags.ISOSpeedRatings) or details.get(tags.ISOSpeed)
+    if isinstance(iso, (tuple, list)):
+        iso = iso[0] if iso else None
+    try:
+        iso = int(iso) if iso else None
+    except (TypeError, ValueError):
+        iso = None
+    description = _clean(exif.get(tags.ImageDescription, ''))
+    comment = _decode_comment(details.get(tags.UserComment, b''))
+    xp_comment = exif.get(tags.XPComment, b'')
+    if isinstance(xp_comment, bytes):
+        xp_comment = _clean(xp_comment.decode('utf-16-le', 'replace'))
+    return {
+        'camera': camera_name(exif.get(tags.Make, ''), exif.get(tags.Model, '')),
+        'lens': _clean(details.get(tags.LensModel, '')),
+        'film': film_stock(description, comment, xp_comment),
+        'iso': iso,
+        'scanned': _parse_datetime(details.get(tags.DateTimeDigitized)
+                                   or exif.get(tags.DateTime) or ''),
+    }
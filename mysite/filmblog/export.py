@@ -0,0 +1,239 @@
+"""
+Статическая копия публичных страниц
+
+Страницы постов, первые страницы общего списка и списков тегов
+рендерятся в файлы в каталоге FILMBLOG_STATIC_EXPORT_ROOT, рядом
+кладутся сжатые варианты .gz и .br (если установлен пакет brotli).
+Фронтовый веб-сервер отдает их сам и передает gunicorn только
+остальные запросы (см. config/nginx_static.conf).
+
+Каждая страница - строка StaticPage. Сигналы отмечают устаревшими
+только затронутые страницы: страницу поста, его соседей и списки,
+где есть его карточка; задача static_export перерисовывает их.
+Страница, которая стала отдавать 404, удаляется вместе с файлами.
+Если изменилось меню популярных тегов, которое есть на всех страницах,
+устаревшими отмечаются все страницы.
+
+Полная выгрузка: manage.py export_site --full.
+"""
+import gzip
+import json
+import os
+import tempfile
+from collections import namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import F, Q
+from django.http import Http404
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from .models import Post, StaticPage, TagStats
+from .navigation import neighbors
+from .pagination import KeysetPaginationMixin
+from .templatetags.filmblog_tags import tag_menu
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+BATCH_SIZE = 200
+MENU_FILE = '.tag-menu.json'
+
+ExportResult = namedtuple('ExportResult', 'written removed')
+
+
+def export_root():
+    return getattr(settings, 'FILMBLOG_STATIC_EXPORT_ROOT', None)
+
+
+def enabled():
+    return bool(export_root())
+
+
+def list_paths(tag_slug=None):
+    """Адреса страниц списка, доступных по номеру"""
+    url = reverse('filmblog:post_list_by_tag', args=[tag_slug]) if tag_slug \
+        else reverse('filmblog:index')
+    return [url] + [f'{url}?page={number}'
+                    for number in range(2, KeysetPaginationMixin.keyset_numbered_pages + 1)]
+
+
+def post_paths(post, publish_dates=(), urls=(), tag_slugs=None):
+    """
+    Страницы, на которые влияет изменение поста
+
+    Args:
+        post (Post): Пост
+        publish_dates (iterable): Даты публикации, у которых надо обновить соседей
+        urls (iterable): Прежние адреса страницы поста
+        tag_slugs (iterable|None): Слаги тегов поста или None, чтобы прочитать их из базы
+
+    Returns:
+        set: Адреса страниц
+    """
+    paths = set(urls)
+    if post.status == 'published':
+        paths.add(post.get_absolute_url())
+    for publish in publish_dates:
+        paths.update(Post(**values).get_absolute_url()
+                     for values in neighbors(publish, post.pk) if values)
+    if tag_slugs is None:
+        tag_slugs = post.tags.values_list('slug', flat=True)
+    for tag_slug in [None, *tag_slugs]:
+        paths.update(list_paths(tag_slug))
+    return paths
+
+
+def all_paths():
+    """Адреса всех публичных страниц копии"""
+    yield from list_paths()
+    for tag_slug in TagStats.objects.filter(published_posts__gt=0) \
+            .values_list('slug', flat=True).iterator():
+        yield from list_paths(tag_slug)
+    for values in Post.published.values('pk', 'slug', 'publish').iterator():
+        yield Post(**values).get_absolute_url()
+
+
+def mark_stale(paths):
+    """
+    Отмечает страницы устаревшими
+
+    Returns:
+        int: Количество отмеченных страниц
+    """
+    now = timezone.now()
+    pages = [StaticPage(path=path, marked=now) for path in set(paths)]
+    StaticPage.objects.bulk_create(pages, batch_size=BATCH_SIZE, update_conflicts=True,
+                                   unique_fields=['path'], update_fields=['marked'])
+    return len(pages)
+
+
+def mark_all():
+    """Отмечает устаревшими все страницы копии, включая уже удаленные с сайта"""
+    StaticPage.objects.update(marked=timezone.now())
+    return mark_stale(all_paths())
+
+
+def file_path(path):
+    """
+    Файл страницы в каталоге копии
+
+    Первая страница списка - index.html, страница N - page-N.html.
+    """
+    url = urlsplit(path)
+    page = parse_qs(url.query).get('page', ['1'])[0]
+    name = 'index.html' if page == '1' else f'page-{page}.html'
+    return os.path.join(export_root(), url.path.strip('/'), name)
+
+
+def render(path):
+    """
+    Рендерит страницу так, как ее видит анонимный посетитель
+
+    Returns:
+        bytes|None: HTML страницы или None, если страницы нет
+    """
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    try:
+        match = resolve(request.path_info)
+        view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+        response = view(request, *match.args, **match.kwargs)
+    except (Resolver404, Http404):
+        return None
+    if hasattr(response, 'render'):
+        response.render()
+    return response.content if response.status_code == 200 else None
+
+
+def _write_atomic(name, data):
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(name), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.chmod(temp_name, 0o644)
+    os.replace(temp_name, name)
+
+
+def write(path, content):
+    """Записывает страницу и ее сжатые варианты"""
+    name = file_path(path)
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    # Сжатые варианты раньше основного файла: по нему сервер решает, есть ли страница
+    _write_atomic(name + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write_atomic(name + '.br', brotli.compress(content))
+    _write_atomic(name, content)
+
+
+def remove(path):
+    """Удаляет файлы страницы"""
+    name = file_path(path)
+    for variant in (name, name + '.gz', name + '.br'):
+        if os.path.exists(variant):
+            os.remove(variant)
+    try:
+        os.rmdir(os.path.dirname(name))
+    except OSError:
+        pass
+
+
+def _menu_changed():
+    """Сравнивает меню популярных тегов с меню последней выгрузки и запоминает новое"""
+    menu = [[tag.name, tag.slug] for tag in tag_menu()['tags']]
+    name = os.path.join(export_root(), MENU_FILE)
+    try:
+        with open(name) as file:
+            if json.load(file) == menu:
+                return False
+    except (OSError, ValueError):
+        pass
+    os.makedirs(export_root(), exist_ok=True)
+    _write_atomic(name, json.dumps(menu).encode())
+    return True
+
+
+def build_stale(log=None):
+    """
+    Перерисовывает устаревшие страницы
+
+    Страницу, отмеченную заново во время рендеринга, следующая пачка
+    перерисует еще раз.
+
+    Returns:
+        ExportResult: Количество записанных и удаленных страниц
+    """
+    log = log or (lambda message: None)
+    if brotli is None:
+        log('Пакет brotli не установлен (requirements.txt): пишутся только .gz')
+    if _menu_changed():
+        StaticPage.objects.update(marked=timezone.now())
+    written = removed = 0
+    stale = Q(rendered__isnull=True) | Q(rendered__lt=F('marked'))
+    while True:
+        started = timezone.now()
+        paths = list(StaticPage.objects.filter(stale, marked__lte=started)
+                     .order_by('path').values_list('path', flat=True)[:BATCH_SIZE])
+        if not paths:
+            break
+        rendered, missing = [], []
+        for path in paths:
+            content = render(path)
+            if content is None:
+                remove(path)
+                missing.append(path)
+            else:
+                write(path, content)
+                rendered.append(path)
+        StaticPage.objects.filter(path__in=rendered, marked__lte=started).update(rendered=started)
+        StaticPage.objects.filter(path__in=missing, marked__lte=started).delete()
+        written += len(rendered)
+        removed += len(missing)
+        log(f'Записано страниц: {written}, удалено: {removed}')
+    return ExportResult(written, removed)
@@ -0,0 +1,248 @@
+"""
+Фасеты снимков: камера, объектив, пленка и ISO
+
+Метаданные основного изображения поста (filmblog.exif) извлекаются
+задачей renditions вместе с уменьшенными копиями и хранятся в PhotoMetadata
+с индексами по полям фасетов.
+
+FacetCount хранит число опубликованных постов для каждого значения
+фасета. Как и статистика тегов (filmblog.tags), она пересчитывается
+только для затронутых значений: при изменении метаданных поста,
+публикации, снятии с публикации и удалении. Список фасетов со счетчиками
+читается одним запросом и хранится в кэше фрагментов до следующего
+пересчета, поэтому просмотр по "Portra 400" не требует GROUP BY
+по всему архиву.
+
+Полный пересчет и извлечение метаданных уже загруженных постов:
+manage.py extract_metadata.
+"""
+import hashlib
+import logging
+from collections import defaultdict, namedtuple
+
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.text import slugify
+
+from . import exif
+from .fragments import get_fragment_cache
+from .models import FacetCount, PhotoMetadata, Post
+from .storage import content_storage
+
+logger = logging.getLogger(__name__)
+
+FACETS = ('camera', 'lens', 'film', 'iso')
+FACET_LABELS = dict(FacetCount.FACET_CHOICES)
+# Сколько самых частых значений каждого фасета показывать в списке
+FACET_LIMIT = 20
+INDEX_KEY = 'filmblog:facets'
+
+FacetInfo = namedtuple('FacetInfo', 'facet value slug published_posts')
+
+
+def metadata_pairs(values):
+    """
+    Значения фасетов из метаданных
+
+    Args:
+        values (dict|PhotoMetadata|None): Метаданные снимка
+
+    Returns:
+        set: Пары (фасет, значение строкой) непустых значений
+    """
+    if values is None:
+        return set()
+    if not isinstance(values, dict):
+        values = {facet: getattr(values, facet) for facet in FACETS}
+    return {(facet, str(values[facet])) for facet in FACETS if values.get(facet) not in ('', None)}
+
+
+def post_pairs(post_ids):
+    """Значения фасетов постов по их метаданным в базе"""
+    pairs = set()
+    for values in PhotoMetadata.objects.filter(post_id__in=post_ids).values(*FACETS):
+        pairs |= metadata_pairs(values)
+    return pairs
+
+
+def update_metadata(post, force=False):
+    """
+    Извлекает метаданные основного изображения поста
+
+    Изображение, из которого метаданные уже извлечены, повторно не читается.
+
+    Args:
+        post (Post): Пост
+        force (bool): Перечитать метаданные, даже если изображение не менялось
+
+    Returns:
+        set|None: Затронутые значения фасетов или None, если метаданные не изменились
+    """
+    name = post.image.name or ''
+    current = PhotoMetadata.objects.filter(post=post).first()
+    if current is not None and current.source == name and not force:
+        return None
+    values = {'camera': '', 'lens': '', 'film': '', 'iso': None, 'scanned': None}
+    if name:
+        try:
+            with content_storage.open(name) as file:
+                values = exif.read_metadata(file)
+        except (OSError, SyntaxError, ValueError) as e:
+            logger.warning('Не удалось прочитать метаданные %s: %s', name, e)
+    before = metadata_pairs(current)
+    if current is not None and all(getattr(current, key) == value for key, value in values.items()) \
+            and current.source == name:
+        return None
+    PhotoMetadata.objects.update_or_create(post=post, defaults={**values, 'source': name})
+    return before | metadata_pairs(values)
+
+
+def _slug(value):
+    return slugify(value) or f'v-{hashlib.md5(value.encode()).hexdigest()[:8]}'
+
+
+def refresh(pairs):
+    """
+    Пересчитывает число опубликованных постов для значений фасетов
+
+    Args:
+        pairs (iterable): Пары (фасет, значение)
+    """
+    by_facet = defaultdict(set)
+    for facet, value in pairs:
+        by_facet[facet].add(str(value))
+    if not by_facet:
+        return
+    rows = []
+    for facet, values in by_facet.items():
+        field = f'metadata__{facet}'
+        lookup = [int(value) for value in values] if facet == 'iso' else list(values)
+        counts = {
+            str(row[field]): row
+            for row in Post.published.filter(**{f'{field}__in': lookup}).values(field)
+            .annotate(published_posts=Count('pk'), latest_publish=Max('publish')).order_by()
+        }
+        existing = dict(FacetCount.objects.filter(facet=facet, value__in=values)
+                        .values_list('value', 'slug'))
+        taken = set(FacetCount.objects.filter(facet=facet).exclude(value__in=values)
+                    .values_list('slug', flat=True)) | set(existing.values())
+        for value in sorted(values):
+            slug = existing.get(value)
+            if slug is None:
+                slug = _slug(value)
+                if slug in taken:
+                    slug = f'{slug}-{hashlib.md5(value.encode()).hexdigest()[:8]}'
+                taken.add(slug)
+            row = counts.get(value, {})
+            rows.append(FacetCount(facet=facet, value=value, slug=slug,
+                                   published_posts=row.get('published_posts', 0),
+                                   latest_publish=row.get('latest_publish')))
+    FacetCount.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['facet', 'value'],
+        update_fields=['published_posts', 'latest_publish', 'updated'],
+    )
+    get_fragment_cache().delete(INDEX_KEY)
+
+
+def recount():
+    """
+    Пересчитывает все значения фасетов
+
+    Returns:
+        int: Количество значений
+    """
+    pairs = set()
+    for facet in FACETS:
+        values = PhotoMetadata.objects.exclude(**{facet: '' if facet != 'iso' else None}) \
+            .values_list(facet, flat=True).distinct()
+        pairs.update((facet, str(value)) for value in values if value is not None)
+    pairs.update(FacetCount.objects.values_list('facet', 'value'))
+    refresh(pairs)
+    return len(pairs)
+
+
+def facet_index():
+    """
+    Значения фасетов с опубликованными постами
+
+    Returns:
+        dict: Фасет -> список FacetInfo по убыванию числа постов
+    """
+    cache = get_fragment_cache()
+    index = cache.get(INDEX_KEY)
+    if index is None:
+        index = {facet: [] for facet in FACETS}
+        rows = FacetCount.objects.filter(published_posts__gt=0) \
+            .values_list('facet', 'value', 'slug', 'published_posts')
+        for row in rows:
+            index[row[0]].append(FacetInfo(*row))
+        cache.set(INDEX_KEY, index, timeout=None)
+    return index
+
+
+def find(facet, slug):
+    """
+    Значение фасета по слагу
+
+    Returns:
+        FacetInfo|None: Значение или None, если постов с ним нет
+    """
+    return next((info for info in facet_index().get(facet, []) if info.slug == slug), None)
+
+
+def facet_query(selected):
+    """
+    Query string фильтра по выбранным значениям
+
+    Args:
+        selected (dict): Фасет -> FacetInfo
+    """
+    return urlencode({facet: selected[facet].slug for facet in FACETS if facet in selected})
+
+
+def facet_groups(selected, limit=FACET_LIMIT):
+    """
+    Фасеты для списка фильтров
+
+    Ссылка значения добавляет его к выбранным (заменяя значение того же
+    фасета), а ссылка выбранного значения снимает его.
+
+    Args:
+        selected (dict): Фасет -> выбранное значение FacetInfo
+        limit (int): Сколько значений фасета показывать
+
+    Returns:
+        list: Словари facet, label и values (info, selected, query)
+    """
+    groups = []
+    for facet, infos in facet_index().items():
+        values = []
+        for info in infos[:limit]:
+            is_selected = selected.get(facet) == info
+            others = {key: value for key, value in selected.items() if key != facet}
+            query = facet_query(others if is_selected else {**others, facet: info})
+            values.append({'info': info, 'selected': is_selected, 'query': query})
+        if values:
+            groups.append({'facet': facet, 'label': FACET_LABELS[facet], 'values': values})
+    return groups
+
+
+def describe(post):
+    """
+    Метаданные снимка для страницы поста
+
+    Returns:
+        list: Словари label, value и url (ссылка на посты с этим значением или '')
+    """
+    try:
+        metadata = post.metadata
+    except PhotoMetadata.DoesNotExist:
+        return []
+    index = facet_index()
+    items = []
+    for facet, value in sorted(metadata_pairs(metadata), key=lambda pair: FACETS.index(pair[0])):
+        info = next((info for info in index[facet] if info.value == value), None)
+        url = f"{reverse('filmblog:photo_facets')}?{facet_query({facet: info})}" if info else ''
+        items.append({'label': FACET_LABELS[facet], 'value': value, 'url': url})
+    return items
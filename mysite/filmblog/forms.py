@@ -1,14 +1,22 @@
 from django import forms
-from .models import Post
+from .models import ChunkedUpload, Post
 
 class PostForm(forms.ModelForm):
+    # id возобновляемых загрузок, которыми можно заменить файлы из формы
+    image_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    image_preview_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Post
         fields = ['title', 'body', 'image', 'image_preview', 'preview', 'status', 'tags']
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        self.upload_errors = kwargs.pop('upload_errors', None) or {}
+        self.chunked_uploads = []
         super().__init__(*args, **kwargs)
+        for field_name in ('image', 'image_preview'):
+            self.fields[field_name].widget.attrs['data-chunked-upload'] = f'{field_name}_upload'
 
     def clean_title(self):
         title = self.cleaned_data['title']
@@ -17,4 +25,39 @@ class PostForm(forms.ModelForm):
             author=self.user
         ).exists():
             raise forms.ValidationError('У вас уже есть пост с таким заголовком')
-        return title
\ No newline at end of file
+        return title
+
+    def clean(self):
+        """
+        Добавляет ошибки потоковой загрузки и подставляет файлы
+        завершенных загрузок частями
+
+        Файл загрузки частями проверяется полем формы, как и файл из
+        запроса: Pillow должен открыть его как изображение.
+        """
+        cleaned_data = super().clean()
+        for field_name, message in self.upload_errors.items():
+            self.add_error(field_name, message)
+
+        for field_name in ('image', 'image_preview'):
+            upload_id = cleaned_data.get(f'{field_name}_upload')
+            if not upload_id:
+                continue
+            upload = ChunkedUpload.objects.filter(pk=upload_id, user=self.user).first()
+            if upload is None or not upload.completed:
+                self.add_error(field_name, 'Загрузка файла не завершена')
+                continue
+            try:
+                cleaned_data[field_name] = self.fields[field_name].clean(upload.as_uploaded_file())
+            except forms.ValidationError as error:
+                self.add_error(field_name, error)
+            else:
+                self.chunked_uploads.append(upload)
+        return cleaned_data
+
+    def save(self, commit=True):
+        post = super().save(commit)
+        if commit:
+            for upload in self.chunked_uploads:
+                upload.delete()
+        return post
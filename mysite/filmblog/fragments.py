@@ -0,0 +1,154 @@
+"""
+Кэш отрендеренных страниц списка постов
+
+Фрагмент (карточки постов и пагинация) хранится по ключу из слага тега
+и номера страницы. При изменении поста вытесняются только страницы,
+на которые он влияет: при правке текста - одна страница, при публикации,
+снятии с публикации, смене даты или удалении - страница поста и все
+последующие, так как на них сдвигаются посты. Кэшируются только первые
+страницы, доступные по номеру (KeysetPaginationMixin.keyset_numbered_pages),
+поэтому правка старого поста не вытесняет ничего.
+
+Там же хранятся общие части страниц из filmblog/base.html (шапка, меню,
+подвал, см. тег shell_fragment): они не зависят от запроса и рендерятся
+один раз на версию деплоя FILMBLOG_DEPLOY_VERSION.
+
+Хранилище задается настройкой FILMBLOG_FRAGMENT_CACHE (алиас из CACHES).
+Для одного сервера подходит LocMemCache - это LRU-кэш в памяти процесса.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import instrumentation
+from .models import Post
+from .pagination import KeysetPaginationMixin
+
+
+POST_LIST_PAGE_SIZE = 8
+ALL_POSTS = '*'
+# Старые варианты меню и фрагменты прошлых деплоев вытесняются со временем
+SHELL_FRAGMENT_TIMEOUT = 24 * 3600
+
+# Без FILMBLOG_DEPLOY_VERSION версией считается запуск процесса
+_PROCESS_VERSION = f'{time.time():.0f}'
+
+
+def get_fragment_cache():
+    return caches[getattr(settings, 'FILMBLOG_FRAGMENT_CACHE', 'default')]
+
+
+def post_list_key(tag_slug, page):
+    """Ключ фрагмента страницы списка постов"""
+    return f'filmblog:post_list:{tag_slug or ALL_POSTS}:{page}'
+
+
+def get_post_list(tag_slug, page):
+    """
+    Возвращает закэшированный фрагмент страницы списка
+
+    Args:
+        tag_slug (str|None): Слаг тега или None для всех постов
+        page (int): Номер страницы
+
+    Returns:
+        str|None: HTML фрагмента или None, если его нет в кэше
+    """
+    html = get_fragment_cache().get(post_list_key(tag_slug, page))
+    instrumentation.count('cache_miss' if html is None else 'cache_hit')
+    return html
+
+
+async def aget_post_list(tag_slug, page):
+    """Асинхронный вариант get_post_list()"""
+    html = await get_fragment_cache().aget(post_list_key(tag_slug, page))
+    instrumentation.count('cache_miss' if html is None else 'cache_hit')
+    return html
+
+
+def set_post_list(tag_slug, page, html):
+    """Сохраняет фрагмент страницы списка"""
+    get_fragment_cache().set(post_list_key(tag_slug, page), html, timeout=None)
+
+
+def deploy_version():
+    return getattr(settings, 'FILMBLOG_DEPLOY_VERSION', None) or _PROCESS_VERSION
+
+
+def shell_key(name, vary_on=()):
+    """
+    Ключ общей части страницы
+
+    Args:
+        name (str): Имя фрагмента (header, nav, footer)
+        vary_on (iterable): Значения, от которых зависит фрагмент
+    """
+    digest = hashlib.md5('|'.join(map(str, vary_on)).encode()).hexdigest()
+    return f'filmblog:shell:{deploy_version()}:{name}:{digest}'
+
+
+def get_shell(name, vary_on=()):
+    return get_fragment_cache().get(shell_key(name, vary_on))
+
+
+def set_shell(name, vary_on, html):
+    get_fragment_cache().set(shell_key(name, vary_on), html, timeout=SHELL_FRAGMENT_TIMEOUT)
+
+
+def _scope_queryset(tag_slug):
+    queryset = Post.published.all()
+    if tag_slug:
+        queryset = queryset.filter(tags__slug=tag_slug)
+    return queryset
+
+
+def cached_pages():
+    """Сколько первых страниц списка кэшируется: дальние открываются по курсору"""
+    return KeysetPaginationMixin.keyset_numbered_pages
+
+
+def page_number(publish, tag_slug=None):
+    """
+    Номер страницы, на которой находится пост с указанной датой публикации
+
+    Более новые посты считаются не дальше кэшируемых страниц, поэтому
+    для старого поста результат - cached_pages() + 1.
+
+    Args:
+        publish (datetime): Дата публикации поста
+        tag_slug (str|None): Слаг тега или None для всех постов
+    """
+    limit = cached_pages() * POST_LIST_PAGE_SIZE
+    newer = _scope_queryset(tag_slug).filter(publish__gt=publish)[:limit].count()
+    return newer // POST_LIST_PAGE_SIZE + 1
+
+
+def evict_page(tag_slug, publish):
+    """Вытесняет страницу, на которой находится пост"""
+    page = page_number(publish, tag_slug)
+    if page <= cached_pages():
+        get_fragment_cache().delete(post_list_key(tag_slug, page))
+
+
+def evict_post(post):
+    """Вытесняет страницы с карточкой поста в общем списке и списках его тегов"""
+    if post.status != 'published':
+        return
+    for tag_slug in [None, *post.tags.values_list('slug', flat=True)]:
+        evict_page(tag_slug, post.publish)
+
+
+def evict_pages_from(tag_slug, *publish_dates):
+    """
+    Вытесняет страницу самого нового из постов и все последующие
+
+    Args:
+        tag_slug (str|None): Слаг тега или None для всех постов
+        *publish_dates (datetime): Даты публикации затронутых постов
+    """
+    first_page = min(page_number(publish, tag_slug) for publish in publish_dates)
+    get_fragment_cache().delete_many([
+        post_list_key(tag_slug, page) for page in range(first_page, cached_pages() + 1)
+    ])
@@ -0,0 +1,156 @@
+"""
+Уменьшенные копии (рендишены) изображений постов
+
+Для Post.image и Post.image_preview создаются копии шириной 400/800/1600 px
+в WebP и JPEG. Они сохраняются в хранилище медиафайлов под хэшем исходника
+и записываются в Post.renditions, поэтому шаблонам не нужны лишние запросы.
+Копии пересоздаются только при изменении хэша исходного файла.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import BODY_FIELDS
+
+
+RENDITION_FIELDS = ('image', 'image_preview')
+RENDITION_WIDTHS = (400, 800, 1600)
+RENDITION_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(field_file):
+    """
+    Считает SHA-256 файла, читая его по частям
+
+    Args:
+        field_file (FieldFile): Файл поля модели
+
+    Returns:
+        str: Хэш в шестнадцатеричном виде
+    """
+    digest = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rendition_name(source_hash, width, extension):
+    return f'renditions/{source_hash[:2]}/{source_hash}/{width}.{extension}'
+
+
+def target_widths(original_width):
+    """Ширины копий без увеличения исходника"""
+    widths = [width for width in RENDITION_WIDTHS if width < original_width]
+    return widths or [original_width]
+
+
+def generate_renditions(field_file, source_hash):
+    """
+    Создает копии изображения во всех размерах и форматах
+
+    Уже существующие в хранилище копии с тем же хэшем не пересоздаются.
+
+    Args:
+        field_file (FieldFile): Исходное изображение
+        source_hash (str): Хэш исходного файла
+
+    Returns:
+        dict: Описание копий для Post.renditions
+    """
+    storage = default_storage
+    with field_file.open('rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    sources = {extension: [] for extension in RENDITION_FORMATS}
+    for width in target_widths(image.width):
+        resized = None
+        for extension, options in RENDITION_FORMATS.items():
+            name = rendition_name(source_hash, width, extension)
+            if not storage.exists(name):
+                if resized is None:
+                    height = round(image.height * width / image.width)
+                    resized = image.resize((width, height), Image.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, **options)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            sources[extension].append([width, name])
+
+    return {
+        'name': field_file.name,
+        'hash': source_hash,
+        'width': image.width,
+        'height': image.height,
+        'sources': sources,
+    }
+
+
+def renditions_outdated(post):
+    """
+    Проверяет без чтения файлов, сменились ли исходные изображения поста
+
+    Returns:
+        bool: True, если имя файла какого-либо поля не совпадает с записанным
+    """
+    renditions = post.renditions or {}
+    for field_name in RENDITION_FIELDS:
+        field_file = getattr(post, field_name)
+        recorded = renditions.get(field_name)
+        if (field_file.name or None) != (recorded['name'] if recorded else None):
+            return True
+    return False
+
+
+def update_renditions(post):
+    """
+    Обновляет копии изображений поста, если исходники изменились
+
+    Хэш пересчитывается только при смене имени файла, а копии создаются
+    только при смене хэша.
+
+    Args:
+        post (Post): Пост
+
+    Returns:
+        bool: True, если Post.renditions изменились
+    """
+    renditions = dict(post.renditions or {})
+    for field_name in RENDITION_FIELDS:
+        field_file = getattr(post, field_name)
+        current = renditions.get(field_name)
+        if not field_file:
+            renditions.pop(field_name, None)
+            continue
+        if current and current['name'] == field_file.name:
+            continue
+        # Превью часто тот же файл, что и изображение поста
+        same_file = [rendition for rendition in renditions.values()
+                     if rendition['name'] == field_file.name]
+        if same_file:
+            renditions[field_name] = same_file[0]
+            continue
+        source_hash = file_hash(field_file)
+        if current and current['hash'] == source_hash:
+            renditions[field_name] = dict(current, name=field_file.name)
+        else:
+            renditions[field_name] = generate_renditions(field_file, source_hash)
+
+    if renditions == (post.renditions or {}):
+        return False
+    post.renditions = renditions
+    # Изображения поста в тексте выводятся с копиями
+    post.render_body()
+    type(post).objects.filter(pk=post.pk).update(
+        renditions=renditions, **{name: getattr(post, name) for name in BODY_FIELDS}
+    )
+    return True
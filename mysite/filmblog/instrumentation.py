@@ -0,0 +1,278 @@
+"""
+Замер стоимости запросов: SQL, время базы и шаблонов, попадания в кэш
+
+InstrumentationMiddleware собирает для каждого запроса RequestMetrics:
+число SQL-запросов и время в базе (через execute_wrapper всех соединений),
+время рендеринга шаблонов, попадания и промахи кэша фрагментов. Метрики
+отдаются в заголовке Server-Timing, копятся по представлениям в памяти
+процесса и показываются представлением MetricsView.
+
+Код приложения дополняет замер через span() и count(). Представление
+может объявить бюджет атрибутами query_budget и time_budget (мс);
+превышение пишется в лог, а при FILMBLOG_STRICT_BUDGETS вызывает
+QueryBudgetExceeded - так N+1 в шаблонах ловится тестами.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('filmblog_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление превысило объявленный бюджет запросов или времени"""
+
+
+class RequestMetrics:
+    """
+    Метрики одного запроса
+
+    Атрибуты:
+        view_name (str|None): Имя представления из URL (filmblog:index)
+        queries (int): Количество SQL-запросов
+        timings (dict): Суммарное время по разделам (db, template...) в секундах
+        counters (dict): Счетчики событий (cache_hit, cache_miss...)
+        total (float): Полное время обработки запроса в секундах
+    """
+
+    def __init__(self):
+        self.view_name = None
+        self.queries = 0
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.total = 0.0
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing"""
+        entries = [f'db;dur={self.timings["db"] * 1000:.1f};desc="{self.queries} queries"']
+        for name, duration in self.timings.items():
+            if name != 'db':
+                entries.append(f'{name};dur={duration * 1000:.1f}')
+        if self.counters:
+            desc = ' '.join(f'{name}={value}' for name, value in sorted(self.counters.items()))
+            entries.append(f'events;desc="{desc}"')
+        entries.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса"""
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """
+    Добавляет время выполнения блока к разделу name метрик текущего запроса
+
+    Args:
+        name (str): Имя раздела в Server-Timing (например, 'template')
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - start
+
+
+def count(name, value=1):
+    """Увеличивает счетчик события в метриках текущего запроса"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.counters[name] += value
+
+
+class ViewStats:
+    """
+    Накопленная статистика представлений в памяти процесса
+
+    Для каждого представления хранит число запросов, суммы и максимумы.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, metrics):
+        with self._lock:
+            stats = self._stats.setdefault(metrics.view_name or '-', {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_ms': 0.0, 'total_ms': 0.0, 'max_total_ms': 0.0,
+                'counters': defaultdict(int),
+            })
+            total_ms = metrics.total * 1000
+            stats['requests'] += 1
+            stats['queries'] += metrics.queries
+            stats['max_queries'] = max(stats['max_queries'], metrics.queries)
+            stats['db_ms'] += metrics.timings['db'] * 1000
+            stats['total_ms'] += total_ms
+            stats['max_total_ms'] = max(stats['max_total_ms'], total_ms)
+            for name, value in metrics.counters.items():
+                stats['counters'][name] += value
+
+    def snapshot(self):
+        """
+        Возвращает средние и максимальные значения по представлениям
+
+        Returns:
+            dict: Статистика по имени представления
+        """
+        with self._lock:
+            return {
+                view_name: {
+                    'requests': stats['requests'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                    'max_queries': stats['max_queries'],
+                    'avg_db_ms': round(stats['db_ms'] / stats['requests'], 2),
+                    'avg_total_ms': round(stats['total_ms'] / stats['requests'], 2),
+                    'max_total_ms': round(stats['max_total_ms'], 2),
+                    'counters': dict(stats['counters']),
+                }
+                for view_name, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+view_stats = ViewStats()
+
+
+def get_budget(view_func):
+    """
+    Бюджет представления: (query_budget, time_budget) или None
+
+    Бюджет объявляется атрибутами класса представления
+    или самой функции представления.
+    """
+    view = getattr(view_func, 'view_class', view_func)
+    return getattr(view, 'query_budget', None), getattr(view, 'time_budget', None)
+
+
+def check_budget(metrics, budget):
+    """
+    Проверяет метрики запроса на соответствие бюджету представления
+
+    Raises:
+        QueryBudgetExceeded: При превышении, если включен FILMBLOG_STRICT_BUDGETS
+    """
+    query_budget, time_budget = budget
+    problems = []
+    if query_budget is not None and metrics.queries > query_budget:
+        problems.append(f'{metrics.queries} SQL-запросов при бюджете {query_budget}')
+    if time_budget is not None and metrics.total * 1000 > time_budget:
+        problems.append(f'{metrics.total * 1000:.1f} мс при бюджете {time_budget} мс')
+    if not problems:
+        return
+    message = f'{metrics.view_name}: ' + ', '.join(problems)
+    if getattr(settings, 'FILMBLOG_STRICT_BUDGETS', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class InstrumentationMiddleware:
+    """
+    Middleware замера стоимости запроса
+
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать запросы к сессиям
+    и пользователям. Метрики доступны как request.metrics и response.metrics.
+    Работает и под WSGI, и под ASGI: метрики хранятся в ContextVar, который
+    переходит в потоки sync_to_async вместе с контекстом запроса.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, start = self._start(request)
+        try:
+            with self._wrap_connections():
+                response = self.get_response(request)
+        finally:
+            metrics.total = time.perf_counter() - start
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token, start = self._start(request)
+        try:
+            # Соединения с базой принадлежат потоку: обертки ставятся в том потоке,
+            # где sync_to_async выполняет ORM этого запроса
+            stack = await sync_to_async(self._wrap_connections)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            metrics.total = time.perf_counter() - start
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    @staticmethod
+    def _start(request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        request._view_budget = (None, None)
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def _wrap_connections(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self._execute))
+        return stack
+
+    @staticmethod
+    def _finish(request, response, metrics):
+        if request.resolver_match is not None:
+            metrics.view_name = request.resolver_match.view_name
+        response.metrics = metrics
+        response['Server-Timing'] = metrics.server_timing()
+        view_stats.record(metrics)
+        check_budget(metrics, request._view_budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_budget = get_budget(view_func)
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        metrics = request.metrics
+
+        def rendered(response):
+            metrics.timings['template'] += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def _execute(execute, sql, params, many, context):
+        metrics = _current.get()
+        if metrics is None:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.queries += 1
+            metrics.timings['db'] += time.perf_counter() - start
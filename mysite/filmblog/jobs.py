@@ -0,0 +1,150 @@
+"""
+Очередь фоновых задач на таблице Job
+
+Тяжелая обработка постов (уменьшенные копии изображений и т. п.) ставится
+в очередь при сохранении поста и выполняется командой manage.py run_jobs
+в пуле процессов, а не в gunicorn-воркере. Неудачные задачи повторяются
+с экспоненциальной задержкой до Job.max_attempts раз.
+
+При FILMBLOG_JOBS_SYNC = True задачи выполняются сразу (для тестов).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import conditional, export, facets, fragments
+from .images import update_renditions
+from .models import Job, Post
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def task(name):
+    """Регистрирует функцию задачи под именем name"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+@task('renditions')
+def renditions_task(post):
+    # Метаданные снимка извлекаются той же задачей: у загрузки одна задача в очереди
+    pairs = facets.update_metadata(post)
+    if pairs and post.status == 'published':
+        facets.refresh(pairs)
+    if update_renditions(post):
+        # Карточки в кэше списков еще ссылаются на исходное изображение
+        fragments.evict_post(post)
+    elif pairs is None:
+        return
+    conditional.bump()
+    if post.status == 'published' and export.enabled():
+        schedule_export(export.post_paths(post))
+
+
+@task('static_export')
+def static_export_task(post):
+    cache = fragments.get_fragment_cache()
+    if isinstance(cache, LocMemCache) and not getattr(settings, 'FILMBLOG_JOBS_SYNC', False):
+        # Кэш процесса воркера не получает вытеснений от веб-процессов
+        cache.clear()
+    export.build_stale()
+
+
+def execute(name, post_id):
+    """
+    Выполняет задачу для поста
+
+    Вызывается в процессе пула воркера, поэтому принимает id, а не объект.
+    Задачи без поста (post_id = None) выполняются всегда.
+    """
+    post = Post.objects.filter(pk=post_id).first() if post_id is not None else None
+    if post is not None or post_id is None:
+        TASKS[name](post)
+
+
+def enqueue(name, post=None):
+    """
+    Ставит задачу в очередь, если такая же еще не ждет выполнения
+
+    Args:
+        name (str): Имя зарегистрированной задачи
+        post (Post|None): Пост, для которого выполняется задача, или None
+
+    Returns:
+        Job|None: Задача в очереди или None в синхронном режиме
+    """
+    if getattr(settings, 'FILMBLOG_JOBS_SYNC', False):
+        try:
+            TASKS[name](post)
+        except OSError:
+            logger.exception('Задача %s для поста %s завершилась ошибкой',
+                             name, post.pk if post else None)
+        return None
+    job, _ = Job.objects.get_or_create(name=name, post=post, status='queued')
+    return job
+
+
+def schedule_export(paths):
+    """Отмечает страницы статической копии устаревшими и ставит их рендеринг в очередь"""
+    if export.enabled() and export.mark_stale(paths):
+        enqueue('static_export')
+
+
+def claim(limit):
+    """
+    Забирает готовые к выполнению задачи и помечает их как выполняемые
+
+    В PostgreSQL строки блокируются с SKIP LOCKED, поэтому несколько
+    воркеров не получат одну и ту же задачу.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_after__lte=now)
+            .order_by('run_after')[:limit]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status='running', attempts=F('attempts') + 1, started=now, updated=now
+        )
+    for job in jobs:
+        job.status = 'running'
+        job.attempts += 1
+    return jobs
+
+
+def finish(job, error=None):
+    """
+    Записывает результат задачи
+
+    При ошибке задача возвращается в очередь с задержкой
+    RETRY_DELAY * 2 ** (attempts - 1), пока не исчерпаны попытки.
+    """
+    now = timezone.now()
+    if error is None:
+        Job.objects.filter(pk=job.pk).update(status='done', error='', updated=now)
+    elif job.attempts < job.max_attempts:
+        Job.objects.filter(pk=job.pk).update(
+            status='queued', error=repr(error), updated=now,
+            run_after=now + RETRY_DELAY * 2 ** (job.attempts - 1)
+        )
+    else:
+        Job.objects.filter(pk=job.pk).update(status='failed', error=repr(error), updated=now)
+
+
+def requeue_stale(older_than):
+    """Возвращает в очередь задачи, зависшие после падения воркера"""
+    return Job.objects.filter(
+        status='running', started__lt=timezone.now() - older_than
+    ).update(status='queued', updated=timezone.now())
@@ -0,0 +1,82 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from filmblog import assets
+from filmblog.benchmark import (
+    generate_dataset, run_benchmark, run_connection_benchmark, run_render_benchmark,
+)
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетический архив постов и замеряет задержку представлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000,
+                            help='Сколько постов создать, если набора еще нет')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--images', type=int, default=20,
+                            help='Количество разных изображений-заглушек')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Замеряемых запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Замерить только этот сценарий (можно повторять)')
+        parser.add_argument('--generate-only', action='store_true',
+                            help='Только создать набор данных')
+        parser.add_argument('--render', action='store_true',
+                            help='Замерить процессорное время рендеринга шаблонов до и после кэширования')
+        parser.add_argument('--connections', action='store_true',
+                            help='Сравнить получение соединения с пулом и без (только PostgreSQL)')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Параллельных потоков для --connections')
+        parser.add_argument('--assets', action='store_true',
+                            help='Сравнить размер стилей и скриптов страниц до и после сборки бандлов')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        log = self.stderr.write
+        if options['assets']:
+            self._write(assets.report(), options['output'])
+            return
+        if options['connections']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('Пул соединений есть только для PostgreSQL')
+            self._write(run_connection_benchmark(requests=options['requests'],
+                                                 concurrency=options['concurrency'], log=log),
+                        options['output'])
+            return
+
+        generate_dataset(options['posts'], users=options['users'], tags=options['tags'],
+                         images=options['images'], seed=options['seed'],
+                         batch_size=options['batch_size'], log=log)
+        if options['generate_only']:
+            return
+
+        # Тестовый клиент: ALLOWED_HOSTS с testserver и DEBUG = False
+        setup_test_environment()
+        if options['render']:
+            self._write(run_render_benchmark(renders=options['requests'], seed=options['seed'],
+                                             scenarios=options['scenarios'], log=log),
+                        options['output'])
+            return
+
+        report = run_benchmark(requests=options['requests'], warmup=options['warmup'],
+                               seed=options['seed'], cold=options['cold'],
+                               scenarios=options['scenarios'], log=log)
+        self._write(report, options['output'])
+
+    def _write(self, report, path):
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
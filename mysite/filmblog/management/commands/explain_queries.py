@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from filmblog import query_plans
+
+
+class Command(BaseCommand):
+    help = 'Проверяет через EXPLAIN, что частые запросы к постам используют свои индексы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true',
+                            help='Вывести полные планы запросов')
+        parser.add_argument('--planner-default', action='store_true',
+                            help='Не запрещать Seq Scan в PostgreSQL (план на текущих данных)')
+
+    def handle(self, *args, plans, planner_default, **options):
+        reports = query_plans.check(force_index=not planner_default)
+        failed = []
+        for report in reports:
+            if report.index is None:
+                status = self.style.WARNING('без индекса') if report.seq_scans else 'OK'
+            elif report.uses_index:
+                status = self.style.SUCCESS(f'OK ({report.index})')
+            else:
+                status = self.style.ERROR(f'НЕ ИСПОЛЬЗУЕТ {report.index}')
+                failed.append(report.name)
+            line = f'{report.name}: {status}'
+            if report.seq_scans:
+                line += f'; последовательное сканирование: {", ".join(report.seq_scans)}'
+            self.stdout.write(line)
+            if plans:
+                self.stdout.write(report.plan + '\n')
+
+        if failed:
+            raise CommandError(f'Запросы не используют свои индексы: {", ".join(failed)}')
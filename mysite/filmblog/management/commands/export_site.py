@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from filmblog import export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает публичные страницы в статические файлы для веб-сервера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Перерисовать все страницы, а не только устаревшие')
+
+    def handle(self, *args, full, **options):
+        if not export.enabled():
+            raise CommandError('Не задана настройка FILMBLOG_STATIC_EXPORT_ROOT')
+        if full:
+            self.stdout.write(f'Отмечено страниц: {export.mark_all()}')
+        result = export.build_stale(log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано страниц: {result.written}, удалено: {result.removed}'
+        ))
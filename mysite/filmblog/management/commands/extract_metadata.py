@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from filmblog import conditional, facets
+from filmblog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Извлекает метаданные снимков постов и пересчитывает счетчики фасетов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Перечитать метаданные всех изображений')
+
+    def handle(self, *args, force=False, **options):
+        updated = 0
+        for post in Post.objects.only('pk', 'image').iterator():
+            if facets.update_metadata(post, force=force) is not None:
+                updated += 1
+        values = facets.recount()
+        conditional.bump()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено постов: {updated}, значений фасетов: {values}'))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from filmblog import media
+
+
+class Command(BaseCommand):
+    help = 'Удаляет медиафайлы, на которые не ссылается ни один пост'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='Сначала пересчитать ссылки по таблице постов')
+        parser.add_argument('--grace', type=int, default=3600,
+                            help='Сколько секунд файл должен пробыть без ссылок')
+
+    def handle(self, *args, recount, grace, **options):
+        if recount:
+            self.stdout.write(f'Учтено файлов: {media.recount()}')
+        deleted = media.collect_garbage(timedelta(seconds=grace))
+        for name in deleted:
+            self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {len(deleted)}'))
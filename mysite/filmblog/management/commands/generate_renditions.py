@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from filmblog.images import update_renditions
+from filmblog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие уменьшенные копии изображений постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересчитать хэши всех исходников')
+
+    def handle(self, *args, force=False, **options):
+        updated = 0
+        posts = Post.objects.exclude(image='', image_preview='').exclude(image=None, image_preview=None)
+        for post in posts.iterator():
+            if force:
+                post.renditions = {}
+            try:
+                updated += update_renditions(post)
+            except OSError as e:
+                self.stderr.write(f'{post.pk}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Обновлено постов: {updated}'))
@@ -0,0 +1,39 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from filmblog.archive import BATCH_SIZE, import_archive
+
+
+class Command(BaseCommand):
+    help = 'Импортирует архив отсканированных пленок из манифеста JSON/JSON Lines или каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл манифеста или каталог архива')
+        parser.add_argument('--author', required=True, help='Имя пользователя - автора постов')
+        parser.add_argument('--source',
+                            help='Имя архива для возобновления импорта (по умолчанию имя файла)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для уменьшенных копий (0 - в этом процессе)')
+
+    def handle(self, *args, path, author, source, batch_size, workers, **options):
+        if not os.path.exists(path):
+            raise CommandError(f'Нет файла или каталога {path}')
+        user = User.objects.filter(username=author).first()
+        if user is None:
+            raise CommandError(f'Нет пользователя {author}')
+        try:
+            result = import_archive(path, user, source=source, batch_size=batch_size,
+                                    workers=workers, log=self.stderr.write)
+        except ValueError as e:
+            raise CommandError(f'Манифест не разбирается: {e}')
+        for key, message in result.failed:
+            self.stderr.write(f'{key}: {message}')
+        rate = result.imported / result.elapsed if result.elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {result.imported} за {result.elapsed:.1f} с ({rate:.1f} постов/с), '
+            f'копии изображений: {result.renditions}, пропущено: {result.skipped}, '
+            f'ошибок: {len(result.failed)}'
+        ))
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from filmblog.benchmark import run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Нагружает запущенные серверы и сравнивает пропускную способность и хвосты задержки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', dest='targets', required=True,
+                            help='Сервер в виде имя=адрес, например asgi=http://127.0.0.1:8001 '
+                                 '(можно повторять)')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Одновременных запросов')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Нагрузить только этот сценарий (можно повторять)')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, targets, **options):
+        try:
+            targets = dict(target.split('=', 1) for target in targets)
+        except ValueError:
+            raise CommandError('Сервер задается в виде имя=адрес')
+        report = run_load_test(targets, requests=options['requests'],
+                               concurrency=options['concurrency'], seed=options['seed'],
+                               scenarios=options['scenarios'], timeout=options['timeout'],
+                               log=self.stderr.write)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
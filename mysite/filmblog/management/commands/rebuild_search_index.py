@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from filmblog.models import Post, PostSearchDocument
+from filmblog.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковые документы всех постов'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        PostSearchDocument.objects.exclude(post__status='published').delete()
+        total = 0
+        for post in Post.published.iterator():
+            backend.update(post)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано постов: {total}'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from filmblog import conditional, jobs
+from filmblog.models import BODY_FIELDS, Post
+
+
+class Command(BaseCommand):
+    help = 'Заново рендерит тела постов (body_html, отрывок, время чтения) после смены правил'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, batch_size, **options):
+        fields = ('title', 'slug', 'publish', 'status', 'body', 'image', 'image_preview',
+                  'renditions', *BODY_FIELDS)
+        changed, paths = [], set()
+        total = updated = 0
+        for post in Post.objects.only(*fields).order_by('pk').iterator(chunk_size=batch_size):
+            total += 1
+            if not post.render_body():
+                continue
+            changed.append(post)
+            if post.status == 'published':
+                paths.add(post.get_absolute_url())
+            if len(changed) == batch_size:
+                updated += Post.objects.bulk_update(changed, BODY_FIELDS)
+                changed = []
+        updated += Post.objects.bulk_update(changed, BODY_FIELDS)
+        if updated:
+            # Страницы постов отдаются по ETag и из статической копии
+            conditional.bump()
+            jobs.schedule_export(paths)
+        self.stdout.write(self.style.SUCCESS(f'Постов: {total}, обновлено: {updated}'))
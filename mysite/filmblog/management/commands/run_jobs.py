@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from filmblog import jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Количество процессов в пуле')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Пауза между опросами пустой очереди, секунды')
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help='Через сколько секунд выполняемая задача считается зависшей')
+        parser.add_argument('--once', action='store_true',
+                            help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, workers, sleep, stale_after, once, **options):
+        requeued = jobs.requeue_stale(timedelta(seconds=stale_after))
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь зависших задач: {requeued}')
+
+        # Процессы пула запускаются через spawn и настраивают Django сами,
+        # поэтому не наследуют открытые соединения с базой
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        pending = {}
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=django.setup) as pool:
+            while True:
+                for job in jobs.claim(workers - len(pending)):
+                    pending[pool.submit(jobs.execute, job.name, job.post_id)] = job
+
+                if not pending:
+                    if once:
+                        break
+                    time.sleep(sleep)
+                    continue
+
+                done, _ = wait(pending, timeout=sleep, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = pending.pop(future)
+                    error = future.exception()
+                    jobs.finish(job, error)
+                    status = 'ошибка: %r' % error if error else 'готово'
+                    self.stdout.write(f'{job.name} #{job.post_id}: {status}')
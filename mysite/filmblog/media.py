@@ -0,0 +1,113 @@
+"""
+Учет ссылок на медиафайлы постов и сборка мусора
+
+Каждое имя файла в Post.image и Post.image_preview учитывается в StoredFile.
+Счетчик меняется сигналами при сохранении и удалении постов, а файлы
+с нулевым счетчиком удаляются отложенно командой manage.py gc_media,
+чтобы не удалить файл, который как раз загружают повторно.
+"""
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Post, StoredFile
+from .storage import content_storage, digest_from_name
+
+
+MEDIA_FIELDS = ('image', 'image_preview')
+
+
+def retain(name, count=1):
+    """Увеличивает счетчик ссылок на файл"""
+    StoredFile.objects.get_or_create(name=name)
+    StoredFile.objects.filter(name=name).update(
+        references=F('references') + count, updated=timezone.now()
+    )
+
+
+def release(name):
+    """Уменьшает счетчик ссылок на файл"""
+    StoredFile.objects.filter(name=name).update(
+        references=F('references') - 1, updated=timezone.now()
+    )
+
+
+def file_names(values):
+    """Непустые имена файлов из словаря значений полей поста"""
+    return Counter(values[field] for field in MEDIA_FIELDS if values.get(field))
+
+
+def update_references(before, after):
+    """
+    Приводит счетчики ссылок в соответствие с изменением полей поста
+
+    Args:
+        before (dict): Значения полей файлов до сохранения (или пустой)
+        after (dict): Значения полей файлов после сохранения (или пустой)
+    """
+    before, after = file_names(before), file_names(after)
+    for name, count in (after - before).items():
+        for _ in range(count):
+            retain(name)
+    for name, count in (before - after).items():
+        for _ in range(count):
+            release(name)
+
+
+def delete_renditions(digest):
+    """Удаляет уменьшенные копии файла с указанным хэшем"""
+    directory = f'renditions/{digest[:2]}/{digest}'
+    if not default_storage.exists(directory):
+        return
+    for name in default_storage.listdir(directory)[1]:
+        default_storage.delete(f'{directory}/{name}')
+
+
+def recount():
+    """
+    Пересчитывает счетчики ссылок по таблице постов
+
+    Returns:
+        int: Количество учтенных файлов
+    """
+    counts = Counter()
+    for values in Post.objects.values(*MEDIA_FIELDS).iterator():
+        counts.update(file_names(values))
+    with transaction.atomic():
+        StoredFile.objects.exclude(name__in=counts).update(references=0)
+        for name, references in counts.items():
+            StoredFile.objects.update_or_create(name=name, defaults={'references': references})
+    return len(counts)
+
+
+def collect_garbage(grace):
+    """
+    Удаляет файлы, на которые дольше grace не ссылается ни один пост
+
+    Args:
+        grace (timedelta): Сколько файл должен пробыть без ссылок
+
+    Returns:
+        list: Имена удаленных файлов
+    """
+    deleted = []
+    candidates = StoredFile.objects.filter(
+        references__lte=0, updated__lt=timezone.now() - grace
+    ).values_list('name', flat=True)
+    for name in list(candidates):
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name, references__lte=0
+            ).first()
+            if stored is None:
+                continue
+            content_storage.delete(name)
+            digest = digest_from_name(name)
+            if digest:
+                delete_renditions(digest)
+            stored.delete()
+        deleted.append(name)
+    return deleted
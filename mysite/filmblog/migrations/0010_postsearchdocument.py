@@ -0,0 +1,77 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:24
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+
+# Копия filmblog.search на момент миграции: изменения поиска
+# не должны менять то, что она записывает в новую базу
+SEARCH_CONFIG = 'russian'
+
+
+def build_document(post):
+    """Текст поискового документа: превью и тело поста без HTML-разметки"""
+    return ' '.join(
+        part for part in (post.preview, strip_tags(post.body or '')) if part
+    )
+
+
+def create_gin_index(apps, schema_editor):
+    # GIN-индекс по tsvector есть только в PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX filmblog_postsearchdocument_vector_gin '
+        'ON filmblog_postsearchdocument USING gin (vector)'
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS filmblog_postsearchdocument_vector_gin')
+
+
+def fill_search_documents(apps, schema_editor):
+    Post = apps.get_model('filmblog', 'Post')
+    PostSearchDocument = apps.get_model('filmblog', 'PostSearchDocument')
+    documents = []
+    posts = Post.objects.filter(status='published').only('pk', 'title', 'preview', 'body')
+    for post in posts.iterator():
+        documents.append(PostSearchDocument(post_id=post.pk, title=post.title,
+                                            document=build_document(post)))
+        if len(documents) == 1000:
+            PostSearchDocument.objects.bulk_create(documents)
+            documents = []
+    PostSearchDocument.objects.bulk_create(documents)
+    if schema_editor.connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchVector
+
+        PostSearchDocument.objects.update(
+            vector=SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+                   SearchVector('document', weight='B', config=SEARCH_CONFIG)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0009_alter_post_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='filmblog.post')),
+                ('title', models.TextField()),
+                ('document', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+    ]
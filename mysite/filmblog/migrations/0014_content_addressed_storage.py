@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:35
+
+import filmblog.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0013_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=filmblog.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image_preview',
+            field=models.ImageField(blank=True, null=True, storage=filmblog.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
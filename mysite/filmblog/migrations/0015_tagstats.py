@@ -0,0 +1,56 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:45
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_tag_stats(apps, schema_editor):
+    # В исторических моделях нет GenericForeignKey, поэтому без tags__
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Post = apps.get_model('filmblog', 'Post')
+    Tag = apps.get_model('taggit', 'Tag')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TagStats = apps.get_model('filmblog', 'TagStats')
+    published = dict(Post.objects.filter(status='published').values_list('pk', 'publish'))
+    counts, latest = defaultdict(int), {}
+    tagged = TaggedItem.objects.filter(content_type__in=ContentType.objects.filter(
+        app_label='filmblog', model='post'
+    )).values_list('tag_id', 'object_id')
+    for tag_id, post_id in tagged.iterator():
+        if post_id in published:
+            counts[tag_id] += 1
+            latest[tag_id] = max(latest.get(tag_id, published[post_id]), published[post_id])
+    TagStats.objects.bulk_create([
+        TagStats(tag_id=pk, name=name, slug=slug,
+                 published_posts=counts[pk], latest_publish=latest.get(pk))
+        for pk, name, slug in Tag.objects.values_list('pk', 'name', 'slug')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('filmblog', '0014_content_addressed_storage'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='taggit.tag')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+                ('published_posts', models.PositiveIntegerField(default=0)),
+                ('latest_publish', models.DateTimeField(blank=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('-published_posts', 'name'),
+            },
+        ),
+        migrations.RunPython(fill_tag_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:50
+
+from django.db import migrations, models
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+
+# Превью рендерится так, как при появлении поля preview_html,
+# и не следует за последующими правками filmblog.text
+PREVIEW_WORDS = 30
+
+
+def render_preview(preview):
+    """HTML превью для карточки поста, как {{ preview|truncatewords:30|linebreaks }}"""
+    return linebreaks(Truncator(preview or '').words(PREVIEW_WORDS, truncate=' …'), autoescape=True)
+
+
+def fill_preview_html(apps, schema_editor):
+    Post = apps.get_model('filmblog', 'Post')
+    posts = []
+    for post in Post.objects.only('pk', 'preview').iterator():
+        post.preview_html = render_preview(post.preview)
+        posts.append(post)
+        if len(posts) == 1000:
+            Post.objects.bulk_update(posts, ['preview_html'])
+            posts = []
+    Post.objects.bulk_update(posts, ['preview_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0016_post_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='preview_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_preview_html, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0017_post_preview_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaticPage',
+            fields=[
+                ('path', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('marked', models.DateTimeField(default=django.utils.timezone.now)),
+                ('rendered', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
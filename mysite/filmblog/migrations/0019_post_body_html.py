@@ -0,0 +1,194 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:15
+
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+# Очистка тела поста на момент появления body_html. Правила filmblog.text
+# после этого меняются; уже записанные посты приводит к ним render_posts
+EXCERPT_WORDS = 40
+WORDS_PER_MINUTE = 200
+SECONDS_PER_IMAGE = 10
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'code', 'del', 'div', 'em',
+    'figcaption', 'figure', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'li',
+    'ol', 'p', 'pre', 's', 'small', 'span', 'strong', 'sub', 'sup', 'table',
+    'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+INLINE_TAGS = {'a', 'abbr', 'b', 'code', 'del', 'em', 'i', 's', 'small', 'span',
+               'strong', 'sub', 'sup', 'u'}
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template',
+                'svg', 'math', 'textarea', 'select'}
+DROPPED_VOID_TAGS = {'embed'}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_SCHEMES = {'href': {'http', 'https', 'mailto'}, 'src': {'http', 'https'}}
+
+_scheme_re = re.compile(r'^([a-z][a-z0-9+.-]*):', re.IGNORECASE)
+_invisible_re = re.compile(r'[\x00-\x20\x7f]+')
+
+
+def _safe_url(value, attribute):
+    compact = _invisible_re.sub('', value)
+    match = _scheme_re.match(compact)
+    if match and match.group(1).lower() not in ALLOWED_SCHEMES[attribute]:
+        return None
+    return value.strip()
+
+
+class BodyRenderer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.text = []
+        self.image_count = 0
+        self._open = []
+        self._dropped = []
+
+    def _attributes(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        result = {}
+        for name, value in attrs:
+            if name not in allowed or value is None or name in result:
+                continue
+            if name in URL_ATTRIBUTES:
+                value = _safe_url(value, name)
+                if value is None:
+                    continue
+            result[name] = value
+        return result
+
+    @staticmethod
+    def _format(tag, attributes):
+        return '<{}{}>'.format(tag, ''.join(
+            f' {name}="{escape(value, quote=True)}"' for name, value in attributes.items()
+        ))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            if tag not in DROPPED_VOID_TAGS:
+                self._dropped.append((tag, *self.getpos(), len(self.get_starttag_text())))
+            return
+        if self._dropped:
+            return
+        if tag not in INLINE_TAGS:
+            self.text.append(' ')
+        if tag not in ALLOWED_TAGS:
+            return
+        attributes = self._attributes(tag, attrs)
+        if tag == 'img':
+            if attributes.get('src'):
+                self.image_count += 1
+                attributes.setdefault('alt', '')
+                attributes.update(loading='lazy', decoding='async')
+                self.output.append(self._format('img', attributes))
+            return
+        if tag == 'a' and attributes.get('href', '').lower().startswith(('http:', 'https:')):
+            attributes['rel'] = 'nofollow noopener'
+        self.output.append(self._format(tag, attributes))
+        if tag not in VOID_TAGS:
+            self._open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            if any(dropped[0] == tag for dropped in self._dropped):
+                while self._dropped.pop()[0] != tag:
+                    pass
+            return
+        if self._dropped:
+            return
+        if tag not in INLINE_TAGS:
+            self.text.append(' ')
+        if tag not in self._open:
+            return
+        while self._open:
+            open_tag = self._open.pop()
+            self.output.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._dropped:
+            self.output.append(escape(data, quote=False))
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self._open:
+            self.output.append(f'</{self._open.pop()}>')
+
+
+def render_body(body):
+    """Очищенный HTML тела поста, отрывок и время чтения в минутах"""
+    body = body or ''
+    while True:
+        renderer = BodyRenderer()
+        renderer.feed(body)
+        renderer.close()
+        if not renderer._dropped:
+            break
+        # Незакрытый удаляемый тег удаляется один, без текста после него
+        _, line, offset, length = renderer._dropped[0]
+        start = sum(len(row) + 1 for row in body.split('\n')[:line - 1]) + offset
+        body = body[:start] + body[start + length:]
+    text = ' '.join(''.join(renderer.text).split())
+    seconds = len(text.split()) / WORDS_PER_MINUTE * 60 + renderer.image_count * SECONDS_PER_IMAGE
+    return (''.join(renderer.output), Truncator(text).words(EXCERPT_WORDS, truncate=' …'),
+            math.ceil(seconds / 60))
+
+
+def fill_body_html(apps, schema_editor):
+    # Изображения поста заменяются на <picture> командой render_posts
+    Post = apps.get_model('filmblog', 'Post')
+    posts = []
+    for post in Post.objects.only('pk', 'body').iterator():
+        post.body_html, post.excerpt, post.reading_time = render_body(post.body)
+        posts.append(post)
+        if len(posts) == 1000:
+            Post.objects.bulk_update(posts, ['body_html', 'excerpt', 'reading_time'])
+            posts = []
+    Post.objects.bulk_update(posts, ['body_html', 'excerpt', 'reading_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0018_static_page'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='body_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_body_html, migrations.RunPython.noop),
+    ]
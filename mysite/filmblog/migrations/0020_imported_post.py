@@ -0,0 +1,22 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0019_post_body_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedPost',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('imported', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='filmblog.post')),
+            ],
+        ),
+    ]
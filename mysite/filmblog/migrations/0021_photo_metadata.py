@@ -0,0 +1,50 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filmblog', '0020_imported_post'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('camera', 'Камера'), ('lens', 'Объектив'), ('film', 'Пленка'), ('iso', 'ISO')], max_length=10)),
+                ('value', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=110)),
+                ('published_posts', models.PositiveIntegerField(default=0)),
+                ('latest_publish', models.DateTimeField(blank=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('facet', '-published_posts', 'value'),
+            },
+        ),
+        migrations.CreateModel(
+            name='PhotoMetadata',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metadata', serialize=False, to='filmblog.post')),
+                ('camera', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('lens', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('film', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('iso', models.PositiveIntegerField(blank=True, db_index=True, null=True)),
+                ('scanned', models.DateTimeField(blank=True, null=True)),
+                ('source', models.CharField(blank=True, max_length=255)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('facet', 'value'), name='facet_value_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('facet', 'slug'), name='facet_slug_unique'),
+        ),
+    ]
@@ -1,9 +1,30 @@
+import datetime
+import mimetypes
+import os
+import uuid
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
 from taggit.managers import TaggableManager
+from taggit.models import Tag
+
+from .storage import content_storage
+from .templatetags.filmblog_images import responsive_image
+from .text import render_body, render_preview
+from .uploads import StreamedUploadedFile, hash_path, partial_path
+
 
+# Поля, которые Post.render_body() считает из тела поста
+BODY_FIELDS = ('body_html', 'excerpt', 'reading_time')
+# Ширина изображений поста в тексте для атрибута sizes
+BODY_IMAGE_SIZES = '(max-width: 1000px) 100vw, 1000px'
+
+# Поля поста, которые нужны карточке в списках (см. PostQuerySet.cards)
+CARD_FIELDS = ('title', 'slug', 'publish', 'status', 'original_author', 'preview_html',
+               'image_preview', 'renditions')
 
 
 class Question(models.Model):
@@ -17,12 +38,40 @@ class Choice(models.Model):
     votes = models.IntegerField(default=0)
 
 
-class PublishedManager(models.Manager):
+class PostQuerySet(models.QuerySet):
+    def cards(self):
+        """
+        Только поля, которые выводит карточка поста в списках, и теги
+
+        Тело поста и автор не загружаются.
+        """
+        return self.only(*CARD_FIELDS).prefetch_related('tags')
+
+
+PostManager = models.Manager.from_queryset(PostQuerySet)
+
+
+class PublishedManager(PostManager):
     def get_queryset(self):
         return super(PublishedManager,
 		     self).get_queryset()\
                           .filter(status='published')
 
+    def published_on(self, year, month, day):
+        """
+        Посты, опубликованные в указанный день по текущему часовому поясу
+
+        Фильтр по диапазону дат, а не publish__year/month/day, чтобы
+        работал индекс по (slug, publish).
+
+        Raises:
+            ValueError: Если такой даты нет
+        """
+        start = timezone.make_aware(datetime.datetime(year, month, day))
+        return self.get_queryset().filter(
+            publish__gte=start, publish__lt=start + datetime.timedelta(days=1)
+        )
+
 
 class Post(models.Model):
     STATUS_CHOICES = (
@@ -36,10 +85,16 @@ class Post(models.Model):
                                on_delete=models.CASCADE,
                                related_name='blog_posts')
     preview = models.TextField(blank=True)
+    preview_html = models.TextField(blank=True, editable=False)
     original_author = models.CharField(null=True, blank=True, max_length=250)
     body = models.TextField()
-    image = models.ImageField(null=True, blank=True)
-    image_preview = models.ImageField(null=True, blank=True)
+    # Очищенное тело поста для вывода (см. filmblog.text.render_body)
+    body_html = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    reading_time = models.PositiveIntegerField(default=0, editable=False)
+    image = models.ImageField(null=True, blank=True, storage=content_storage)
+    image_preview = models.ImageField(null=True, blank=True, storage=content_storage)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     publish = models.DateTimeField(default=timezone.now)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -50,13 +105,57 @@ class Post(models.Model):
 
     class Meta:
         ordering = ('-publish',)
+        indexes = [
+            # Списки опубликованных постов и курсорная пагинация (-publish, pk)
+            models.Index(fields=['-publish', 'id'],
+                         name='post_published_idx',
+                         condition=models.Q(status='published')),
+            # Страница поста: слаг и день публикации
+            models.Index(fields=['slug', 'publish'], name='post_slug_publish_idx'),
+            # Страница управления постами (-created, pk)
+            models.Index(fields=['-created', 'id'], name='post_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-    objects = models.Manager()  # Менеджер по умолчанию
+    objects = PostManager()  # Менеджер по умолчанию
     published = PublishedManager()  # Собственный менеджер
 
+    def save(self, *args, **kwargs):
+        self.preview_html = render_preview(self.preview)
+        self.render_body()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'preview' in update_fields:
+                update_fields.add('preview_html')
+            if update_fields & {'body', 'image', 'image_preview', 'renditions'}:
+                update_fields.update(BODY_FIELDS)
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+    def render_body(self):
+        """
+        Пересчитывает body_html, excerpt и reading_time из тела поста
+
+        Изображения поста, вставленные в текст, заменяются на <picture>
+        с их уменьшенными копиями.
+
+        Returns:
+            bool: True, если поля изменились
+        """
+        images = {}
+        for field_name in ('image', 'image_preview'):
+            field_file = getattr(self, field_name)
+            if field_file:
+                images[field_file.url] = responsive_image(self, field_name, sizes=BODY_IMAGE_SIZES,
+                                                          alt=self.title)
+        rendered = render_body(self.body, images)
+        changed = any(getattr(self, name) != value for name, value in zip(BODY_FIELDS, rendered))
+        self.body_html, self.excerpt, self.reading_time = rendered
+        return changed
+
     def get_absolute_url(self):
         return reverse('filmblog:post_detail',
                        args=[self.publish.year,
@@ -70,4 +169,236 @@ class Post(models.Model):
             url = self.image_preview.url
         except:
             url = ''
-        return url
\ No newline at end of file
+        return url
+
+
+class PostSearchDocument(models.Model):
+    """
+    Поисковый документ опубликованного поста
+
+    Хранит нормализованный текст поста и, в PostgreSQL, предрассчитанный
+    tsvector с GIN-индексом. Поддерживается сигналами post_save/post_delete.
+    """
+    post = models.OneToOneField(Post,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='search_document')
+    title = models.TextField()
+    document = models.TextField(blank=True)
+    vector = SearchVectorField(null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title
+
+
+
+class Job(models.Model):
+    """
+    Фоновая задача из очереди обработки постов
+
+    Задачи выполняет команда manage.py run_jobs, см. filmblog.jobs.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    name = models.CharField(max_length=50)
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='jobs',
+                             null=True,
+                             blank=True)
+    status = models.CharField(max_length=10,
+                              choices=STATUS_CHOICES,
+                              default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('run_after',)
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f'{self.name} #{self.post_id} ({self.status})'
+
+
+
+class ChunkedUpload(models.Model):
+    """
+    Возобновляемая загрузка файла частями
+
+    Принятые байты дописываются в файл внутри MEDIA_ROOT, его размер и есть
+    текущее смещение загрузки. См. filmblog.uploads.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def path(self):
+        return partial_path(f'{self.pk.hex}.part')
+
+    @property
+    def offset(self):
+        """Количество уже принятых байт"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def completed(self):
+        return self.offset == self.size
+
+    def as_uploaded_file(self):
+        """Возвращает загруженный файл для сохранения в ImageField"""
+        content_type = mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+        return StreamedUploadedFile(self.path, self.filename, content_type, self.size,
+                                    sha256=hash_path(self.path))
+
+    def delete(self, *args, **kwargs):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return super().delete(*args, **kwargs)
+
+
+class StoredFile(models.Model):
+    """
+    Счетчик ссылок постов на файл в хранилище медиафайлов
+
+    Файлы с нулевым счетчиком удаляет команда manage.py gc_media.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+
+class TagStats(models.Model):
+    """
+    Статистика тега по опубликованным постам
+
+    Обновляется сигналами (см. filmblog.tags) и читается из снимка
+    в памяти процесса, поэтому меню тегов не стоит запросов к базе.
+    """
+    tag = models.OneToOneField(Tag,
+                               on_delete=models.CASCADE,
+                               primary_key=True,
+                               related_name='stats')
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+    published_posts = models.PositiveIntegerField(default=0)
+    latest_publish = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-published_posts', 'name')
+
+    def __str__(self):
+        return f'{self.name} ({self.published_posts})'
+
+
+class StaticPage(models.Model):
+    """
+    Страница статической копии сайта
+
+    Страница устарела, если ее отметили после последнего рендеринга.
+    Устаревшие страницы перерисовывает задача static_export
+    (см. filmblog.export).
+    """
+    path = models.CharField(max_length=255, primary_key=True)
+    marked = models.DateTimeField(default=timezone.now)
+    rendered = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.path
+
+
+class ImportedPost(models.Model):
+    """
+    Запись архива, уже импортированная командой import_archive
+
+    Создается в одной транзакции с постом, поэтому прерванный импорт
+    продолжается без дублей (см. filmblog.archive).
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    imported = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class PhotoMetadata(models.Model):
+    """
+    Метаданные снимка поста из EXIF основного изображения
+
+    Заполняется задачей renditions после загрузки изображения
+    (см. filmblog.facets). Поля фасетов проиндексированы.
+
+    Атрибуты:
+        source (str): Имя файла, из которого извлечены метаданные
+    """
+    post = models.OneToOneField(Post,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='metadata')
+    camera = models.CharField(max_length=100, blank=True, db_index=True)
+    lens = models.CharField(max_length=100, blank=True, db_index=True)
+    film = models.CharField(max_length=100, blank=True, db_index=True)
+    iso = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    scanned = models.DateTimeField(null=True, blank=True)
+    source = models.CharField(max_length=255, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return ', '.join(str(value) for value in (self.camera, self.lens, self.film) if value)
+
+
+class FacetCount(models.Model):
+    """
+    Число опубликованных постов с данным значением фасета
+
+    Пересчитывается только для затронутых значений при изменении
+    метаданных, публикации, снятии с публикации и удалении поста
+    (см. filmblog.facets), поэтому список фасетов не требует GROUP BY.
+    """
+    FACET_CHOICES = (
+        ('camera', 'Камера'),
+        ('lens', 'Объектив'),
+        ('film', 'Пленка'),
+        ('iso', 'ISO'),
+    )
+    facet = models.CharField(max_length=10, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=110)
+    published_posts = models.PositiveIntegerField(default=0)
+    latest_publish = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('facet', '-published_posts', 'value')
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='facet_value_unique'),
+            models.UniqueConstraint(fields=['facet', 'slug'], name='facet_slug_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_facet_display()}: {self.value} ({self.published_posts})'
@@ -0,0 +1,109 @@
+"""
+Навигация по соседним постам на странице поста
+
+Ссылки на предыдущий и следующий опубликованные посты и теги поста
+хранятся в кэше фрагментов по id поста, поэтому страница поста
+читает из базы только сам пост. Запись вытесняется сигналами, когда пост
+публикуют, снимают с публикации, меняют дату, заголовок или слаг,
+удаляют или меняют его теги. Вместе с записью поста вытесняются записи
+его соседей до и после изменения - только их ссылки могли указывать на него.
+"""
+from django.db.models import Q
+
+from . import instrumentation
+from .fragments import get_fragment_cache
+from .models import Post
+
+
+def navigation_key(post_id):
+    return f'filmblog:post_nav:{post_id}'
+
+
+def _link(values):
+    if values is None:
+        return None
+    return {'id': values['pk'], 'title': values['title'], 'url': Post(**values).get_absolute_url()}
+
+
+def _neighbor_queries(publish, post_id):
+    queryset = Post.published.exclude(pk=post_id).values('pk', 'title', 'slug', 'publish')
+    previous = queryset.filter(
+        Q(publish__lt=publish) | Q(publish=publish, pk__lt=post_id)
+    ).order_by('-publish', '-pk')
+    following = queryset.filter(
+        Q(publish__gt=publish) | Q(publish=publish, pk__gt=post_id)
+    ).order_by('publish', 'pk')
+    return previous, following
+
+
+def neighbors(publish, post_id):
+    """
+    Соседние опубликованные посты для позиции (publish, post_id)
+
+    Порядок совпадает с get_next_by_publish: по дате, при равных датах по id.
+    Сам пост не учитывается, поэтому функция находит и прежних соседей
+    поста, который уже перенесен или удален.
+
+    Returns:
+        tuple: Значения (pk, title, slug, publish) предыдущего и следующего
+               постов или None
+    """
+    previous, following = _neighbor_queries(publish, post_id)
+    return previous.first(), following.first()
+
+
+def _build(previous, following, tags):
+    return {'prev_post': _link(previous), 'next_post': _link(following), 'tags': tags}
+
+
+def get_navigation(post):
+    """
+    Возвращает навигацию для страницы поста, вычисляя ее при промахе кэша
+
+    Args:
+        post (Post): Опубликованный пост
+
+    Returns:
+        dict: prev_post и next_post ({'id', 'title', 'url'} или None)
+              и tags (список {'name', 'slug'})
+    """
+    cache = get_fragment_cache()
+    navigation = cache.get(navigation_key(post.pk))
+    instrumentation.count('cache_miss' if navigation is None else 'cache_hit')
+    if navigation is None:
+        navigation = _build(*neighbors(post.publish, post.pk),
+                            list(post.tags.values('name', 'slug')))
+        cache.set(navigation_key(post.pk), navigation, timeout=None)
+    return navigation
+
+
+async def aget_navigation(post):
+    """Асинхронный вариант get_navigation() на асинхронном ORM"""
+    cache = get_fragment_cache()
+    navigation = await cache.aget(navigation_key(post.pk))
+    instrumentation.count('cache_miss' if navigation is None else 'cache_hit')
+    if navigation is None:
+        previous, following = _neighbor_queries(post.publish, post.pk)
+        navigation = _build(await previous.afirst(), await following.afirst(),
+                            [tag async for tag in post.tags.values('name', 'slug')])
+        await cache.aset(navigation_key(post.pk), navigation, timeout=None)
+    return navigation
+
+
+def evict(*post_ids):
+    """Вытесняет навигацию указанных постов"""
+    get_fragment_cache().delete_many([navigation_key(post_id) for post_id in post_ids])
+
+
+def evict_around(post_id, *publish_dates):
+    """
+    Вытесняет навигацию поста и его соседей в указанных позициях
+
+    Args:
+        post_id (int): id поста
+        *publish_dates (datetime): Даты публикации поста до и после изменения
+    """
+    post_ids = {post_id}
+    for publish in publish_dates:
+        post_ids.update(values['pk'] for values in neighbors(publish, post_id) if values)
+    evict(*post_ids)
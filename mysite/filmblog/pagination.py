@@ -0,0 +1,250 @@
+"""
+Курсорная (keyset) пагинация
+
+Первые страницы открываются по номеру, дальше навигация идет по курсору
+(значение поля сортировки и id последнего поста). Такой запрос не требует
+COUNT(*) и OFFSET, поэтому стоит одинаково для любой глубины.
+"""
+import base64
+from datetime import datetime
+from functools import partial
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+from django.utils.http import urlencode
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_cursor(direction, value, pk):
+    raw = f'{direction}|{value.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Разбирает курсор из URL
+
+    Returns:
+        tuple: Направление ('n' или 'p'), значение поля и id поста
+
+    Raises:
+        InvalidCursor: Если курсор поврежден
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, value, pk = raw.split('|')
+        if direction not in ('n', 'p'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(value), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor('Неверный курсор') from e
+
+
+class KeysetPage:
+    """
+    Страница курсорной пагинации
+
+    Атрибуты:
+        object_list (list): Посты страницы
+        number (int|None): Номер страницы или None для страниц по курсору
+        page_range (range): Номера страниц, доступных по номеру
+        previous_query (str): Query string ссылки на предыдущую страницу
+        next_query (str): Query string ссылки на следующую страницу
+    """
+
+    def __init__(self, paginator, object_list, number, previous_query, next_query):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self.previous_query = previous_query
+        self.next_query = next_query
+        last_known = number + bool(next_query) if number else paginator.numbered_pages
+        self.page_range = range(1, min(last_known, paginator.numbered_pages) + 1)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return bool(self.next_query)
+
+    def has_previous(self):
+        return bool(self.previous_query)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по (-field, id) без подсчета количества записей
+
+    Атрибуты:
+        queryset (QuerySet): Исходный QuerySet
+        per_page (int): Количество записей на странице
+        field (str): Поле сортировки по убыванию
+        numbered_pages (int): Сколько первых страниц доступно по номеру
+        query_prefix (str): Начало query string ссылок с остальными параметрами
+                            (например, фильтрами) и & в конце
+    """
+    keyset = True
+
+    def __init__(self, queryset, per_page, field='publish', numbered_pages=3,
+                 page_kwarg='page', cursor_kwarg='cursor', query_prefix=''):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.numbered_pages = numbered_pages
+        self.page_kwarg = page_kwarg
+        self.cursor_kwarg = cursor_kwarg
+        self.query_prefix = query_prefix
+
+    def _cursor_query(self, direction, obj):
+        cursor = encode_cursor(direction, getattr(obj, self.field), obj.pk)
+        return self.query_prefix + urlencode({self.cursor_kwarg: cursor})
+
+    def _page_query(self, number):
+        return self.query_prefix + urlencode({self.page_kwarg: number})
+
+    def _rows_query(self, number=None, cursor=None):
+        """
+        Запрос строк страницы (с одной лишней строкой для проверки следующей)
+
+        Returns:
+            tuple: QuerySet и функция, собирающая KeysetPage из списка строк
+
+        Raises:
+            InvalidPage: Если номер вне первых numbered_pages или курсор неверен
+        """
+        if cursor:
+            direction, value, pk = decode_cursor(cursor)
+            field = self.field
+            if direction == 'n':
+                rows = self.queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__gt': pk})
+                ).order_by(f'-{field}', 'pk')
+            else:
+                rows = self.queryset.filter(
+                    Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__lt': pk})
+                ).order_by(field, '-pk')
+            return rows[:self.per_page + 1], partial(self._cursor_page, direction)
+
+        try:
+            number = int(number or 1)
+        except (TypeError, ValueError) as e:
+            raise InvalidPage('Номер страницы должен быть числом') from e
+        if not 1 <= number <= self.numbered_pages:
+            raise InvalidPage('Дальние страницы доступны только по курсору')
+
+        offset = (number - 1) * self.per_page
+        rows = self.queryset.order_by(f'-{self.field}', 'pk')[offset:offset + self.per_page + 1]
+        return rows, partial(self._numbered_page, number)
+
+    def page(self, number=None, cursor=None):
+        """
+        Возвращает страницу по номеру или по курсору
+
+        Raises:
+            InvalidPage: Если номер вне первых numbered_pages или курсор неверен
+        """
+        rows, build = self._rows_query(number, cursor)
+        return build(list(rows))
+
+    async def apage(self, number=None, cursor=None):
+        """Асинхронный вариант page() для асинхронных представлений"""
+        rows, build = self._rows_query(number, cursor)
+        return build([row async for row in rows])
+
+    def _numbered_page(self, number, rows):
+        if number > 1 and not rows:
+            raise InvalidPage('Страница не содержит результатов')
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        previous_query = self._page_query(number - 1) if number > 1 else ''
+        next_query = ''
+        if has_next:
+            next_query = self._page_query(number + 1) if number < self.numbered_pages \
+                else self._cursor_query('n', rows[-1])
+        return KeysetPage(self, rows, number, previous_query, next_query)
+
+    def _cursor_page(self, direction, rows):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+        if not rows:
+            raise InvalidPage('Страница не содержит результатов')
+
+        has_next = has_more if direction == 'n' else True
+        has_previous = has_more if direction == 'p' else True
+        return KeysetPage(
+            self, rows, None,
+            self._cursor_query('p', rows[0]) if has_previous else '',
+            self._cursor_query('n', rows[-1]) if has_next else '',
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    Примесь для ListView, включающая курсорную пагинацию
+
+    Атрибуты:
+        pagination_mode (str): 'keyset' или 'offset' (стандартный Paginator)
+        keyset_field (str): Поле сортировки по убыванию
+        keyset_numbered_pages (int): Сколько первых страниц доступно по номеру
+        cursor_kwarg (str): Имя GET-параметра курсора
+    """
+    pagination_mode = 'keyset'
+    keyset_field = 'publish'
+    keyset_numbered_pages = 3
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_paginator(self, queryset, page_size):
+        return KeysetPaginator(
+            queryset, page_size,
+            field=self.keyset_field,
+            numbered_pages=self.keyset_numbered_pages,
+            page_kwarg=self.page_kwarg,
+            cursor_kwarg=self.cursor_kwarg,
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.pagination_mode != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        page = getattr(self, 'keyset_page', None)
+        try:
+            if page is None:
+                page = paginator.page(
+                    number=self.request.GET.get(self.page_kwarg),
+                    cursor=self.request.GET.get(self.cursor_kwarg),
+                )
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def aload_keyset_page(self, queryset, page_size):
+        """
+        Загружает страницу асинхронным ORM до сборки контекста
+
+        Сохраняет ее в keyset_page, и paginate_queryset() уже не обращается к базе.
+
+        Raises:
+            Http404: Если номер страницы или курсор неверен
+        """
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        try:
+            self.keyset_page = await paginator.apage(
+                number=self.request.GET.get(self.page_kwarg),
+                cursor=self.request.GET.get(self.cursor_kwarg),
+            )
+        except InvalidPage as e:
+            raise Http404(str(e))
@@ -0,0 +1,267 @@
+"""
+Пул соединений с базой данных
+
+Django без пула открывает соединение (TCP и аутентификация) на каждый
+запрос при CONN_MAX_AGE = 0, а постоянные соединения (CONN_MAX_AGE > 0)
+привязаны к потоку и под ASGI, где у каждого запроса свой поток, не
+переиспользуются. Бэкенд filmblog.backends.postgresql_pool берет
+соединение из пула процесса при открытии и возвращает его при закрытии
+в конце запроса, поэтому одинаково работает с sync-воркерами gunicorn
+и под ASGI.
+
+Пул держит до size свободных соединений и открывает до max_overflow
+дополнительных под пиковую нагрузку; когда заняты все, запрос ждет
+освобождения не дольше timeout и получает PoolTimeout. Соединение,
+простоявшее дольше check_after секунд, перед выдачей проверяется,
+а старше recycle секунд - закрывается.
+
+Настройки задаются ключом POOL в DATABASES:
+
+    'POOL': {'size': 5, 'max_overflow': 5, 'timeout': 10,
+             'recycle': 1800, 'check_after': 30}
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+from . import instrumentation
+
+
+DEFAULTS = {
+    'size': 5,
+    'max_overflow': 5,
+    'timeout': 10.0,
+    'recycle': 1800.0,
+    'check_after': 30.0,
+}
+
+
+class PoolTimeout(OperationalError):
+    """Все соединения пула заняты дольше timeout"""
+
+
+class PooledConnection:
+    """
+    Соединение в пуле
+
+    Атрибуты:
+        connection: Соединение DB-API
+        created (float): Время открытия (time.monotonic)
+        released (float): Время возврата в пул
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.released = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений
+
+    Операции с соединениями передаются функциями, поэтому пул не зависит
+    от драйвера базы данных.
+
+    Атрибуты:
+        size (int): Сколько свободных соединений держать открытыми
+        max_overflow (int): Сколько соединений можно открыть сверх size
+        timeout (float): Сколько секунд ждать свободного соединения
+        recycle (float|None): Через сколько секунд закрывать соединение
+        check_after (float): После скольких секунд простоя проверять соединение
+    """
+
+    def __init__(self, is_usable, reset, close, size=5, max_overflow=5, timeout=10.0,
+                 recycle=1800.0, check_after=30.0):
+        self.is_usable = is_usable
+        self.reset = reset
+        self.close = close
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check_after = check_after
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._stats = dict.fromkeys((
+            'created', 'closed', 'checkouts', 'waits', 'timeouts', 'failed_checks',
+        ), 0)
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    @property
+    def limit(self):
+        return self.size + self.max_overflow
+
+    def _expired(self, pooled, now):
+        return self.recycle is not None and now - pooled.created > self.recycle
+
+    def _increment(self, name):
+        with self._condition:
+            self._stats[name] += 1
+
+    def _discard(self, pooled):
+        self._increment('closed')
+        try:
+            self.close(pooled.connection)
+        except Exception:
+            pass
+
+    def checkout(self, connect):
+        """
+        Выдает соединение из пула или открывает новое
+
+        Args:
+            connect (callable): Открывает новое соединение DB-API
+
+        Returns:
+            Соединение DB-API
+
+        Raises:
+            PoolTimeout: Если свободного соединения нет дольше timeout
+        """
+        start = time.monotonic()
+        with self._condition:
+            self._stats['checkouts'] += 1
+            waited = False
+            while not self._idle and len(self._in_use) >= self.limit:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'Нет свободного соединения за {self.timeout} с (занято {len(self._in_use)})'
+                    )
+                self._condition.wait(remaining)
+            if waited:
+                wait_time = time.monotonic() - start
+                self._stats['waits'] += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+                instrumentation.count('db_pool_wait')
+            pooled = self._idle.pop() if self._idle else None
+            # Место занимается до открытия соединения, чтобы не превысить limit
+            reservation = object()
+            self._in_use[reservation] = pooled
+
+        try:
+            pooled = self._validate(pooled, connect)
+        except BaseException:
+            with self._condition:
+                del self._in_use[reservation]
+                self._condition.notify()
+            raise
+        with self._condition:
+            del self._in_use[reservation]
+            self._in_use[id(pooled.connection)] = pooled
+        return pooled.connection
+
+    def _validate(self, pooled, connect):
+        """Проверяет выданное соединение и при необходимости заменяет его новым"""
+        now = time.monotonic()
+        if pooled is not None:
+            if self._expired(pooled, now) or getattr(pooled.connection, 'closed', False):
+                self._discard(pooled)
+                pooled = None
+            elif now - pooled.released >= self.check_after and not self.is_usable(pooled.connection):
+                self._increment('failed_checks')
+                self._discard(pooled)
+                pooled = None
+        if pooled is None:
+            instrumentation.count('db_connect')
+            pooled = PooledConnection(connect())
+            self._increment('created')
+        return pooled
+
+    def checkin(self, connection):
+        """
+        Возвращает соединение в пул
+
+        Незавершенная транзакция откатывается. Соединения сверх size,
+        устаревшие и сломанные закрываются.
+        """
+        with self._condition:
+            pooled = self._in_use.pop(id(connection), None)
+            self._condition.notify()
+        if pooled is None:
+            pooled = PooledConnection(connection)
+        try:
+            self.reset(connection)
+            usable = not getattr(connection, 'closed', False)
+        except Exception:
+            usable = False
+        now = time.monotonic()
+        with self._condition:
+            if usable and not self._expired(pooled, now) and len(self._idle) < self.size:
+                pooled.released = now
+                self._idle.append(pooled)
+                self._condition.notify()
+                return
+        self._discard(pooled)
+
+    def dispose(self):
+        """Закрывает свободные соединения"""
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self):
+        """
+        Метрики пула
+
+        Returns:
+            dict: Размеры, число выдач, ожиданий и время ожидания
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'wait_ms_total': round(self._wait_time * 1000, 2),
+                'wait_ms_max': round(self._max_wait_time * 1000, 2),
+            })
+        return stats
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """
+    Возвращает пул процесса по ключу, создавая его функцией factory
+
+    После fork дочерний процесс получает пустой реестр: соединения
+    родителя нельзя использовать из другого процесса.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def all_stats():
+    """Метрики всех пулов процесса по ключу"""
+    with _pools_lock:
+        pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    return {key: pool.stats() for key, pool in pools.items()}
+
+
+def dispose_all():
+    """Закрывает свободные соединения всех пулов процесса"""
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    for pool in pools:
+        pool.dispose()
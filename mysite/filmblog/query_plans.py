@@ -0,0 +1,106 @@
+"""
+Проверка планов самых частых запросов к постам
+
+hot_queries() собирает те же запросы, что выполняют представления,
+с реальными значениями из базы. check() выполняет для каждого EXPLAIN,
+находит последовательные сканирования таблиц и проверяет, что запрос
+использует рассчитанный на него индекс (см. Post.Meta.indexes).
+
+В PostgreSQL на маленькой таблице планировщик честно выбирает Seq Scan,
+поэтому по умолчанию проверка идет с enable_seqscan = off: проверяется,
+что индекс подходит запросу, а не то, выгоден ли он на текущих данных.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Post
+
+
+HotQuery = namedtuple('HotQuery', 'name queryset index')
+PlanReport = namedtuple('PlanReport', 'name index uses_index seq_scans plan')
+
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    # В SQLite полный просмотр - SCAN без USING INDEX
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! USING)'),
+}
+
+
+def hot_queries():
+    """
+    Запросы представлений с образцами значений из базы
+
+    Returns:
+        list: HotQuery(имя, QuerySet, имя индекса или None)
+    """
+    sample = Post.published.only('slug', 'publish', 'pk').first()
+    publish = sample.publish if sample else timezone.now()
+    slug = sample.slug if sample else 'sample'
+    pk = sample.pk if sample else 0
+    tag_id = sample.tags.values_list('pk', flat=True).first() if sample else None
+    day = timezone.localtime(publish)
+    page_size = 9
+
+    return [
+        HotQuery('post_list', Post.published.order_by('-publish', 'pk')[:page_size],
+                 'post_published_idx'),
+        HotQuery('post_list_cursor',
+                 Post.published.filter(Q(publish__lt=publish) | Q(publish=publish, pk__gt=pk))
+                 .order_by('-publish', 'pk')[:page_size],
+                 'post_published_idx'),
+        HotQuery('post_detail',
+                 Post.published.published_on(day.year, day.month, day.day).filter(slug=slug),
+                 'post_slug_publish_idx'),
+        HotQuery('post_navigation',
+                 Post.published.filter(Q(publish__lt=publish) | Q(publish=publish, pk__lt=pk))
+                 .order_by('-publish', '-pk')[:1],
+                 'post_published_idx'),
+        HotQuery('post_manage', Post.objects.order_by('-created', 'pk')[:11], 'post_created_idx'),
+        # Список тега идет от связей taggit, индекс поста здесь не обязателен
+        HotQuery('post_list_by_tag',
+                 Post.published.filter(tags__id=tag_id).order_by('-publish', 'pk')[:page_size],
+                 None),
+    ]
+
+
+def explain(queryset, force_index=True):
+    """
+    Возвращает план запроса
+
+    Args:
+        queryset (QuerySet): Запрос
+        force_index (bool): В PostgreSQL запретить Seq Scan, если есть альтернатива
+    """
+    if connection.vendor != 'postgresql' or not force_index:
+        return queryset.explain()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+def check(force_index=True):
+    """
+    Проверяет планы всех частых запросов
+
+    Returns:
+        list: PlanReport для каждого запроса
+    """
+    pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise NotImplementedError(f'Разбор планов {connection.vendor} не поддерживается')
+    reports = []
+    for query in hot_queries():
+        plan = explain(query.queryset, force_index)
+        reports.append(PlanReport(
+            name=query.name,
+            index=query.index,
+            uses_index=query.index is None or query.index in plan,
+            seq_scans=sorted(set(pattern.findall(plan))),
+            plan=plan,
+        ))
+    return reports
@@ -0,0 +1,377 @@
+"""
+Полнотекстовый поиск по постам
+
+В PostgreSQL используется tsvector с GIN-индексом и русской морфологией,
+для SQLite (тесты, локальная разработка) - инвертированный индекс в памяти
+процесса. Оба бэкенда работают с таблицей PostSearchDocument, которая
+обновляется сигналами при сохранении и удалении постов.
+"""
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Max
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+
+from .models import Post, PostSearchDocument
+
+
+SEARCH_CONFIG = 'russian'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Окончания, которые отбрасывает упрощенный стеммер in-memory бэкенда
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ой', 'ей', 'ий', 'ый', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ую', 'юю', 'ия', 'ья',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+# Веса полей, как у setweight A/B в PostgreSQL
+TITLE_WEIGHT = 1.0
+DOCUMENT_WEIGHT = 0.4
+
+
+def build_document(post):
+    """
+    Собирает текст поискового документа поста
+
+    Args:
+        post (Post): Пост
+
+    Returns:
+        str: Превью и тело поста без HTML-разметки
+    """
+    return ' '.join(
+        part for part in (post.preview, strip_tags(post.body or '')) if part
+    )
+
+
+def stem(word):
+    """Приводит слово к упрощенной основе"""
+    word = word.lower().replace('ё', 'е')
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Разбивает текст на основы слов"""
+    return [stem(token) for token in TOKEN_RE.findall(text or '')]
+
+
+class SearchResults:
+    """
+    Ленивый результат поиска, совместимый с Paginator
+
+    Количество результатов берется из индекса, а посты загружаются
+    только для запрошенного среза в порядке релевантности.
+    """
+
+    def __init__(self, backend, query):
+        self.backend = backend
+        self.query = query
+        self._count = None
+        self._fetched = {}
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        return self.count() > 0
+
+    def __iter__(self):
+        return iter(self[:self.count()])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if (start, stop) in self._fetched:
+            return self._fetched[start, stop]
+        ranked = self.backend.ranked_ids(self.query, start, stop)
+        posts = Post.published.cards().in_bulk([post_id for post_id, rank in ranked])
+        return self._ranked_posts(ranked, posts)
+
+    async def afetch(self, start, stop):
+        """
+        Загружает срез результатов асинхронно
+
+        Количество и ранжирование считает бэкенд (в потоке, его индекс
+        синхронный), посты загружаются асинхронным ORM. Следующее
+        обращение к тому же срезу, например из Paginator, не идет в базу.
+        """
+        count = await sync_to_async(self.count)()
+        stop = min(stop, count)
+        ranked = await sync_to_async(self.backend.ranked_ids)(self.query, start, stop)
+        posts = await Post.published.cards().ain_bulk([post_id for post_id, rank in ranked])
+        self._fetched[start, stop] = self._ranked_posts(ranked, posts)
+        return self._fetched[start, stop]
+
+    @staticmethod
+    def _ranked_posts(ranked, posts):
+        results = []
+        for post_id, rank in ranked:
+            post = posts.get(post_id)
+            if post is not None:
+                post.rank = rank
+                results.append(post)
+        return results
+
+
+class BaseSearchBackend(ABC):
+    """
+    Общий интерфейс поисковых бэкендов
+
+    Хранение документов в PostSearchDocument общее, подсчет и ранжирование
+    результатов реализует каждый бэкенд.
+    """
+
+    def update(self, post):
+        """
+        Обновляет поисковый документ поста
+
+        Неопубликованные посты удаляются из индекса.
+        """
+        if post.status != 'published':
+            self.remove(post.pk)
+            return None
+        document, _ = PostSearchDocument.objects.update_or_create(
+            post_id=post.pk,
+            defaults={'title': post.title, 'document': build_document(post)}
+        )
+        return document
+
+    def update_many(self, posts):
+        """
+        Индексирует опубликованные посты пачкой, без сигналов и по запросу на пачку
+
+        Используется при массовой загрузке постов через bulk_create.
+
+        Args:
+            posts (list): Посты, еще не проиндексированные
+
+        Returns:
+            list: Идентификаторы проиндексированных постов
+        """
+        documents = [
+            PostSearchDocument(post_id=post.pk, title=post.title, document=build_document(post))
+            for post in posts if post.status == 'published'
+        ]
+        PostSearchDocument.objects.bulk_create(documents)
+        return [document.post_id for document in documents]
+
+    def remove(self, post_id):
+        """Удаляет поисковый документ поста"""
+        PostSearchDocument.objects.filter(post_id=post_id).delete()
+
+    def search(self, query):
+        """
+        Выполняет поиск
+
+        Args:
+            query (str): Поисковый запрос
+
+        Returns:
+            SearchResults: Ленивый результат поиска
+        """
+        return SearchResults(self, query)
+
+    @abstractmethod
+    def count(self, query):
+        """Возвращает количество найденных постов"""
+
+    @abstractmethod
+    def ranked_ids(self, query, start, stop):
+        """Возвращает список (post_id, rank) для среза результатов"""
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Поиск по tsvector с GIN-индексом и русской морфологией"""
+
+    def update(self, post):
+        from django.contrib.postgres.search import SearchVector
+
+        document = super().update(post)
+        if document is not None:
+            PostSearchDocument.objects.filter(pk=document.pk).update(
+                vector=SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+                       SearchVector('document', weight='B', config=SEARCH_CONFIG)
+            )
+        return document
+
+    def update_many(self, posts):
+        from django.contrib.postgres.search import SearchVector
+
+        post_ids = super().update_many(posts)
+        PostSearchDocument.objects.filter(post_id__in=post_ids).update(
+            vector=SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+                   SearchVector('document', weight='B', config=SEARCH_CONFIG)
+        )
+        return post_ids
+
+    def _matches(self, query):
+        from django.contrib.postgres.search import SearchQuery
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return PostSearchDocument.objects.filter(vector=search_query), search_query
+
+    def count(self, query):
+        matches, _ = self._matches(query)
+        return matches.count()
+
+    def ranked_ids(self, query, start, stop):
+        from django.contrib.postgres.search import SearchRank
+
+        matches, search_query = self._matches(query)
+        return list(
+            matches.annotate(rank=SearchRank(F('vector'), search_query))
+            .order_by('-rank', '-post__publish')
+            .values_list('post_id', 'rank')[start:stop]
+        )
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Инвертированный индекс в памяти процесса
+
+    Индекс строится из PostSearchDocument и перестраивается, когда версия
+    таблицы (количество строк и время последнего обновления) расходится
+    с загруженной, поэтому процессы не расходятся между собой.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._last = (None, None, [])
+
+    def _table_version(self):
+        return tuple(PostSearchDocument.objects.aggregate(
+            total=Count('pk'), updated=Max('updated')
+        ).values())
+
+    def _index(self, post_id, title, document):
+        self._unindex(post_id)
+        weights = defaultdict(float)
+        for term in tokenize(title):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(document):
+            weights[term] += DOCUMENT_WEIGHT
+        for term, weight in weights.items():
+            self._postings[term][post_id] = weight
+        self._terms[post_id] = set(weights)
+
+    def _unindex(self, post_id):
+        for term in self._terms.pop(post_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(post_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _ensure_loaded(self):
+        version = self._table_version()
+        if version == self._version:
+            return
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._terms = {}
+            rows = PostSearchDocument.objects.values_list('post_id', 'title', 'document')
+            for post_id, title, document in rows.iterator():
+                self._index(post_id, title, document)
+            self._version = version
+
+    def _in_sync(self):
+        return self._version is not None and self._version == self._table_version()
+
+    def update(self, post):
+        in_sync = self._in_sync()
+        document = super().update(post)
+        with self._lock:
+            self._unindex(post.pk)
+            if document is not None:
+                self._index(document.post_id, document.title, document.document)
+            # Если индекс уже отставал от таблицы, он будет перестроен при поиске
+            self._version = self._table_version() if in_sync else None
+        return document
+
+    def remove(self, post_id):
+        in_sync = self._in_sync()
+        super().remove(post_id)
+        with self._lock:
+            self._unindex(post_id)
+            self._version = self._table_version() if in_sync else None
+
+    def _rank(self, query):
+        self._ensure_loaded()
+        version, last_query, ranked = self._last
+        if version == self._version and last_query == query:
+            return ranked
+        ranked = self._score(query)
+        self._last = (self._version, query, ranked)
+        return ranked
+
+    def _score(self, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        total = max(len(self._terms), 1)
+        scores = None
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                return []
+            idf = math.log(1 + total / len(postings))
+            if scores is None:
+                scores = {post_id: weight * idf for post_id, weight in postings.items()}
+            else:
+                scores = {
+                    post_id: score + postings[post_id] * idf
+                    for post_id, score in scores.items() if post_id in postings
+                }
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    def count(self, query):
+        return len(self._rank(query))
+
+    def ranked_ids(self, query, start, stop):
+        return self._rank(query)[start:stop]
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Возвращает поисковый бэкенд
+
+    Бэкенд можно задать настройкой FILMBLOG_SEARCH_BACKEND, иначе он
+    выбирается по типу базы данных.
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'FILMBLOG_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        elif connection.vendor == 'postgresql':
+            backend_class = PostgresSearchBackend
+        else:
+            backend_class = InMemorySearchBackend
+        _backend = backend_class()
+    return _backend
@@ -0,0 +1,346 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag
+
+from . import conditional, export, facets, fragments, media, navigation, syndication, tags
+from .images import renditions_outdated
+from .jobs import enqueue, schedule_export
+from .models import Post
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Post)
+def update_search_document(sender, instance, **kwargs):
+    """Обновляет поисковый документ после сохранения поста"""
+    get_search_backend().update(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_search_document(sender, instance, **kwargs):
+    """Удаляет поисковый документ вместе с постом"""
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def enqueue_post_renditions(sender, instance, **kwargs):
+    """Ставит в очередь создание уменьшенных копий, если исходники изменились"""
+    if renditions_outdated(instance):
+        enqueue('renditions', instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, **kwargs):
+    """
+    Запоминает состояние поста до сохранения
+
+    Дата публикации сохраняется, только если пост был опубликован.
+    """
+    previous = {}
+    if instance.pk:
+        previous = Post.objects.filter(pk=instance.pk) \
+            .values('status', 'publish', 'title', 'slug', *media.MEDIA_FIELDS).first() or {}
+    instance._previous_state = previous
+    instance._published_before = previous['publish'] \
+        if previous.get('status') == 'published' else None
+
+
+@receiver(post_save, sender=Post)
+def update_file_references(sender, instance, **kwargs):
+    """Обновляет счетчики ссылок на файлы изображений поста"""
+    current = {field: getattr(instance, field).name for field in media.MEDIA_FIELDS}
+    media.update_references(getattr(instance, '_previous_state', {}), current)
+
+
+@receiver(post_delete, sender=Post)
+def release_file_references(sender, instance, **kwargs):
+    """Освобождает файлы удаленного поста для сборки мусора"""
+    current = {field: getattr(instance, field).name for field in media.MEDIA_FIELDS}
+    media.update_references(current, {})
+
+
+@receiver(post_save, sender=Post)
+def evict_post_list_fragments(sender, instance, **kwargs):
+    """
+    Вытесняет из кэша страницы списков, затронутые сохранением поста
+
+    Правка опубликованного поста без смены даты затрагивает одну страницу,
+    публикация, снятие с публикации и смена даты - все последующие.
+    """
+    published_before = getattr(instance, '_published_before', None)
+    published_now = instance.publish if instance.status == 'published' else None
+    if published_before is None and published_now is None:
+        return
+
+    tag_slugs = list(instance.tags.values_list('slug', flat=True))
+    for tag_slug in [None, *tag_slugs]:
+        if published_before == published_now:
+            fragments.evict_page(tag_slug, published_now)
+        else:
+            fragments.evict_pages_from(
+                tag_slug, *[date for date in (published_before, published_now) if date]
+            )
+
+
+@receiver(post_save, sender=Post)
+def evict_post_navigation(sender, instance, **kwargs):
+    """
+    Вытесняет навигацию поста и его соседей до и после сохранения
+
+    Правка текста поста навигацию не затрагивает.
+    """
+    published_before = getattr(instance, '_published_before', None)
+    published_now = instance.publish if instance.status == 'published' else None
+    if published_before is None and published_now is None:
+        return
+    previous = getattr(instance, '_previous_state', {})
+    if published_before == published_now and all(
+        previous.get(field) == getattr(instance, field) for field in ('title', 'slug')
+    ):
+        return
+    navigation.evict_around(
+        instance.pk, *[date for date in (published_before, published_now) if date]
+    )
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_tags(sender, instance, **kwargs):
+    """Запоминает теги удаляемого поста до удаления связей"""
+    tag_values = list(instance.tags.values_list('pk', 'slug'))
+    instance._tag_ids = [pk for pk, _ in tag_values]
+    instance._tag_slugs = [slug for _, slug in tag_values]
+
+
+@receiver(post_delete, sender=Post)
+def evict_deleted_post_fragments(sender, instance, **kwargs):
+    """Вытесняет страницы списков, с которых пропал удаленный пост"""
+    if instance.status != 'published':
+        return
+    for tag_slug in [None, *getattr(instance, '_tag_slugs', [])]:
+        fragments.evict_pages_from(tag_slug, instance.publish)
+
+
+@receiver(post_delete, sender=Post)
+def evict_deleted_post_navigation(sender, instance, **kwargs):
+    """Вытесняет навигацию соседей удаленного поста"""
+    if instance.status == 'published':
+        navigation.evict_around(instance.pk, instance.publish)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def evict_tag_fragments(sender, instance, action, pk_set, **kwargs):
+    """
+    Вытесняет страницы при изменении тегов поста
+
+    В общем списке меняется только карточка поста, а в списках тегов
+    пост появляется или пропадает, сдвигая последующие страницы.
+    """
+    if not isinstance(instance, Post) or instance.status != 'published':
+        return
+    if action == 'pre_clear':
+        instance._tag_slugs = list(instance.tags.values_list('slug', flat=True))
+        return
+    if action == 'post_clear':
+        tag_slugs = getattr(instance, '_tag_slugs', [])
+    elif action in ('post_add', 'post_remove'):
+        tag_slugs = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+    else:
+        return
+
+    fragments.evict_page(None, instance.publish)
+    for tag_slug in tag_slugs:
+        fragments.evict_pages_from(tag_slug, instance.publish)
+    navigation.evict(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def refresh_post_tag_stats(sender, instance, **kwargs):
+    """Пересчитывает статистику тегов при публикации, снятии с публикации и смене даты"""
+    published_before = getattr(instance, '_published_before', None)
+    published_now = instance.publish if instance.status == 'published' else None
+    if published_before != published_now:
+        tags.refresh(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def refresh_deleted_post_tag_stats(sender, instance, **kwargs):
+    """Пересчитывает статистику тегов удаленного опубликованного поста"""
+    if instance.status == 'published':
+        tags.refresh(getattr(instance, '_tag_ids', []))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_tag_stats(sender, instance, action, pk_set, **kwargs):
+    """Пересчитывает статистику тегов, добавленных к опубликованному посту или снятых с него"""
+    if not isinstance(instance, Post) or instance.status != 'published':
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        tags.refresh(getattr(instance, '_cleared_tag_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        tags.refresh(pk_set)
+
+
+@receiver(post_save, sender=Post)
+def refresh_post_facets(sender, instance, **kwargs):
+    """Пересчитывает фасеты снимка при публикации и снятии с публикации"""
+    previous = getattr(instance, '_previous_state', {})
+    if previous and (previous.get('status') == 'published') != (instance.status == 'published'):
+        facets.refresh(facets.post_pairs([instance.pk]))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_facets(sender, instance, **kwargs):
+    instance._facet_pairs = facets.post_pairs([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def refresh_deleted_post_facets(sender, instance, **kwargs):
+    """Пересчитывает фасеты удаленного опубликованного поста"""
+    if instance.status == 'published':
+        facets.refresh(getattr(instance, '_facet_pairs', set()))
+
+
+@receiver(post_save, sender=Tag)
+def refresh_saved_tag_stats(sender, instance, **kwargs):
+    """Создает статистику нового тега и обновляет имя и слаг переименованного"""
+    tags.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+def forget_deleted_tag(sender, instance, **kwargs):
+    tags.bump_version()
+
+
+@receiver(post_save, sender=Post)
+def evict_saved_post_syndication(sender, instance, **kwargs):
+    """
+    Вытесняет фрагмент карты сайта с постом и ленты с ним
+
+    При публикации, снятии с публикации и смене даты меняются и даты
+    последней публикации в списках тегов поста.
+    """
+    published_before = getattr(instance, '_published_before', None)
+    published_now = instance.publish if instance.status == 'published' else None
+    if published_before is None and published_now is None:
+        return
+    tag_values = list(instance.tags.values_list('pk', 'slug'))
+    syndication.evict_posts([instance.pk])
+    syndication.evict_feeds(None, *[slug for _, slug in tag_values])
+    if published_before != published_now:
+        syndication.evict_tags([pk for pk, _ in tag_values])
+
+
+@receiver(post_delete, sender=Post)
+def evict_deleted_post_syndication(sender, instance, **kwargs):
+    """Вытесняет фрагмент карты сайта и ленты удаленного опубликованного поста"""
+    if instance.status != 'published':
+        return
+    syndication.evict_posts([instance.pk])
+    syndication.evict_tags(getattr(instance, '_tag_ids', []))
+    syndication.evict_feeds(None, *getattr(instance, '_tag_slugs', []))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def evict_tag_syndication(sender, instance, action, pk_set, **kwargs):
+    """Вытесняет ленты и фрагменты карты сайта тегов, добавленных к посту или снятых с него"""
+    if not isinstance(instance, Post) or instance.status != 'published':
+        return
+    if action == 'pre_clear':
+        instance._syndication_tags = list(instance.tags.values_list('pk', 'slug'))
+        return
+    if action == 'post_clear':
+        tag_values = getattr(instance, '_syndication_tags', [])
+    elif action in ('post_add', 'post_remove'):
+        tag_values = Tag.objects.filter(pk__in=pk_set).values_list('pk', 'slug')
+    else:
+        return
+    tag_values = list(tag_values)
+    syndication.evict_tags([pk for pk, _ in tag_values])
+    syndication.evict_feeds(*[slug for _, slug in tag_values])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def evict_saved_tag_syndication(sender, instance, **kwargs):
+    """Вытесняет фрагмент карты сайта и ленты переименованного или удаленного тега"""
+    syndication.evict_tags([instance.pk])
+    syndication.evict_feeds(instance.slug)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(m2m_changed, sender=Post.tags.through)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_content_version(sender, **kwargs):
+    """Меняет ETag и Last-Modified публичных страниц"""
+    conditional.bump()
+
+
+@receiver(post_save, sender=Post)
+def export_saved_post(sender, instance, **kwargs):
+    """
+    Перерисовывает в статической копии страницы, затронутые сохранением поста
+
+    Соседи обновляются, только если в их ссылках могли измениться
+    дата, заголовок или слаг поста.
+    """
+    published_before = getattr(instance, '_published_before', None)
+    published_now = instance.publish if instance.status == 'published' else None
+    if published_before is None and published_now is None or not export.enabled():
+        return
+    previous = getattr(instance, '_previous_state', {})
+    urls = [Post(slug=previous['slug'], publish=published_before).get_absolute_url()] \
+        if published_before else []
+    dates = []
+    if published_before != published_now or any(
+        previous.get(field) != getattr(instance, field) for field in ('title', 'slug')
+    ):
+        dates = [date for date in (published_before, published_now) if date]
+    schedule_export(export.post_paths(instance, dates, urls))
+
+
+@receiver(post_delete, sender=Post)
+def export_deleted_post(sender, instance, **kwargs):
+    """Удаляет из статической копии страницу поста и обновляет соседей и списки"""
+    if instance.status == 'published' and export.enabled():
+        schedule_export(export.post_paths(
+            instance, [instance.publish], [instance.get_absolute_url()],
+            getattr(instance, '_tag_slugs', []),
+        ))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def export_post_tags(sender, instance, action, pk_set, **kwargs):
+    """Обновляет в статической копии страницу поста и списки добавленных и снятых тегов"""
+    if not isinstance(instance, Post) or instance.status != 'published' \
+            or not export.enabled():
+        return
+    if action == 'pre_clear':
+        instance._export_tag_slugs = list(instance.tags.values_list('slug', flat=True))
+        return
+    if action == 'post_clear':
+        tag_slugs = getattr(instance, '_export_tag_slugs', [])
+    elif action in ('post_add', 'post_remove'):
+        tag_slugs = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+    else:
+        return
+    schedule_export(export.post_paths(instance, tag_slugs=tag_slugs))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def export_tag(sender, instance, **kwargs):
+    """
+    Обновляет в статической копии списки тега и страницы его постов
+
+    Списки под прежним слагом переименованного тега и страницы постов
+    удаленного тега (его связи уже удалены) обновит manage.py export_site --full.
+    """
+    if not export.enabled():
+        return
+    paths = set(export.list_paths(instance.slug))
+    for values in Post.published.filter(tags__id=instance.pk).values('pk', 'slug', 'publish'):
+        paths.add(Post(**values).get_absolute_url())
+    schedule_export(paths)
@@ -0,0 +1,115 @@
+/* ===================================================================
+ * Возобновляемая загрузка больших изображений частями
+ *
+ * Поля <input type="file" data-chunked-upload="<имя скрытого поля>">
+ * загружаются по частям перед отправкой формы. id загрузки записывается
+ * в скрытое поле, а само поле файла очищается. После обрыва загрузка
+ * продолжается с последнего принятого байта.
+ * ------------------------------------------------------------------- */
+
+(function() {
+
+    "use strict";
+
+    var CHUNK_SIZE = 4 * 1024 * 1024;
+    var THRESHOLD = 8 * 1024 * 1024;
+
+    var csrfToken = function(form) {
+        var input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        return input ? input.value : '';
+    };
+
+    var storageKey = function(file) {
+        return 'chunked-upload:' + [file.name, file.size, file.lastModified].join(':');
+    };
+
+    var request = function(method, url, token, body, headers) {
+        headers = headers || {};
+        headers['X-CSRFToken'] = token;
+        return fetch(url, {method: method, body: body, headers: headers, credentials: 'same-origin'})
+            .then(function(response) {
+                return response.json().then(function(data) {
+                    if (!response.ok && response.status !== 409) {
+                        throw new Error(data.error || response.statusText);
+                    }
+                    return data;
+                });
+            });
+    };
+
+    var start = function(startUrl, token, file) {
+        var saved = localStorage.getItem(storageKey(file));
+        if (saved) {
+            return request('GET', saved, token).catch(function() {
+                localStorage.removeItem(storageKey(file));
+                return start(startUrl, token, file);
+            }).then(function(data) {
+                data.url = data.url || saved;
+                return data;
+            });
+        }
+        var body = new FormData();
+        body.append('filename', file.name);
+        body.append('size', file.size);
+        return request('POST', startUrl, token, body).then(function(data) {
+            data.url = startUrl + data.id + '/';
+            localStorage.setItem(storageKey(file), data.url);
+            return data;
+        });
+    };
+
+    var send = function(data, token, file, progress) {
+        if (data.offset >= file.size) {
+            localStorage.removeItem(storageKey(file));
+            return Promise.resolve(data);
+        }
+        var chunk = file.slice(data.offset, data.offset + CHUNK_SIZE);
+        return request('PUT', data.url, token, chunk, {'Upload-Offset': String(data.offset)})
+            .then(function(status) {
+                status.url = data.url;
+                progress(status.offset / file.size);
+                return send(status, token, file, progress);
+            });
+    };
+
+    var upload = function(form, input) {
+        var file = input.files[0];
+        var hidden = form.querySelector('input[name="' + input.dataset.chunkedUpload + '"]');
+        var token = csrfToken(form);
+        var label = form.querySelector('label[for="' + input.id + '"]');
+        var progress = function(ratio) {
+            if (label) {
+                label.dataset.progress = Math.round(ratio * 100) + '%';
+            }
+        };
+        return start(form.dataset.uploadUrl, token, file)
+            .then(function(data) { return send(data, token, file, progress); })
+            .then(function(data) {
+                hidden.value = data.id;
+                input.value = '';
+            });
+    };
+
+    document.addEventListener('submit', function(event) {
+        var form = event.target;
+        if (!form.dataset.uploadUrl || form.dataset.uploading) {
+            return;
+        }
+        var inputs = Array.prototype.filter.call(
+            form.querySelectorAll('input[type="file"][data-chunked-upload]'),
+            function(input) { return input.files.length && input.files[0].size > THRESHOLD; }
+        );
+        if (!inputs.length) {
+            return;
+        }
+        event.preventDefault();
+        form.dataset.uploading = '1';
+        Promise.all(inputs.map(function(input) { return upload(form, input); }))
+            .then(function() { form.submit(); })
+            .catch(function(error) {
+                delete form.dataset.uploading;
+                alert('Ошибка загрузки: ' + error.message);
+            });
+    });
+
+})();
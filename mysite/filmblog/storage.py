@@ -0,0 +1,67 @@
+"""
+Хранилище медиафайлов с адресацией по содержимому
+
+Файл сохраняется под именем cas/ab/cd/<sha256><расширение>, поэтому
+повторная загрузка того же скана не создает копию, каталоги не разрастаются,
+а URL файла никогда не меняет содержимое и может кэшироваться навсегда
+(Cache-Control: immutable, см. location /images/ в config/nginx_static.conf).
+Учет ссылок и удаление неиспользуемых файлов - в filmblog.media.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+CAS_PREFIX = 'cas'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(content):
+    """
+    Возвращает SHA-256 содержимого файла
+
+    Использует хэш, посчитанный при потоковой загрузке, если он есть.
+    """
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+def content_name(digest, extension):
+    return f'{CAS_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+
+
+def digest_from_name(name):
+    """Извлекает хэш из имени файла в хранилище или возвращает None"""
+    if not name or not name.startswith(f'{CAS_PREFIX}/'):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage, сохраняющий файлы под хэшем содержимого
+
+    Если файл с таким содержимым уже есть, он не записывается повторно.
+    """
+
+    def _save(self, name, content):
+        name = content_name(content_hash(content), os.path.splitext(name)[1])
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
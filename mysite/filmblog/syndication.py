@@ -0,0 +1,296 @@
+"""
+Карта сайта (sitemap.xml) и ленты RSS и Atom
+
+Карта сайта - индекс sitemap.xml и файлы sitemap-<раздел>-<N>.xml
+не больше SHARD_SIZE адресов (предел протокола - 50 000). Раздел posts -
+страницы постов, lists - главная и списки тегов. Посты попадают в файлы
+по диапазонам id, поэтому пост не переходит из файла в файл, а изменение
+поста затрагивает один файл.
+
+Файл собирается из фрагментов по CHUNK_SIZE адресов, которые хранятся
+в кэше фрагментов (см. filmblog.fragments). Сигналы вытесняют только
+фрагмент измененного поста или тега и индекс; при следующем запросе
+из базы перечитывается только он. Ответ отдается потоком по фрагменту,
+посты читаются итератором, поэтому расход памяти не зависит от размера
+архива.
+
+Ленты (rss.xml, atom.xml, tag/<слаг>/rss.xml, tag/<слаг>/atom.xml) -
+FEED_ITEMS последних постов; лента хранится в кэше целиком и вытесняется
+при изменении поста или тегов, которые в нее входят.
+
+Адрес сайта в кэше заменен меткой SITE_URL и подставляется при отдаче,
+поэтому кэш не зависит от домена запроса.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Max
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+
+from .fragments import get_fragment_cache
+from .models import Post, TagStats
+
+
+SHARD_SIZE = 50000
+CHUNK_SIZE = 1000
+FEED_ITEMS = 20
+FEED_FORMATS = ('rss', 'atom')
+SITE_TITLE = 'D76 is art'
+# Символ, недопустимый в XML, - не встретится в тексте постов
+SITE_URL = '\x00'
+
+INDEX_KEY = 'filmblog:sitemap:index'
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+URLSET_START = f'{XML_DECLARATION}<urlset xmlns="{SITEMAP_NS}">\n'
+URLSET_END = '</urlset>\n'
+
+
+def xml_text(value):
+    """Экранирует текст для XML, удаляя недопустимые управляющие символы"""
+    value = ''.join(char for char in str(value) if char >= ' ' or char in '\t\n\r')
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+        .replace('"', '&quot;')
+
+
+def _url_entry(path, lastmod=None):
+    lastmod = f'<lastmod>{rfc3339_date(lastmod)}</lastmod>' if lastmod else ''
+    return f'<url><loc>{SITE_URL}{xml_text(path)}</loc>{lastmod}</url>\n'
+
+
+def _post_rows(first, last):
+    return Post.published.filter(pk__gte=first, pk__lt=last).order_by('pk') \
+        .values_list('pk', 'slug', 'publish', 'updated').iterator(chunk_size=CHUNK_SIZE)
+
+
+def _render_posts(first, last):
+    return ''.join(
+        _url_entry(Post(pk=pk, slug=slug, publish=publish).get_absolute_url(), updated)
+        for pk, slug, publish, updated in _post_rows(first, last)
+    )
+
+
+def _render_lists(first, last):
+    entries = [_url_entry(reverse('filmblog:index'))] if first == 0 else []
+    rows = TagStats.objects.filter(published_posts__gt=0, tag_id__gte=first, tag_id__lt=last) \
+        .order_by('tag_id').values_list('slug', 'latest_publish').iterator(chunk_size=CHUNK_SIZE)
+    entries.extend(_url_entry(reverse('filmblog:post_list_by_tag', args=[slug]), latest_publish)
+                   for slug, latest_publish in rows)
+    return ''.join(entries)
+
+
+# Раздел: (рендеринг диапазона id, строки для индекса, поле id, поле даты изменения)
+SECTIONS = {
+    'posts': (_render_posts, lambda: Post.published.all(), 'pk', 'updated'),
+    'lists': (_render_lists, lambda: TagStats.objects.filter(published_posts__gt=0),
+              'tag_id', 'latest_publish'),
+}
+
+
+def chunk_key(section, chunk):
+    return f'filmblog:sitemap:{section}:{chunk}'
+
+
+def get_chunk(section, chunk):
+    """
+    Фрагмент карты сайта из кэша или из базы
+
+    Args:
+        section (str): Раздел (posts или lists)
+        chunk (int): Номер фрагмента: id от chunk * CHUNK_SIZE до (chunk + 1) * CHUNK_SIZE
+
+    Returns:
+        str: Элементы <url> фрагмента с меткой SITE_URL вместо адреса сайта
+    """
+    cache = get_fragment_cache()
+    key = chunk_key(section, chunk)
+    xml = cache.get(key)
+    if xml is None:
+        render = SECTIONS[section][0]
+        xml = render(chunk * CHUNK_SIZE, (chunk + 1) * CHUNK_SIZE)
+        cache.set(key, xml, timeout=None)
+    return xml
+
+
+def sitemap_index():
+    """
+    Файлы карты сайта
+
+    Returns:
+        list: Кортежи (раздел, номер файла, дата изменения, последний id)
+    """
+    cache = get_fragment_cache()
+    shards = cache.get(INDEX_KEY)
+    if shards is None:
+        shards = []
+        for section, (_, queryset, id_field, lastmod_field) in SECTIONS.items():
+            rows = queryset().values(shard=F(id_field) / SHARD_SIZE) \
+                .annotate(lastmod=Max(lastmod_field), last=Max(id_field)).order_by('shard')
+            section_shards = [(section, row['shard'], row['lastmod'], row['last']) for row in rows]
+            if section == 'lists' and not any(shard == 0 for _, shard, _, _ in section_shards):
+                # Главная страница есть всегда
+                section_shards.insert(0, (section, 0, None, 0))
+            shards.extend(section_shards)
+        cache.set(INDEX_KEY, shards, timeout=None)
+    return shards
+
+
+def sitemap_index_parts():
+    yield f'{XML_DECLARATION}<sitemapindex xmlns="{SITEMAP_NS}">\n'
+    for section, shard, lastmod, _ in sitemap_index():
+        path = reverse('filmblog:sitemap_section', args=[section, shard])
+        lastmod = f'<lastmod>{rfc3339_date(lastmod)}</lastmod>' if lastmod else ''
+        yield f'<sitemap><loc>{SITE_URL}{path}</loc>{lastmod}</sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def sitemap_parts(section, shard):
+    """
+    Части файла карты сайта по фрагментам
+
+    Returns:
+        generator|None: Части XML или None, если такого файла нет
+    """
+    for shard_section, number, _, last in sitemap_index():
+        if (shard_section, number) == (section, shard):
+            break
+    else:
+        return None
+    return _sitemap_parts(section, shard, last)
+
+
+def _sitemap_parts(section, shard, last):
+    chunks_per_shard = SHARD_SIZE // CHUNK_SIZE
+    first_chunk = shard * chunks_per_shard
+    last_chunk = min(first_chunk + chunks_per_shard - 1, last // CHUNK_SIZE)
+    yield URLSET_START
+    for chunk in range(first_chunk, last_chunk + 1):
+        yield get_chunk(section, chunk)
+    yield URLSET_END
+
+
+def feed_key(feed_format, tag_slug=None):
+    return f'filmblog:feed:{feed_format}:{tag_slug or "*"}'
+
+
+def _feed_posts(tag):
+    queryset = Post.published.order_by('-publish', '-pk')
+    if tag is not None:
+        queryset = queryset.filter(tags__id=tag.id)
+    return queryset.values_list('pk', 'title', 'slug', 'publish', 'updated', 'excerpt')[:FEED_ITEMS]
+
+
+def render_feed(feed_format, tag=None):
+    """
+    Лента последних постов
+
+    Args:
+        feed_format (str): rss или atom
+        tag (TagInfo|None): Тег или None для всех постов
+
+    Returns:
+        str: XML ленты с меткой SITE_URL вместо адреса сайта
+    """
+    list_url = reverse('filmblog:post_list_by_tag', args=[tag.slug]) if tag \
+        else reverse('filmblog:index')
+    self_url = reverse(f'filmblog:{feed_format}_feed_by_tag', args=[tag.slug]) if tag \
+        else reverse(f'filmblog:{feed_format}_feed')
+    title = xml_text(f'{SITE_TITLE}: {tag.name}' if tag else SITE_TITLE)
+    items, updated = [], None
+    for pk, post_title, slug, publish, post_updated, excerpt in _feed_posts(tag):
+        link = SITE_URL + xml_text(Post(pk=pk, slug=slug, publish=publish).get_absolute_url())
+        updated = max(updated or post_updated, post_updated)
+        if feed_format == 'rss':
+            items.append(
+                f'<item><title>{xml_text(post_title)}</title><link>{link}</link>'
+                f'<guid isPermaLink="true">{link}</guid><pubDate>{rfc2822_date(publish)}</pubDate>'
+                f'<description>{xml_text(excerpt)}</description></item>\n'
+            )
+        else:
+            items.append(
+                f'<entry><title>{xml_text(post_title)}</title><link href="{link}" rel="alternate"/>'
+                f'<id>{link}</id><published>{rfc3339_date(publish)}</published>'
+                f'<updated>{rfc3339_date(post_updated)}</updated>'
+                f'<summary>{xml_text(excerpt)}</summary></entry>\n'
+            )
+    if feed_format == 'rss':
+        build_date = f'<lastBuildDate>{rfc2822_date(updated)}</lastBuildDate>' if updated else ''
+        return (
+            f'{XML_DECLARATION}<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">'
+            f'<channel><title>{title}</title><link>{SITE_URL}{list_url}</link>'
+            f'<description>{title}</description><language>{settings.LANGUAGE_CODE}</language>'
+            f'<atom:link href="{SITE_URL}{self_url}" rel="self"/>{build_date}\n'
+            f'{"".join(items)}</channel></rss>\n'
+        )
+    updated = rfc3339_date(updated) if updated else ''
+    return (
+        f'{XML_DECLARATION}<feed xmlns="http://www.w3.org/2005/Atom" '
+        f'xml:lang="{settings.LANGUAGE_CODE}"><title>{title}</title>'
+        f'<link href="{SITE_URL}{list_url}" rel="alternate"/>'
+        f'<link href="{SITE_URL}{self_url}" rel="self"/>'
+        f'<id>{SITE_URL}{list_url}</id><updated>{updated}</updated>\n'
+        f'{"".join(items)}</feed>\n'
+    )
+
+
+def get_feed(feed_format, tag=None):
+    """Лента из кэша или из базы (см. render_feed)"""
+    cache = get_fragment_cache()
+    key = feed_key(feed_format, tag.slug if tag else None)
+    xml = cache.get(key)
+    if xml is None:
+        xml = render_feed(feed_format, tag)
+        cache.set(key, xml, timeout=None)
+    return xml
+
+
+def evict_posts(post_ids):
+    """Вытесняет фрагменты карты сайта с постами и индекс"""
+    keys = {chunk_key('posts', pk // CHUNK_SIZE) for pk in post_ids}
+    get_fragment_cache().delete_many([INDEX_KEY, *keys])
+
+
+def evict_tags(tag_ids):
+    """Вытесняет фрагменты карты сайта со списками тегов и индекс"""
+    keys = {chunk_key('lists', pk // CHUNK_SIZE) for pk in tag_ids}
+    get_fragment_cache().delete_many([INDEX_KEY, *keys])
+
+
+def evict_feeds(*tag_slugs):
+    """
+    Вытесняет ленты
+
+    Args:
+        *tag_slugs (str|None): Слаги тегов, None - общая лента
+    """
+    get_fragment_cache().delete_many([
+        feed_key(feed_format, tag_slug) for feed_format in FEED_FORMATS for tag_slug in tag_slugs
+    ])
+
+
+def _with_site_url(parts, site_url):
+    for part in parts:
+        yield part.replace(SITE_URL, site_url)
+
+
+async def _aiter(parts):
+    """Отдает части синхронного генератора в async-коде, читая базу в потоке"""
+    parts = iter(parts)
+    while (part := await sync_to_async(next)(parts, None)) is not None:
+        yield part
+
+
+def streaming_response(request, parts, content_type):
+    """
+    Потоковый ответ из частей XML
+
+    Под ASGI (FILMBLOG_ASYNC_VIEWS) части отдаются асинхронным итератором:
+    синхронный Django прочитал бы их в память целиком.
+    """
+    site_url = request.build_absolute_uri('/').rstrip('/')
+    parts = _with_site_url(parts, xml_text(site_url))
+    if getattr(settings, 'FILMBLOG_ASYNC_VIEWS', False):
+        parts = _aiter(parts)
+    return StreamingHttpResponse(parts, content_type=f'{content_type}; charset=utf-8')
@@ -0,0 +1,133 @@
+"""
+Статистика тегов и индекс тегов в памяти процесса
+
+Таблица TagStats хранит для каждого тега число опубликованных постов
+и дату последней публикации. Ее обновляют сигналы при изменении тегов
+поста, публикации, снятии с публикации, смене даты и удалении поста.
+
+tag_index держит снимок таблицы в памяти процесса: поиск тега по слагу
+и меню популярных тегов не обращаются к базе. Снимок перечитывается,
+когда меняется версия в кэше фрагментов (ее увеличивает refresh()),
+и не реже чем раз в SNAPSHOT_TTL секунд - на случай, если процессы
+не делят кэш.
+"""
+import time
+from collections import namedtuple
+from threading import Lock
+
+from django.db.models import Count, Max
+from taggit.models import Tag
+
+from .fragments import get_fragment_cache
+from .models import Post, TagStats
+
+
+SNAPSHOT_TTL = 60
+VERSION_KEY = 'filmblog:tag_stats_version'
+
+TagInfo = namedtuple('TagInfo', 'id name slug published_posts latest_publish')
+
+
+def refresh(tag_ids):
+    """
+    Пересчитывает статистику указанных тегов
+
+    Args:
+        tag_ids (iterable): Идентификаторы тегов
+    """
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return
+    counts = {
+        row['tags__id']: row
+        for row in Post.published.filter(tags__id__in=tag_ids).values('tags__id').annotate(
+            published_posts=Count('pk'), latest_publish=Max('publish')
+        )
+    }
+    stats = [
+        TagStats(tag_id=tag['pk'], name=tag['name'], slug=tag['slug'],
+                 published_posts=counts.get(tag['pk'], {}).get('published_posts', 0),
+                 latest_publish=counts.get(tag['pk'], {}).get('latest_publish'))
+        for tag in Tag.objects.filter(pk__in=tag_ids).values('pk', 'name', 'slug')
+    ]
+    TagStats.objects.bulk_create(
+        stats, update_conflicts=True, unique_fields=['tag'],
+        update_fields=['name', 'slug', 'published_posts', 'latest_publish', 'updated'],
+    )
+    bump_version()
+
+
+def recount():
+    """
+    Пересчитывает статистику всех тегов
+
+    Returns:
+        int: Количество тегов
+    """
+    tag_ids = list(Tag.objects.values_list('pk', flat=True))
+    refresh(tag_ids)
+    return len(tag_ids)
+
+
+def bump_version():
+    """Сообщает процессам, что снимок статистики устарел"""
+    get_fragment_cache().set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def current_version():
+    cache = get_fragment_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Кэш очищен: снимки процессов могли устареть
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+class TagIndex:
+    """
+    Снимок статистики тегов в памяти процесса
+
+    Атрибуты:
+        by_slug (dict): TagInfo по слагу тега
+        popular (list): TagInfo тегов с опубликованными постами по убыванию их числа
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._loaded_at = 0.0
+        self.by_slug = {}
+        self.popular = []
+
+    def _ensure_loaded(self):
+        version = current_version()
+        if version == self._version and time.monotonic() - self._loaded_at < SNAPSHOT_TTL:
+            return
+        with self._lock:
+            rows = TagStats.objects.values_list(
+                'tag_id', 'name', 'slug', 'published_posts', 'latest_publish'
+            )
+            tags = [TagInfo(*row) for row in rows]
+            self.by_slug = {tag.slug: tag for tag in tags}
+            self.popular = [tag for tag in tags if tag.published_posts]
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    def get(self, slug):
+        """
+        Возвращает тег по слагу
+
+        Returns:
+            TagInfo|None: Тег или None, если его нет
+        """
+        self._ensure_loaded()
+        return self.by_slug.get(slug)
+
+    def most_popular(self, limit=None):
+        """Теги с опубликованными постами по убыванию их числа"""
+        self._ensure_loaded()
+        return self.popular[:limit]
+
+
+tag_index = TagIndex()
@@ -0,0 +1,56 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+def build_srcset(sources):
+    """Собирает значение атрибута srcset из списка [ширина, имя файла]"""
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in sources)
+
+
+@register.simple_tag
+def srcset(post, field_name='image_preview', extension='jpeg'):
+    """
+    Возвращает srcset копий изображения поста
+
+    Пример: <img srcset="{% srcset post 'image' 'webp' %}">
+    """
+    rendition = (post.renditions or {}).get(field_name)
+    if not rendition:
+        return ''
+    return build_srcset(rendition['sources'].get(extension, []))
+
+
+@register.simple_tag
+def responsive_image(post, field_name='image_preview', sizes='100vw', alt=''):
+    """
+    Выводит <picture> с WebP и JPEG копиями изображения поста
+
+    Если копий еще нет, выводит <img> с исходным файлом.
+
+    Пример: {% responsive_image post 'image_preview' sizes='(max-width: 600px) 100vw, 400px' %}
+    """
+    rendition = (post.renditions or {}).get(field_name)
+    if not rendition:
+        field_file = getattr(post, field_name)
+        return format_html('<img alt="{}" loading="lazy" src="{}">',
+                           alt, field_file.url if field_file else '')
+
+    jpeg = rendition['sources']['jpeg']
+    middle_width, middle_name = jpeg[len(jpeg) // 2]
+    return format_html(
+        '<picture>'
+        '<source sizes="{sizes}" srcset="{webp}" type="image/webp">'
+        '<img alt="{alt}" height="{height}" loading="lazy" sizes="{sizes}" src="{src}" '
+        'srcset="{jpeg}" width="{width}">'
+        '</picture>',
+        sizes=sizes,
+        webp=build_srcset(rendition['sources']['webp']),
+        jpeg=build_srcset(jpeg),
+        alt=alt,
+        src=default_storage.url(middle_name),
+        width=middle_width,
+        height=round(rendition['height'] * middle_width / rendition['width']),
+    )
@@ -0,0 +1,72 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from filmblog import assets, fragments
+from filmblog.tags import tag_index
+
+register = template.Library()
+
+
+@register.simple_tag
+def popular_tags(limit=None):
+    """
+    Возвращает популярные теги из индекса в памяти процесса
+
+    Подходит для облака тегов: у каждого тега есть published_posts.
+    Пример: {% popular_tags 30 as tags %}
+    """
+    return tag_index.most_popular(limit)
+
+
+@register.simple_tag
+def asset_bundle(name):
+    """
+    Подключает бандл стилей или скриптов (см. filmblog.assets)
+
+    Пример: {% asset_bundle 'filmblog/css/site.bundle.css' %}
+    """
+    return assets.render_bundle(name)
+
+
+@register.inclusion_tag('filmblog/includes/tag_menu.html')
+def tag_menu(limit=8):
+    """
+    Выводит пункты меню с самыми популярными тегами
+
+    Пример: <ul class="sub-menu">{% tag_menu 8 %}</ul>
+    """
+    return {'tags': tag_index.most_popular(limit)}
+
+
+
+class ShellFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        html = fragments.get_shell(name, vary_on)
+        if html is None:
+            html = self.nodelist.render(context)
+            fragments.set_shell(name, vary_on, html)
+        return mark_safe(html)
+
+
+@register.tag
+def shell_fragment(parser, token):
+    """
+    Кэширует общую часть страницы до следующего деплоя (см. filmblog.fragments)
+
+    Содержимое не должно зависеть от запроса, кроме значений после имени.
+    Пример: {% shell_fragment 'nav' menu_tags %}...{% endshell_fragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f'{bits[0]} требует имя фрагмента')
+    nodelist = parser.parse(('endshell_fragment',))
+    parser.delete_first_token()
+    return ShellFragmentNode(nodelist, parser.compile_filter(bits[1]),
+                             [parser.compile_filter(bit) for bit in bits[2:]])
@@ -2,14 +2,44 @@ from django.http import HttpRequest
 from django.contrib.auth.models import User
 from django.utils import timezone
 from .views import PostListView
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import include, path
+from PIL import Image
 from django.urls import reverse
 from django.test import RequestFactory
-from .views import search_results
-from .models import Post
+from . import jobs, urls, views
+from .images import update_renditions
+from .search import get_search_backend
+from .tags import tag_index
+from .text import render_body
+from datetime import timedelta
+from . import (archive, assets, benchmark, conditional, downloads, exif, export, facets, fragments,
+               instrumentation, media, pool, query_plans, syndication)
+from .models import (FacetCount, ImportedPost, Job, PhotoMetadata, Post, StaticPage, StoredFile,
+                     TagStats)
+
 
+@override_settings(FILMBLOG_STRICT_BUDGETS=True)
+class FilmblogTestCase(TestCase):
+    """Превышение бюджета запросов представления в любом тесте - ошибка"""
 
-class Search_resultsTestCase(TestCase):
+
+class Search_resultsTestCase(FilmblogTestCase):
     def setUp(self):
         # Создание тестового пользователя
         user = User.objects.create_user(username='testuser', password='12345', email='test@example.com')
@@ -40,26 +70,1294 @@ class Search_resultsTestCase(TestCase):
 
     def test_search_results(self):
         # Создание запроса с параметром query
-        request = self.factory.get(reverse('filmblog:search_results'), {'query': 'Test'})
-        response = search_results(request)
+        response = self.client.get(reverse('filmblog:search_results'), {'query': 'Test'})
         # Проверка, что запрос вернул код 200
         self.assertEqual(response.status_code, 200)
-        # Проверка, что результаты содержат только записи, где в заголовке есть слово "Test (номер)"
-        self.assertIn("Test Post 1", response.content.decode())
-        self.assertIn("Test Post 11", response.content.decode())
-        self.assertIn("Test Post 12", response.content.decode())
+        # Количество берется из индекса, на странице не больше paginate_by
+        self.assertEqual(response.context['paginator'].count, 20)
+        self.assertEqual(len(response.context['results']), 8)
+        self.assertIn("Test Post 19", response.content.decode())
+
+    def test_search_ranks_title_above_body(self):
+        user = User.objects.get(username='testuser')
+        Post.objects.create(title='Проявка', slug='proyavka-body', author=user,
+                            body='Кодак в проявителе', status='published')
+        Post.objects.create(title='Кодак Портра', slug='kodak-portra', author=user,
+                            body='Цветная пленка', status='published')
+        response = self.client.get(reverse('filmblog:search_results'), {'query': 'кодака'})
+        titles = [post.title for post in response.context['results']]
+        self.assertEqual(titles, ['Кодак Портра', 'Проявка'])
+
+    def test_search_skips_drafts_and_deleted_posts(self):
+        post = Post.objects.get(slug='test-post-3')
+        post.status = 'draft'
+        post.save()
+        Post.objects.get(slug='test-post-4').delete()
+        response = self.client.get(reverse('filmblog:search_results'), {'query': 'Test'})
+        self.assertEqual(response.context['paginator'].count, 18)
 
     def test_empty_query(self):
         # Создание запроса без параметра query
-        request = self.factory.get(reverse('filmblog:search_results'))
-        response = search_results(request)
+        response = self.client.get(reverse('filmblog:search_results'))
         # Проверка, что запрос вернул код 200
         self.assertEqual(response.status_code, 200)
         # Проверка, что результаты пусты
         self.assertIn("No search query provided.", response.content.decode())
 
 
-class PostListViewTestCase(TestCase):
+class PostListViewTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Портра 400', slug='portra-400', author=self.user,
+                                        body='Текст', status='published')
+        self.post.tags.add('film')
+
     def test_post_list_View(self):
         response = self.client.get(reverse("filmblog:index"))
-        self.assertContains(response, "Home")
\ No newline at end of file
+        self.assertContains(response, "Home")
+
+    def test_cached_page_skips_database(self):
+        self.client.get(reverse("filmblog:index"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("filmblog:index"))
+        self.assertContains(response, "Портра 400")
+
+    def test_publish_evicts_list_page(self):
+        self.client.get(reverse("filmblog:index"))
+        Post.objects.create(title='Ektar 100', slug='ektar-100', author=self.user,
+                            body='Текст', status='published')
+        self.assertContains(self.client.get(reverse("filmblog:index")), "Ektar 100")
+
+    def test_tag_change_evicts_tag_page(self):
+        tag_url = reverse("filmblog:post_list_by_tag", args=[self.post.tags.get().slug])
+        self.assertContains(self.client.get(tag_url), "Портра 400")
+        self.post.tags.clear()
+        self.post.tags.add('film', 'color')
+        self.post.tags.remove('film')
+        self.assertNotContains(self.client.get(tag_url), "Портра 400")
+
+    def test_eviction_is_limited_to_cached_pages(self):
+        old = timezone.now() - timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            fragments.evict_pages_from(None, old)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT', queries[0]['sql'])
+
+class KeysetPaginationTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='author', password='12345')
+        publish = timezone.now()
+        for i in range(30):
+            Post.objects.create(title=f'Roll {i}', slug=f'roll-{i}', author=user, body='Текст',
+                                status='published', publish=publish - timezone.timedelta(days=i // 2))
+        tag_index.most_popular()  # загрузить снимок тегов для меню заранее
+
+    def test_walks_all_pages_without_count(self):
+        seen = []
+        url = reverse('filmblog:index')
+        query = ''
+        while True:
+            with self.assertNumQueries(2):  # страница постов и prefetch тегов
+                response = self.client.get(f'{url}?{query}')
+            seen += [post.slug for post in response.context['posts']]
+            page = response.context['page_obj']
+            if not page.has_next():
+                break
+            query = page.next_query
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(len(set(seen)), 30)
+
+    def test_previous_cursor_returns_same_page(self):
+        url = reverse('filmblog:index')
+        page3 = self.client.get(f'{url}?page=3').context['page_obj']
+        page4 = self.client.get(f'{url}?{page3.next_query}').context['page_obj']
+        back = self.client.get(f'{url}?{page4.previous_query}').context['page_obj']
+        self.assertEqual([p.pk for p in back], [p.pk for p in page3])
+
+    def test_deep_page_number_is_not_found(self):
+        response = self.client.get(reverse('filmblog:index'), {'page': 500})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('filmblog:index'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+
+class MediaRootMixin:
+    """
+    Временный MEDIA_ROOT на время теста
+
+    Атрибуты:
+        jobs_sync (bool): Выполнять задачи очереди сразу (FILMBLOG_JOBS_SYNC)
+    """
+    jobs_sync = True
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, FILMBLOG_JOBS_SYNC=self.jobs_sync)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+def make_image(name='scan.jpg', size=(2000, 1000), color='gray'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class RenditionsTestCase(MediaRootMixin, FilmblogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author', password='12345')
+
+    def test_renditions_created_once_per_hash(self):
+        post = Post.objects.create(title='Скан', slug='scan', author=self.user, body='Текст',
+                                   status='published', image_preview=make_image())
+        rendition = post.renditions['image_preview']
+        self.assertEqual([width for width, name in rendition['sources']['webp']], [400, 800, 1600])
+
+        post.title = 'Скан 2'
+        with self.assertNumQueries(0):
+            self.assertFalse(update_renditions(post))
+
+        post.image_preview = make_image('other.jpg', color='white')
+        post.save()
+        self.assertNotEqual(post.renditions['image_preview']['hash'], rendition['hash'])
+
+    def test_template_tag_emits_srcset(self):
+        post = Post.objects.create(title='Скан', slug='scan', author=self.user, body='Текст',
+                                   status='published', image_preview=make_image(size=(600, 300)))
+        html = Template("{% load filmblog_images %}{% responsive_image post %}").render(Context({'post': post}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(' 400w', html)
+        self.assertNotIn(' 800w', html)
+
+
+
+class JobQueueTestCase(MediaRootMixin, FilmblogTestCase):
+    jobs_sync = False
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Скан', slug='scan', author=self.user, body='Текст',
+                                        status='published', image=make_image())
+
+    def test_save_enqueues_once(self):
+        self.assertEqual(self.post.renditions, {})
+        self.post.save()
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.post, job.status), ('renditions', self.post, 'queued'))
+
+    def test_worker_runs_and_retries(self):
+        [job] = jobs.claim(10)
+        self.assertEqual(jobs.claim(10), [])
+        jobs.execute(job.name, job.post_id)
+        jobs.finish(job)
+        self.post.refresh_from_db()
+        self.assertIn('image', self.post.renditions)
+        self.assertEqual(Job.objects.get().status, 'done')
+
+        job = Job.objects.create(name='renditions', post=self.post, max_attempts=2)
+        [job] = jobs.claim(10)
+        jobs.finish(job, OSError('broken'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        [job] = jobs.claim(10)
+        jobs.finish(job, OSError('broken'))
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'failed')
+
+    def test_manage_view_shows_job_status(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('filmblog:post_manage'))
+        self.assertContains(response, 'renditions: Queued')
+
+
+class StreamingUploadTestCase(MediaRootMixin, FilmblogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.client.force_login(self.user)
+
+    def post_data(self, **extra):
+        return dict({'title': 'Roll 1', 'body': 'Текст', 'preview': '', 'status': 'published',
+                     'tags': 'film'}, **extra)
+
+    def partial_files(self):
+        return os.listdir(os.path.join(self.media_root, 'uploads', 'partial'))
+
+    def test_streamed_upload_is_moved_and_hashed(self):
+        response = self.client.post(reverse('filmblog:post_create'),
+                                    self.post_data(image=make_image()))
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        self.assertTrue(os.path.exists(post.image.path))
+        self.assertEqual(self.partial_files(), [])
+
+    def test_non_image_rejected_by_header(self):
+        fake = SimpleUploadedFile('scan.jpg', b'<?php echo 1; ?>', content_type='image/jpeg')
+        response = self.client.post(reverse('filmblog:post_create'), self.post_data(image=fake))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.partial_files(), [])
+
+    @override_settings(FILMBLOG_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_rejected(self):
+        response = self.client.post(reverse('filmblog:post_create'), self.post_data(image=make_image()))
+        self.assertEqual(response.context['form'].errors['image'], ['Файл слишком большой'])
+
+    def test_resumable_chunked_upload(self):
+        content = make_image().read()
+        response = self.client.post(reverse('filmblog:upload_start'),
+                                    {'filename': 'roll.jpg', 'size': len(content)})
+        upload_url = reverse('filmblog:upload_chunk', args=[response.json()['id']])
+
+        response = self.client.put(upload_url, content[:1000], content_type='application/octet-stream',
+                                   headers={'Upload-Offset': '0'})
+        self.assertEqual(response.json()['offset'], 1000)
+        # Повтор с устаревшим смещением после обрыва
+        response = self.client.put(upload_url, content[:1000], content_type='application/octet-stream',
+                                   headers={'Upload-Offset': '0'})
+        self.assertEqual(response.status_code, 409)
+        offset = self.client.get(upload_url).json()['offset']
+        response = self.client.put(upload_url, content[offset:], content_type='application/octet-stream',
+                                   headers={'Upload-Offset': str(offset)})
+        self.assertTrue(response.json()['completed'])
+
+        response = self.client.post(reverse('filmblog:post_create'),
+                                    self.post_data(image_upload=response.json()['id']))
+        self.assertEqual(response.status_code, 302)
+        with Post.objects.get().image.open('rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(self.partial_files(), [])
+
+    def test_corrupt_chunked_upload_rejected(self):
+        # Начало файла похоже на JPEG, но Pillow его не откроет
+        content = b'\xff\xd8\xff\xe0' + b'\x00' * 2000
+        response = self.client.post(reverse('filmblog:upload_start'),
+                                    {'filename': 'roll.jpg', 'size': len(content)})
+        upload_id = response.json()['id']
+        response = self.client.put(reverse('filmblog:upload_chunk', args=[upload_id]), content,
+                                   content_type='application/octet-stream', headers={'Upload-Offset': '0'})
+        self.assertTrue(response.json()['completed'])
+
+        response = self.client.post(reverse('filmblog:post_create'), self.post_data(image_upload=upload_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+
+    def test_post_without_csrf_token_forbidden(self):
+        # Представления помечены csrf_exempt, токен проверяет StreamingUploadMixin
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('filmblog:post_create'), self.post_data(image=make_image()))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Post.objects.exists())
+
+        post = Post.objects.create(title='Скан', slug='scan', author=self.user, body='Текст',
+                                   status='published')
+        response = client.post(reverse('filmblog:post_edit', args=[post.slug]),
+                               self.post_data(title='Другой'))
+        self.assertEqual(response.status_code, 403)
+        post.refresh_from_db()
+        self.assertEqual(post.title, 'Скан')
+
+
+class ContentAddressedStorageTestCase(MediaRootMixin, FilmblogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author', password='12345')
+
+    def create_post(self, title):
+        return Post.objects.create(title=title, slug=title.lower(), author=self.user, body='Текст',
+                                   status='published', image=make_image())
+
+    def cas_files(self):
+        return [name for _, _, names in os.walk(os.path.join(self.media_root, 'cas')) for name in names]
+
+    def test_same_image_stored_once(self):
+        first, second = self.create_post('Roll 1'), self.create_post('Roll 2')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('cas/'))
+        self.assertEqual(len(self.cas_files()), 1)
+        self.assertEqual(StoredFile.objects.get(name=first.image.name).references, 2)
+
+    def test_shared_file_kept_until_unreferenced(self):
+        first, second = self.create_post('Roll 1'), self.create_post('Roll 2')
+        name = first.image.name
+        first.delete()
+        self.assertEqual(media.collect_garbage(timedelta(0)), [])
+        self.assertTrue(os.path.exists(second.image.path))
+
+        second.delete()
+        self.assertEqual(media.collect_garbage(timedelta(0)), [name])
+        self.assertEqual(self.cas_files(), [])
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_grace_period_protects_recent_files(self):
+        self.create_post('Roll 1').delete()
+        self.assertEqual(media.collect_garbage(timedelta(hours=1)), [])
+        self.assertEqual(len(self.cas_files()), 1)
+
+
+class PostNavigationTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        now = timezone.now()
+        self.posts = [
+            Post.objects.create(title=f'Roll {i}', slug=f'roll-{i}', author=self.user, body='Текст',
+                                status='published', publish=now - timezone.timedelta(days=10 - i))
+            for i in range(3)
+        ]
+        self.posts[1].tags.add('film')
+        tag_index.most_popular()
+
+    def test_detail_view_query_count(self):
+        url = self.posts[1].get_absolute_url()
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.context['prev_post']['title'], 'Roll 0')
+        self.assertEqual(response.context['next_post']['title'], 'Roll 2')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, self.posts[2].get_absolute_url())
+        self.assertContains(response, 'film')
+
+    def test_publishing_between_neighbors_evicts_navigation(self):
+        self.client.get(self.posts[0].get_absolute_url())
+        self.client.get(self.posts[1].get_absolute_url())
+        Post.objects.create(title='Roll 0.5', slug='roll-05', author=self.user, body='Текст',
+                            status='published',
+                            publish=self.posts[0].publish + timezone.timedelta(hours=12))
+        response = self.client.get(self.posts[0].get_absolute_url())
+        self.assertEqual(response.context['next_post']['title'], 'Roll 0.5')
+        response = self.client.get(self.posts[1].get_absolute_url())
+        self.assertEqual(response.context['prev_post']['title'], 'Roll 0.5')
+
+    def test_unpublish_and_delete_evict_navigation(self):
+        self.client.get(self.posts[0].get_absolute_url())
+        self.client.get(self.posts[2].get_absolute_url())
+        self.posts[1].status = 'draft'
+        self.posts[1].save()
+        response = self.client.get(self.posts[0].get_absolute_url())
+        self.assertEqual(response.context['next_post']['title'], 'Roll 2')
+
+        self.posts[2].delete()
+        response = self.client.get(self.posts[0].get_absolute_url())
+        self.assertIsNone(response.context['next_post'])
+
+    def test_redate_and_tag_change_evict_navigation(self):
+        for post in self.posts:
+            self.client.get(post.get_absolute_url())
+        self.posts[0].publish = self.posts[2].publish + timezone.timedelta(days=1)
+        self.posts[0].save()
+        response = self.client.get(self.posts[1].get_absolute_url())
+        self.assertIsNone(response.context['prev_post'])
+        response = self.client.get(self.posts[2].get_absolute_url())
+        self.assertEqual(response.context['next_post']['title'], 'Roll 0')
+
+        self.posts[1].tags.add('bw')
+        response = self.client.get(self.posts[1].get_absolute_url())
+        self.assertEqual({tag['slug'] for tag in response.context['tags']}, {'bw', 'film'})
+
+
+class QueryBudgetTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.view_stats.reset()
+        self.user = User.objects.create_user(username='author', password='12345', is_staff=True)
+        for i in range(12):
+            post = Post.objects.create(title=f'Roll {i}', slug=f'roll-{i}', author=self.user,
+                                       body='Текст', status='published')
+            post.tags.add('film', f'tag-{i}')
+        self.post = post
+
+    def test_read_views_within_budget(self):
+        for post in Post.objects.all():
+            PhotoMetadata.objects.create(post=post, camera='NIKON F3', film='Portra 400', iso=400)
+        facets.recount()
+        cache.clear()
+        # Бюджеты не зависят от числа постов: N+1 в шаблоне их превысит
+        # Список фасетов читается из базы только при холодном кэше
+        for url in (reverse('filmblog:photo_facets'),
+                    reverse('filmblog:photo_facets') + '?film=portra-400&iso=400',
+                    reverse('filmblog:index'),
+                    reverse('filmblog:post_list_by_tag', args=['film']),
+                    reverse('filmblog:search_results') + '?query=roll',
+                    self.post.get_absolute_url()):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('filmblog:post_manage')).status_code, 200)
+
+    def test_budget_exceeded(self):
+        metrics = instrumentation.RequestMetrics()
+        metrics.view_name = 'filmblog:index'
+        metrics.queries = 5
+        with self.assertRaises(instrumentation.QueryBudgetExceeded):
+            instrumentation.check_budget(metrics, (4, None))
+
+    def test_server_timing_header(self):
+        self.client.get(reverse('filmblog:index'))
+        response = self.client.get(reverse('filmblog:index'))
+        self.assertEqual(response.metrics.queries, 0)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('cache_hit=1', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('filmblog:index'))
+        self.assertEqual(self.client.get(reverse('filmblog:metrics')).status_code, 404)
+        self.client.force_login(self.user)
+        stats = self.client.get(reverse('filmblog:metrics')).json()['views']
+        self.assertEqual(stats['filmblog:index']['requests'], 1)
+
+
+class BenchmarkTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_dataset_is_deterministic(self):
+        self.assertEqual(benchmark.generate_dataset(30, images=0, batch_size=7), 30)
+        titles = list(benchmark.dataset_posts().order_by('slug').values_list('title', 'publish'))
+        self.assertEqual(benchmark.generate_dataset(30, images=0), 0)
+        Post.objects.all().delete()
+        benchmark.generate_dataset(30, images=0, batch_size=30)
+        self.assertEqual(
+            list(benchmark.dataset_posts().order_by('slug').values_list('title', 'publish')), titles
+        )
+
+    def test_run_benchmark_reports_percentiles(self):
+        benchmark.generate_dataset(30, images=0)
+        report = benchmark.run_benchmark(requests=3, warmup=1)
+        self.assertEqual(set(report['results']),
+                         {'index', 'index_deep', 'tag', 'detail', 'search', 'manage'})
+        for result in report['results'].values():
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(report['environment']['posts'], 30)
+
+    def test_run_render_benchmark_compares_cached_templates(self):
+        benchmark.generate_dataset(30, images=0)
+        report = benchmark.run_render_benchmark(renders=2)
+        self.assertEqual(set(report['results']), set(benchmark.RENDER_SCENARIOS))
+        self.assertEqual(report['results']['detail']['template'], 'filmblog/single-standard.html')
+        for result in report['results'].values():
+            self.assertEqual(result['after']['renders'], 2)
+
+
+class TagStatsTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Roll 1', slug='roll-1', author=self.user,
+                                        body='Текст', status='published')
+        self.draft = Post.objects.create(title='Roll 2', slug='roll-2', author=self.user,
+                                         body='Текст', status='draft')
+        self.post.tags.add('film', 'bw')
+        self.draft.tags.add('film', 'color')
+
+    def stats(self):
+        return dict(TagStats.objects.values_list('slug', 'published_posts'))
+
+    def test_counts_follow_publication(self):
+        self.assertEqual(self.stats(), {'film': 1, 'bw': 1, 'color': 0})
+        self.draft.status = 'published'
+        self.draft.save()
+        self.assertEqual(self.stats(), {'film': 2, 'bw': 1, 'color': 1})
+        self.post.tags.remove('bw')
+        self.post.delete()
+        self.assertEqual(self.stats(), {'film': 1, 'bw': 0, 'color': 1})
+        self.assertEqual([tag.slug for tag in tag_index.most_popular()], ['color', 'film'])
+
+    def test_tag_page_has_no_tag_lookups(self):
+        tag_index.most_popular()
+        with self.assertNumQueries(2):  # страница постов и prefetch тегов
+            response = self.client.get(reverse('filmblog:post_list_by_tag', args=['film']))
+        self.assertEqual(response.context['tag'].name, 'film')
+        self.assertEqual(len(response.context['posts']), 1)
+        response = self.client.get(reverse('filmblog:post_list_by_tag', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_menu_lists_popular_tags(self):
+        response = self.client.get(reverse('filmblog:index'))
+        self.assertContains(response, reverse('filmblog:post_list_by_tag', args=['bw']))
+        self.assertNotContains(response, reverse('filmblog:post_list_by_tag', args=['color']))
+
+    def test_page_shell_is_cached_until_menu_changes(self):
+        url = self.post.get_absolute_url()
+        self.assertContains(self.client.get(url), reverse('filmblog:post_list_by_tag', args=['bw']))
+        self.assertIsNotNone(fragments.get_shell('header'))
+        self.assertIsNotNone(fragments.get_shell('footer'))
+        fragments.set_shell('footer', (), '<footer>cached</footer>')
+        self.assertContains(self.client.get(reverse('filmblog:index')), '<footer>cached</footer>')
+
+        self.draft.status = 'published'
+        self.draft.save()
+        response = self.client.get(url)
+        self.assertContains(response, reverse('filmblog:post_list_by_tag', args=['color']))
+        with override_settings(FILMBLOG_DEPLOY_VERSION='next'):
+            self.assertNotContains(self.client.get(url), '<footer>cached</footer>')
+
+
+class QueryPlanTestCase(FilmblogTestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Roll 1', slug='roll-1', author=user, body='Текст',
+                                        status='published')
+
+    def test_hot_queries_use_indexes(self):
+        reports = {report.name: report for report in query_plans.check()}
+        for name in ('post_list', 'post_list_cursor', 'post_detail', 'post_manage'):
+            self.assertTrue(reports[name].uses_index, reports[name].plan)
+        self.assertEqual(reports['post_detail'].seq_scans, [])
+        call_command('explain_queries', stdout=StringIO())
+
+    def test_detail_lookup_by_day(self):
+        self.assertEqual(self.client.get(self.post.get_absolute_url()).status_code, 200)
+        response = self.client.get(reverse('filmblog:post_detail', args=[2024, 2, 30, 'roll-1']))
+        self.assertEqual(response.status_code, 404)
+
+
+class PostCardTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Roll 1', slug='roll-1', author=self.user,
+                                        body='<p>Длинное эссе</p>' * 1000, status='published',
+                                        preview=' '.join(['кадр'] * 40) + '\n\n<b>конец</b>')
+
+    def test_preview_html_is_stored(self):
+        expected = Template('{{ preview|truncatewords:30|linebreaks }}').render(
+            Context({'preview': self.post.preview}))
+        self.assertEqual(self.post.preview_html, expected)
+        self.post.preview = 'Новое <превью>'
+        self.post.save(update_fields=['preview'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.preview_html, '<p>Новое &lt;превью&gt;</p>')
+
+    def test_list_views_do_not_load_body(self):
+        response = self.client.get(reverse('filmblog:index'))
+        post = response.context['posts'][0]
+        self.assertIn('body', post.get_deferred_fields())
+        self.assertIn('author_id', post.get_deferred_fields())
+        self.assertContains(response, self.post.preview_html, html=False)
+
+        response = self.client.get(reverse('filmblog:search_results'), {'query': 'эссе'})
+        self.assertIn('body', response.context['results'][0].get_deferred_fields())
+
+
+class PostBodyTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+
+    def test_body_is_sanitized(self):
+        rendered = render_body(
+            '<p onclick="x()">Проявка <b>HP5<script>alert(1)</script></b> в D76'
+            '<a href="javascript:alert(1)">ссылка</a> <a href="https://example.com">сайт</a></p>'
+            '<iframe src="https://example.com"><p>внутри</p></iframe>'
+            '<div style="color:red">&lt;не тег&gt;<em>курсив'
+        )
+        self.assertEqual(
+            rendered.html,
+            '<p>Проявка <b>HP5</b> в D76<a>ссылка</a> '
+            '<a href="https://example.com" rel="nofollow noopener">сайт</a></p>'
+            '<div>&lt;не тег&gt;<em>курсив</em></div>'
+        )
+        self.assertEqual(rendered.excerpt, 'Проявка HP5 в D76ссылка сайт <не тег>курсив')
+        self.assertEqual(rendered.reading_time, 1)
+
+    def test_images_are_lazy_and_post_images_responsive(self):
+        rendered = render_body('<p>' + 'кадр ' * 450 + '</p><img src="/images/a.jpg" onerror="x()">'
+                               '<img src="data:image/png;base64,AAAA"><img src="/images/post.jpg">',
+                               images={'/images/post.jpg': '<picture>копии</picture>'})
+        self.assertIn('<img src="/images/a.jpg" alt="" loading="lazy" decoding="async">',
+                      rendered.html)
+        self.assertNotIn('data:', rendered.html)
+        self.assertTrue(rendered.html.endswith('<picture>копии</picture>'))
+        self.assertEqual(rendered.excerpt, 'кадр ' * 39 + 'кадр …')
+        # 450 слов и 2 изображения
+        self.assertEqual(rendered.reading_time, 3)
+
+    def test_unclosed_dropped_tags_keep_rest_of_body(self):
+        self.assertEqual(render_body('<p>Hello</p><embed src="x.swf"><p>rest of article</p>').html,
+                         '<p>Hello</p><p>rest of article</p>')
+        self.assertEqual(render_body('<p>Hello</p>\n<textarea>note<p>rest</p>').html,
+                         '<p>Hello</p>\nnote<p>rest</p>')
+        self.assertEqual(render_body('<svg><g><text>t</g></svg><p>rest</p>').html, '<p>rest</p>')
+
+    def test_detail_shows_stored_body(self):
+        post = Post.objects.create(title='Roll 1', slug='roll-1', author=self.user, status='published',
+                                   body='<p>Текст<script>alert(1)</script></p>')
+        self.assertEqual(post.body_html, '<p>Текст</p>')
+        response = self.client.get(post.get_absolute_url())
+        self.assertContains(response, '<p>Текст</p>', html=False)
+        self.assertNotContains(response, 'alert(1)')
+        self.assertContains(response, '<meta content="Текст" name="description">', html=False)
+        self.assertIn('body', response.context['post'].get_deferred_fields())
+
+        post.body = '<p>Новый текст</p>'
+        post.save(update_fields=['body'])
+        post.refresh_from_db()
+        self.assertEqual(post.body_html, '<p>Новый текст</p>')
+
+    def test_render_posts_command(self):
+        post = Post.objects.create(title='Roll 1', slug='roll-1', author=self.user, status='published',
+                                   body='<p>Текст</p>')
+        Post.objects.filter(pk=post.pk).update(body_html='устарело', excerpt='', reading_time=0)
+        etag = self.client.get(post.get_absolute_url())['ETag']
+        out = StringIO()
+        call_command('render_posts', stdout=out)
+        self.assertIn('обновлено: 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.body_html, post.excerpt, post.reading_time), ('<p>Текст</p>', 'Текст', 1))
+        self.assertNotEqual(self.client.get(post.get_absolute_url())['ETag'], etag)
+        out = StringIO()
+        call_command('render_posts', stdout=out)
+        self.assertIn('обновлено: 0', out.getvalue())
+
+
+class ConditionalGetTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        tag_index.most_popular()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Roll 1', slug='roll-1', author=self.user,
+                                        body='Body', preview='Preview', status='published')
+
+    def test_list_not_modified(self):
+        url = reverse('filmblog:index')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0), self.assertTemplateNotUsed('filmblog/index.html'):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.post.title = 'Roll 1, reprint'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_not_modified(self):
+        url = self.post.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.post.tags.add('film')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'film')
+
+    def test_cache_clear_invalidates(self):
+        version = conditional.content_version()
+        cache.clear()
+        self.assertGreater(conditional.content_version(), version)
+        response = self.client.get(reverse('filmblog:post_detail', args=[2024, 2, 30, 'roll-1']))
+        self.assertEqual(response.status_code, 404)
+
+
+class SyndicationTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Roll <1>', slug='roll-1', author=self.user,
+                                        body='<p>Kodak Gold</p>', status='published')
+        self.post.tags.add('kodak')
+        self.draft = Post.objects.create(title='Draft', slug='draft', author=self.user,
+                                         body='Body')
+
+    def get_xml(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response).decode()
+
+    def test_sitemap_is_sharded_and_cached_by_chunk(self):
+        index = self.get_xml(reverse('filmblog:sitemap'))
+        self.assertIn('<loc>http://testserver/sitemap-posts-0.xml</loc>', index)
+        self.assertIn('<loc>http://testserver/sitemap-lists-0.xml</loc>', index)
+
+        url = reverse('filmblog:sitemap_section', args=['posts', 0])
+        sitemap = self.get_xml(url)
+        self.assertIn(f'<loc>http://testserver{self.post.get_absolute_url()}</loc>', sitemap)
+        self.assertNotIn('draft', sitemap)
+        lists = self.get_xml(reverse('filmblog:sitemap_section', args=['lists', 0]))
+        self.assertIn('<loc>http://testserver/tag/kodak/</loc>', lists)
+
+        other_chunk = syndication.chunk_key('posts', 5)
+        cache.set(other_chunk, '<url></url>')
+        with self.assertNumQueries(0):
+            self.get_xml(url)
+
+        self.draft.status = 'published'
+        self.draft.save()
+        self.assertIsNone(cache.get(syndication.chunk_key('posts', 0)))
+        self.assertIsNotNone(cache.get(other_chunk))
+        self.assertIn(self.draft.get_absolute_url(), self.get_xml(url))
+
+        response = self.client.get(reverse('filmblog:sitemap_section', args=['posts', 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_feeds(self):
+        rss = self.get_xml(reverse('filmblog:rss_feed'))
+        self.assertIn('<title>Roll &lt;1&gt;</title>', rss)
+        self.assertIn(f'<link>http://testserver{self.post.get_absolute_url()}</link>', rss)
+        self.assertNotIn('Draft', rss)
+        atom = self.get_xml(reverse('filmblog:atom_feed_by_tag', args=['kodak']))
+        self.assertIn('<summary>Kodak Gold</summary>', atom)
+
+        self.draft.status = 'published'
+        self.draft.save()
+        self.draft.tags.add('kodak')
+        self.assertIn('Draft', self.get_xml(reverse('filmblog:rss_feed')))
+        self.assertIn('Draft', self.get_xml(reverse('filmblog:atom_feed_by_tag', args=['kodak'])))
+
+        response = self.client.get(reverse('filmblog:rss_feed_by_tag', args=['fuji']))
+        self.assertEqual(response.status_code, 404)
+
+
+class AnonymousFastPathTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Roll 1', slug='roll-1', author=self.user,
+                                        body='Body', status='published')
+
+    def test_anonymous_pages_skip_session(self):
+        for url in (reverse('filmblog:index'), self.post.get_absolute_url(),
+                    reverse('filmblog:search_results') + '?query=roll'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+            self.assertIn('public', response['Cache-Control'])
+            self.assertNotIn('Cookie', response.get('Vary', ''))
+            self.assertFalse(response.cookies)
+
+    def test_logged_in_pages_are_private(self):
+        self.client.login(username='author', password='12345')
+        response = self.client.get(reverse('filmblog:index'))
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(reverse('filmblog:post_manage'))
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+
+
+class StaticAssetsTestCase(FilmblogTestCase):
+    def test_minify(self):
+        css = assets.minify_css('/* c */\n.a , .b:hover {\n  color: red; /* x */\n'
+                                '  width: calc(100% - 10px);\n  content: "/* keep */";\n}\n')
+        self.assertEqual(css, '.a,.b:hover{color:red;width:calc(100% - 10px);content:"/* keep */"}\n')
+        js = assets.minify_js('/* head\n * more */\nvar a = 1;\n\n    // comment\n'
+                              'function f() {\n  return a;\n}\n')
+        self.assertEqual(js, 'var a = 1;\nfunction f() {\nreturn a;\n}\n')
+
+    def test_collectstatic_builds_hashed_bundles(self):
+        response = self.client.get(reverse('filmblog:index'))
+        self.assertContains(response, 'filmblog/css/base.css')
+
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'filmblog.assets.BundledStaticFilesStorage'},
+        }
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            # css/old ссылается на несуществующие файлы
+            with self.assertLogs('filmblog.assets', 'WARNING'):
+                call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(static_root, 'staticfiles.json')) as f:
+                manifest = json.load(f)['paths']
+            bundle = manifest['filmblog/css/site.bundle.css']
+            with open(os.path.join(static_root, bundle)) as f:
+                css = f.read()
+            self.assertTrue(css.startswith('@import'))
+            self.assertIn(manifest['filmblog/images/icons/icon-quote.svg'].split('/')[-1], css)
+            self.assertTrue(os.path.exists(os.path.join(static_root, bundle + '.gz')))
+
+            response = self.client.get(reverse('filmblog:index'))
+            self.assertContains(response, bundle)
+            self.assertContains(response, manifest['filmblog/js/site.bundle.js'])
+            self.assertNotContains(response, 'filmblog/css/base.css')
+
+        report = assets.report()
+        self.assertEqual(report['site']['bundle_requests'], 3)
+        self.assertGreater(report['editor']['saved_bytes'], 0)
+
+
+class StaticExportTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.export_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(FILMBLOG_STATIC_EXPORT_ROOT=self.export_root,
+                                                   FILMBLOG_JOBS_SYNC=True)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.posts = [
+            Post.objects.create(title=f'Roll {i}', slug=f'roll-{i}', author=self.user, body='Body',
+                                preview='Preview', status='published',
+                                publish=timezone.now() - timedelta(days=10 - i))
+            for i in range(4)
+        ]
+        self.posts[0].tags.add('film')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.export_root)
+
+    def read(self, path):
+        with open(export.file_path(path), 'rb') as file:
+            return file.read()
+
+    def test_full_export(self):
+        shutil.rmtree(self.export_root)
+        StaticPage.objects.all().delete()
+        call_command('export_site', '--full', stdout=StringIO())
+
+        index = self.read(reverse('filmblog:index'))
+        self.assertIn(b'Roll 3', index)
+        with open(export.file_path(reverse('filmblog:index')) + '.gz', 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), index)
+        self.assertIn(b'Roll 0', self.read(reverse('filmblog:post_list_by_tag', args=['film'])))
+        for post in self.posts:
+            self.assertEqual(self.read(post.get_absolute_url()),
+                             self.client.get(post.get_absolute_url()).content)
+        self.assertFalse(os.path.exists(export.file_path(f"{reverse('filmblog:index')}?page=2")))
+
+    def test_save_rebuilds_affected_pages(self):
+        untouched = export.file_path(self.posts[0].get_absolute_url())
+        os.utime(untouched, (0, 0))
+
+        post = self.posts[2]
+        post.title = 'Roll 2, reprint'
+        post.save()
+        self.assertIn(b'Roll 2, reprint', self.read(post.get_absolute_url()))
+        self.assertIn(b'Roll 2, reprint', self.read(reverse('filmblog:index')))
+        # Соседи ссылаются на пост по заголовку
+        self.assertIn(b'Roll 2, reprint', self.read(self.posts[1].get_absolute_url()))
+        self.assertEqual(os.stat(untouched).st_mtime, 0)
+
+    def test_unpublish_and_delete_remove_pages(self):
+        url = self.posts[3].get_absolute_url()
+        self.posts[3].status = 'draft'
+        self.posts[3].save()
+        self.assertFalse(os.path.exists(export.file_path(url)))
+        self.assertFalse(StaticPage.objects.filter(path=url).exists())
+        self.assertNotIn(b'Roll 3', self.read(reverse('filmblog:index')))
+
+        url = self.posts[0].get_absolute_url()
+        self.posts[0].delete()
+        self.assertFalse(os.path.exists(export.file_path(url)))
+        self.assertNotIn(b'Roll 0', self.read(reverse('filmblog:post_list_by_tag', args=['film'])))
+
+
+# URLconf с асинхронными представлениями чтения, как под ASGI (FILMBLOG_ASYNC_VIEWS)
+async_views = {
+    'index': views.AsyncPostListView.as_view(),
+    'post_list_by_tag': views.AsyncPostListView.as_view(),
+    'post_detail': views.AsyncPostDetailView.as_view(),
+    'search_results': views.AsyncSearchResultsView.as_view(),
+}
+urlpatterns = [path('', include(([
+    path(str(pattern.pattern), async_views.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in urls.urlpatterns
+], 'filmblog')))]
+
+
+@override_settings(ROOT_URLCONF='filmblog.tests')
+class AsyncViewsTestCase(FilmblogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.posts = [
+            Post.objects.create(title=f'Roll {i}', slug=f'roll-{i}', author=self.user,
+                                body=f'Проявка пленки {i}', preview='Preview', status='published',
+                                publish=timezone.now() - timedelta(days=20 - i))
+            for i in range(12)
+        ]
+        self.posts[0].tags.add('film')
+        tag_index.most_popular()
+
+    async def test_list_matches_sync_view(self):
+        response = await self.async_client.get(reverse('filmblog:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Roll 11')
+        # Посты и их теги
+        self.assertEqual(response.metrics.queries, 2)
+        self.assertEqual(len(response.context['posts']), fragments.POST_LIST_PAGE_SIZE)
+
+        response = await self.async_client.get(reverse('filmblog:index'), {'page': 2})
+        self.assertContains(response, 'Roll 0')
+        response = await self.async_client.get(reverse('filmblog:index'), {'page': 2},
+                                               headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.metrics.queries, 0)
+
+        response = await self.async_client.get(reverse('filmblog:post_list_by_tag', args=['film']))
+        self.assertContains(response, 'Roll 0')
+        response = await self.async_client.get(reverse('filmblog:post_list_by_tag', args=['none']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_detail(self):
+        post = self.posts[5]
+        response = await self.async_client.get(post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['prev_post']['title'], 'Roll 4')
+        self.assertEqual(response.context['next_post']['title'], 'Roll 6')
+        self.assertEqual(response.metrics.queries, 4)
+
+        response = await self.async_client.get(post.get_absolute_url(),
+                                               headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.metrics.queries, 1)
+
+        response = await self.async_client.get(
+            reverse('filmblog:post_detail', args=[2024, 2, 30, 'roll-1']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_search(self):
+        url = reverse('filmblog:search_results')
+        response = await self.async_client.get(url, {'query': 'проявка'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertEqual(len(response.context['results']), 8)
+
+        response = await self.async_client.get(url, {'query': 'проявка', 'page': 'last'})
+        self.assertEqual(len(response.context['results']), 4)
+        response = await self.async_client.get(url, {'query': 'проявка', 'page': 3})
+        self.assertEqual(response.status_code, 404)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.usable = True
+        self.rollbacks = 0
+
+
+class ConnectionPoolTestCase(FilmblogTestCase):
+    def make_pool(self, **options):
+        def close(conn):
+            conn.closed = True
+
+        def reset(conn):
+            conn.rollbacks += 1
+
+        return pool.ConnectionPool(lambda conn: conn.usable, reset, close, **options)
+
+    def test_reuse_and_overflow(self):
+        connection_pool = self.make_pool(size=1, max_overflow=1, timeout=0.05)
+        first = connection_pool.checkout(FakeConnection)
+        second = connection_pool.checkout(FakeConnection)
+        with self.assertRaises(pool.PoolTimeout):
+            connection_pool.checkout(FakeConnection)
+
+        connection_pool.checkin(first)
+        connection_pool.checkin(second)
+        # Сверх size соединение закрывается, остальное возвращается в пул после отката
+        self.assertEqual(first.rollbacks, 1)
+        self.assertFalse(first.closed)
+        self.assertTrue(second.closed)
+        self.assertIs(connection_pool.checkout(FakeConnection), first)
+
+        stats = connection_pool.stats()
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['closed'], 1)
+        self.assertEqual(stats['checkouts'], 4)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['idle'], 0)
+
+    def test_waiting_checkout_gets_released_connection(self):
+        connection_pool = self.make_pool(size=1, max_overflow=0, timeout=5)
+        first = connection_pool.checkout(FakeConnection)
+        timer = threading.Timer(0.05, connection_pool.checkin, [first])
+        timer.start()
+        self.assertIs(connection_pool.checkout(FakeConnection), first)
+        timer.join()
+        stats = connection_pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_ms_max'], 0)
+
+    def test_health_check_and_recycle(self):
+        connection_pool = self.make_pool(check_after=0)
+        broken = connection_pool.checkout(FakeConnection)
+        connection_pool.checkin(broken)
+        broken.usable = False
+        replacement = connection_pool.checkout(FakeConnection)
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(connection_pool.stats()['failed_checks'], 1)
+
+        connection_pool.recycle = 0
+        connection_pool.checkin(replacement)
+        self.assertTrue(replacement.closed)
+        self.assertEqual(connection_pool.stats()['idle'], 0)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Бэкенд с пулом только для PostgreSQL')
+    def test_backend_reuses_connection(self):
+        from .backends.postgresql_pool.base import DatabaseWrapper
+
+        wrapper = DatabaseWrapper({**connection.settings_dict}, 'pool_test')
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        wrapper.close()
+        wrapper.pool.dispose()
+
+
+class ArchiveImportTestCase(MediaRootMixin, FilmblogTestCase):
+    jobs_sync = False
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.archive = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive)
+        self.user = User.objects.create_user(username='author', password='12345')
+        os.makedirs(os.path.join(self.archive, 'scans'))
+        for name, color in (('a.jpg', 'gray'), ('b.jpg', 'white')):
+            with open(os.path.join(self.archive, 'scans', name), 'wb') as file:
+                file.write(make_image(name, size=(600, 400), color=color).read())
+        self.entries = [
+            {'id': 'roll-1', 'title': 'Весна', 'slug': 'spring', 'publish': '1987-03-14',
+             'tags': ['bw', 'Город'], 'body': '<p>Кадр <script>x</script></p>', 'image': 'scans/a.jpg'},
+            {'title': 'Лето', 'publish': '1987-07-01T12:00:00', 'tags': ['bw'], 'image': 'scans/b.jpg',
+             'status': 'draft'},
+            {'id': 'roll-3', 'title': 'Осень', 'image': 'scans/missing.jpg'},
+        ]
+
+    def write_manifest(self):
+        with open(os.path.join(self.archive, 'manifest.jsonl'), 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in self.entries)
+
+    def test_import_is_batched_and_resumable(self):
+        self.write_manifest()
+        result = archive.import_archive(self.archive, self.user, batch_size=2)
+        self.assertEqual((result.imported, result.skipped, result.renditions), (2, 0, 2))
+        self.assertEqual([key for key, message in result.failed], [f'{os.path.basename(self.archive)}:roll-3'])
+
+        spring = Post.objects.get(slug='spring')
+        self.assertEqual(spring.publish.date().isoformat(), '1987-03-14')
+        self.assertEqual(spring.body_html, '<p>Кадр </p>')
+        self.assertEqual(sorted(spring.tags.names()), ['bw', 'Город'])
+        self.assertEqual(spring.renditions['image']['hash'], spring.renditions['image_preview']['hash'])
+        self.assertTrue(Post.objects.get(title='Лето').slug.startswith('roll-'))
+        self.assertEqual(StoredFile.objects.get(name=spring.image.name).references, 2)
+        self.assertEqual(dict(TagStats.objects.values_list('slug', 'published_posts'))['bw'], 1)
+        self.assertEqual(get_search_backend().count('кадр'), 1)
+        self.assertContains(self.client.get(reverse('filmblog:index')), 'Весна')
+
+        self.entries[2]['image'] = 'scans/b.jpg'
+        self.write_manifest()
+        out = StringIO()
+        call_command('import_archive', self.archive, author='author', workers=0, stdout=out,
+                     stderr=StringIO())
+        self.assertIn('Импортировано постов: 1', out.getvalue())
+        self.assertIn('пропущено: 2', out.getvalue())
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(StoredFile.objects.get(name=spring.image.name).references, 2)
+        self.assertFalse(Job.objects.filter(name='renditions').exclude(status='done').exists())
+
+    def test_interrupted_renditions_are_queued(self):
+        self.write_manifest()
+        importer = archive.ArchiveImporter(self.user, 'archive')
+        # Импорт прерван после транзакции пачки, пул копий не успел
+        post_ids = importer.import_batch([next(iter(archive.read_manifest(self.archive)))])
+        job = Job.objects.get(name='renditions', post_id__in=post_ids)
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_after, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        [job] = jobs.claim(10)
+        jobs.execute(job.name, job.post_id)
+        jobs.finish(job)
+        post = Post.objects.get(pk=job.post_id)
+        self.assertIn('image', post.renditions)
+        self.assertTrue(PhotoMetadata.objects.filter(post=post).exists())
+
+        archive.build_renditions(post_ids)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'done')
+
+    def test_duplicate_titles_get_unique_slugs(self):
+        Post.objects.create(title='Roll', slug='roll', author=self.user, body='Текст')
+        self.entries = [
+            {'id': 'a', 'title': 'Roll', 'publish': '1987-03-14'},
+            {'id': 'b', 'title': 'Roll', 'publish': '1987-03-14'},
+            {'id': 'c', 'title': 'Roll', 'publish': '1988-05-01'},
+        ]
+        self.write_manifest()
+        result = archive.import_archive(self.archive, self.user, batch_size=2)
+        self.assertEqual(result.imported, 3)
+        slugs = list(Post.objects.values_list('slug', flat=True))
+        self.assertEqual(len(set(slugs)), 4)
+        self.client.force_login(self.user)
+        for slug in slugs:
+            self.assertEqual(self.client.get(reverse('filmblog:post_edit', args=[slug])).status_code, 200)
+
+    def test_directory_archive(self):
+        roll = os.path.join(self.archive, 'rolls', '1990-roll')
+        os.makedirs(roll)
+        shutil.copy(os.path.join(self.archive, 'scans', 'a.jpg'), os.path.join(roll, '01.jpg'))
+        with open(os.path.join(roll, archive.POST_METADATA), 'w', encoding='utf-8') as file:
+            json.dump({'title': 'Девяностый', 'slug': 'roll-1990', 'tags': ['color']}, file)
+        result = archive.import_archive(os.path.join(self.archive, 'rolls'), self.user, source='family')
+        self.assertEqual(result.imported, 1)
+        post = Post.objects.get()
+        self.assertEqual((post.title, post.slug), ('Девяностый', 'roll-1990'))
+        self.assertTrue(ImportedPost.objects.filter(key='family:1990-roll', post=post).exists())
+
+
+def make_exif_image(name='scan.jpg', camera='F3', lens='Nikkor 50mm f/1.4', film='Portra 400', iso=400):
+    exif_data = Image.Exif()
+    exif_data[0x010F] = 'NIKON'  # Make
+    exif_data[0x0110] = camera  # Model
+    exif_data[0x010E] = f'Film: {film}'  # ImageDescription
+    details = exif_data.get_ifd(0x8769)
+    details[0xA434] = lens  # LensModel
+    details[0x8827] = iso  # ISOSpeedRatings
+    details[0x9004] = '2024:05:01 10:00:00'  # DateTimeDigitized
+    buffer = BytesIO()
+    Image.new('RGB', (600, 400), 'gray').save(buffer, 'JPEG', exif=exif_data)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class PhotoFacetsTestCase(MediaRootMixin, FilmblogTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='12345')
+
+    def create_post(self, slug, status='published', **exif_values):
+        return Post.objects.create(title=slug, slug=slug, author=self.user, body='Текст', status=status,
+                                   image=make_exif_image(f'{slug}.jpg', **exif_values))
+
+    def count(self, facet, value):
+        row = FacetCount.objects.filter(facet=facet, value=value).first()
+        return row.published_posts if row else 0
+
+    def test_read_metadata(self):
+        values = exif.read_metadata(make_exif_image(camera='NIKON F3', film='Kodak Portra 400'))
+        self.assertEqual(values['camera'], 'NIKON F3')
+        self.assertEqual(values['lens'], 'Nikkor 50mm f/1.4')
+        self.assertEqual(values['film'], 'Kodak Portra 400')
+        self.assertEqual(values['iso'], 400)
+        self.assertEqual(values['scanned'].year, 2024)
+        self.assertEqual(exif.film_stock('Ролл на tri-x, проявка D76'), 'Tri-X 400')
+
+    def test_counts_follow_publication(self):
+        post = self.create_post('one')
+        self.create_post('draft', status='draft')
+        self.assertEqual(post.metadata.camera, 'NIKON F3')
+        self.assertEqual(self.count('film', 'Portra 400'), 1)
+        self.assertEqual(self.count('iso', '400'), 1)
+
+        draft = Post.objects.get(slug='draft')
+        draft.status = 'published'
+        draft.save()
+        self.assertEqual(self.count('camera', 'NIKON F3'), 2)
+
+        post.status = 'draft'
+        post.save()
+        self.assertEqual(self.count('camera', 'NIKON F3'), 1)
+        draft.delete()
+        self.assertEqual(self.count('camera', 'NIKON F3'), 0)
+        self.assertEqual(facets.facet_index()['camera'], [])
+
+    def test_facet_view_filters_posts(self):
+        for number in range(fragments.POST_LIST_PAGE_SIZE + 1):
+            self.create_post(f'portra-{number}')
+        self.create_post('hp5', camera='FM2', film='HP5 Plus', iso=400)
+
+        response = self.client.get(reverse('filmblog:photo_facets'))
+        self.assertContains(response, 'HP5 Plus')
+        self.assertContains(response, f'({fragments.POST_LIST_PAGE_SIZE + 1})')
+
+        film = facets.find('film', 'hp5-plus')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('filmblog:photo_facets'), {'film': film.slug})
+        self.assertEqual([post.slug for post in response.context['posts']], ['hp5'])
+
+        response = self.client.get(reverse('filmblog:photo_facets'), {'film': 'portra-400'})
+        self.assertEqual(len(response.context['posts']), fragments.POST_LIST_PAGE_SIZE)
+        self.assertContains(response, '?film=portra-400&amp;page=2')
+        response = self.client.get(reverse('filmblog:photo_facets'), {'film': 'portra-400', 'page': 2})
+        self.assertEqual([post.slug for post in response.context['posts']], ['portra-0'])
+
+        self.assertEqual(self.client.get(reverse('filmblog:photo_facets'), {'film': 'velvia'}).status_code,
+                         404)
+        detail = self.client.get(Post.objects.get(slug='hp5').get_absolute_url())
+        self.assertContains(detail, f'href="{reverse("filmblog:photo_facets")}?camera=nikon-fm2"')
+
+    def test_extract_metadata_command(self):
+        post = self.create_post('one')
+        post.metadata.delete()
+        FacetCount.objects.all().delete()
+        call_command('extract_metadata', stdout=StringIO())
+        self.assertEqual(self.count('lens', 'Nikkor 50mm f/1.4'), 1)
+
+
+class PostDownloadTestCase(MediaRootMixin, FilmblogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author', password='12345')
+        self.post = Post.objects.create(title='Скан', slug='scan', author=self.user, body='Текст',
+                                        status='published', image=make_image(size=(300, 200)))
+        with self.post.image.open('rb') as file:
+            self.data = file.read()
+        self.url = reverse('filmblog:post_download', args=[self.post.pk])
+
+    def test_parse_range(self):
+        self.assertEqual(downloads.parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(downloads.parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(downloads.parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(downloads.parse_range('bytes=0-5000', 1000), (0, 999))
+        self.assertIsNone(downloads.parse_range('bytes=0-1,5-6', 1000))
+        with self.assertRaises(ValueError):
+            downloads.parse_range('bytes=1000-', 1000)
+
+    def test_full_and_range_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="scan.jpg"')
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_draft_only_for_author(self):
+        Post.objects.filter(pk=self.post.pk).update(status='draft')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.user)
+        with override_settings(FILMBLOG_SENDFILE='nginx'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-images/{self.post.image.name}')
+        self.assertIn('private', response['Cache-Control'])
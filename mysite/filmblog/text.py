@@ -0,0 +1,221 @@
+"""
+Подготовка текста постов к выводу
+
+Тело поста вводится в редакторе как HTML. render_body() при сохранении
+поста очищает его по списку разрешенных тегов и атрибутов, переписывает
+<img> в ленивую загрузку (а изображения самого поста - в <picture> с его
+копиями), считает отрывок для описания страницы и время чтения.
+Результат хранится в Post.body_html, страница поста выводит его как есть.
+После смены правил: manage.py render_posts.
+"""
+import math
+import re
+from collections import namedtuple
+from html import escape
+from html.parser import HTMLParser
+
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+
+PREVIEW_WORDS = 30
+EXCERPT_WORDS = 40
+WORDS_PER_MINUTE = 200
+SECONDS_PER_IMAGE = 10
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'code', 'del', 'div', 'em',
+    'figcaption', 'figure', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'li',
+    'ol', 'p', 'pre', 's', 'small', 'span', 'strong', 'sub', 'sup', 'table',
+    'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+INLINE_TAGS = {'a', 'abbr', 'b', 'code', 'del', 'em', 'i', 's', 'small', 'span',
+               'strong', 'sub', 'sup', 'u'}
+# Теги, которые удаляются вместе с содержимым
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template',
+                'svg', 'math', 'textarea', 'select'}
+# Элементы без закрывающего тега: удаляются без содержимого
+DROPPED_VOID_TAGS = {'embed'}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_SCHEMES = {'href': {'http', 'https', 'mailto'}, 'src': {'http', 'https'}}
+
+RenderedBody = namedtuple('RenderedBody', 'html excerpt reading_time')
+
+_scheme_re = re.compile(r'^([a-z][a-z0-9+.-]*):', re.IGNORECASE)
+_invisible_re = re.compile(r'[\x00-\x20\x7f]+')
+
+
+def render_preview(preview):
+    """
+    HTML превью для карточки поста
+
+    То же, что {{ preview|truncatewords:30|linebreaks }} в шаблоне,
+    но считается один раз при сохранении поста.
+    """
+    return linebreaks(Truncator(preview or '').words(PREVIEW_WORDS, truncate=' …'), autoescape=True)
+
+
+def _safe_url(value, attribute):
+    """URL без опасной схемы (javascript:, data: и т. п.) или None"""
+    compact = _invisible_re.sub('', value)
+    match = _scheme_re.match(compact)
+    if match and match.group(1).lower() not in ALLOWED_SCHEMES[attribute]:
+        return None
+    return value.strip()
+
+
+class BodyRenderer(HTMLParser):
+    """
+    Собирает очищенный HTML, текст и число изображений тела поста
+
+    Атрибуты:
+        images (dict): Адрес изображения -> готовая разметка <picture>
+    """
+
+    def __init__(self, images=None):
+        super().__init__(convert_charrefs=True)
+        self.images = images or {}
+        self.output = []
+        self.text = []
+        self.image_count = 0
+        self._open = []
+        # Открытые удаляемые теги: (тег, строка, позиция, длина открывающего тега)
+        self._dropped = []
+
+    def _attributes(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        result = {}
+        for name, value in attrs:
+            if name not in allowed or value is None or name in result:
+                continue
+            if name in URL_ATTRIBUTES:
+                value = _safe_url(value, name)
+                if value is None:
+                    continue
+            result[name] = value
+        return result
+
+    @staticmethod
+    def _format(tag, attributes):
+        return '<{}{}>'.format(tag, ''.join(
+            f' {name}="{escape(value, quote=True)}"' for name, value in attributes.items()
+        ))
+
+    def _image(self, attributes):
+        src = attributes.get('src')
+        if not src:
+            return
+        self.image_count += 1
+        if src in self.images:
+            self.output.append(self.images[src])
+            return
+        attributes.setdefault('alt', '')
+        attributes.update(loading='lazy', decoding='async')
+        self.output.append(self._format('img', attributes))
+
+    @property
+    def unclosed_drop(self):
+        """
+        Внешний удаляемый тег, который не закрыт до конца текста
+
+        Returns:
+            tuple|None: (строка, позиция, длина открывающего тега) или None
+        """
+        return self._dropped[0][1:] if self._dropped else None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            if tag not in DROPPED_VOID_TAGS:
+                self._dropped.append((tag, *self.getpos(), len(self.get_starttag_text())))
+            return
+        if self._dropped:
+            return
+        if tag not in INLINE_TAGS:
+            self.text.append(' ')
+        if tag not in ALLOWED_TAGS:
+            return
+        attributes = self._attributes(tag, attrs)
+        if tag == 'img':
+            self._image(attributes)
+            return
+        if tag == 'a' and attributes.get('href', '').lower().startswith(('http:', 'https:')):
+            attributes['rel'] = 'nofollow noopener'
+        self.output.append(self._format(tag, attributes))
+        if tag not in VOID_TAGS:
+            self._open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            # Вложенные незакрытые удаляемые теги закрываются вместе с внешним
+            if any(dropped[0] == tag for dropped in self._dropped):
+                while self._dropped.pop()[0] != tag:
+                    pass
+            return
+        if self._dropped:
+            return
+        if tag not in INLINE_TAGS:
+            self.text.append(' ')
+        if tag not in self._open:
+            return
+        # Незакрытые вложенные теги закрываются вместе с внешним
+        while self._open:
+            open_tag = self._open.pop()
+            self.output.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._dropped:
+            self.output.append(escape(data, quote=False))
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self._open:
+            self.output.append(f'</{self._open.pop()}>')
+
+
+def render_body(body, images=None):
+    """
+    Очищенный HTML тела поста, отрывок и время чтения
+
+    Args:
+        body (str): HTML из редактора
+        images (dict|None): Адрес изображения -> разметка, которой его заменить
+
+    Returns:
+        RenderedBody: html, excerpt (текст без тегов) и reading_time (минуты)
+    """
+    body = body or ''
+    while True:
+        renderer = BodyRenderer(images)
+        renderer.feed(body)
+        renderer.close()
+        if renderer.unclosed_drop is None:
+            break
+        # Незакрытый удаляемый тег удалил бы весь текст после себя:
+        # удаляется только сам тег, а текст разбирается заново
+        line, offset, length = renderer.unclosed_drop
+        start = sum(len(row) + 1 for row in body.split('\n')[:line - 1]) + offset
+        body = body[:start] + body[start + length:]
+    text = ' '.join(''.join(renderer.text).split())
+    words = len(text.split())
+    seconds = words / WORDS_PER_MINUTE * 60 + renderer.image_count * SECONDS_PER_IMAGE
+    return RenderedBody(
+        html=''.join(renderer.output),
+        excerpt=Truncator(text).words(EXCERPT_WORDS, truncate=' …'),
+        reading_time=math.ceil(seconds / 60),
+    )
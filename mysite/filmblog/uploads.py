@@ -0,0 +1,164 @@
+"""
+Потоковая загрузка изображений
+
+StreamingImageUploadHandler пишет части загружаемого файла сразу в каталог
+внутри MEDIA_ROOT и считает SHA-256 на лету. Хранилище затем переносит файл
+на место переименованием, без повторного копирования. Файлы, которые не
+похожи на изображение по первым байтам или превышают
+FILMBLOG_MAX_UPLOAD_SIZE, отбрасываются уже на первых частях.
+
+Для больших сканов есть возобновляемая загрузка частями (ChunkedUpload):
+клиент дописывает файл PUT-запросами со смещением и может продолжить
+с последнего принятого байта после обрыва.
+"""
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.views.decorators.csrf import csrf_protect
+
+
+PARTIAL_DIR = 'uploads/partial'
+DEFAULT_MAX_UPLOAD_SIZE = 300 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'II*\x00',  # TIFF little-endian
+    b'MM\x00*',  # TIFF big-endian
+    b'GIF87a',
+    b'GIF89a',
+)
+
+
+def max_upload_size():
+    return getattr(settings, 'FILMBLOG_MAX_UPLOAD_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+def is_image_header(data):
+    """Проверяет по первым байтам, что файл - изображение поддерживаемого формата"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return True
+    return data.startswith(IMAGE_SIGNATURES)
+
+
+def partial_path(name):
+    """Путь к файлу недокачанной загрузки внутри MEDIA_ROOT"""
+    directory = os.path.join(settings.MEDIA_ROOT, PARTIAL_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def hash_path(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    Загруженный файл, уже лежащий на диске рядом с MEDIA_ROOT
+
+    temporary_file_path() позволяет FileSystemStorage перенести файл
+    переименованием. Атрибут sha256 содержит хэш содержимого.
+    """
+
+    def __init__(self, path, name, content_type, size, charset=None, sha256=None):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            pass
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузки, пишущий изображения сразу на диск с подсчетом хэша
+
+    Ошибки отклоненных файлов записываются в request.upload_errors
+    по имени поля формы.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.paths = []
+        if request is not None:
+            request.upload_errors = {}
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset,
+                         content_type_extra)
+        self.path = partial_path(f'{uuid.uuid4().hex}.part')
+        self.paths.append(self.path)
+        self.file = open(self.path, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def _reject(self, message):
+        self.file.close()
+        os.remove(self.path)
+        if self.request is not None:
+            self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not is_image_header(raw_data):
+            self._reject('Файл не является изображением JPEG, PNG, TIFF, WebP или GIF')
+        self.size += len(raw_data)
+        if self.size > max_upload_size():
+            self._reject('Файл слишком большой')
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        return StreamedUploadedFile(self.path, self.file_name, self.content_type, file_size,
+                                    self.charset, sha256=self.digest.hexdigest())
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+        self.cleanup()
+
+    def cleanup(self):
+        """Удаляет файлы, которые не были перенесены в хранилище"""
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class StreamingUploadMixin:
+    """
+    Примесь для представлений с формой загрузки изображений
+
+    Заменяет обработчики загрузки на StreamingImageUploadHandler до разбора
+    тела запроса. Поэтому представление помечается csrf_exempt, а CSRF
+    проверяется здесь, уже после замены обработчиков.
+    """
+
+    def post(self, request, *args, **kwargs):
+        handler = StreamingImageUploadHandler(request)
+        request.upload_handlers = [handler]
+        try:
+            return csrf_protect(super().post)(request, *args, **kwargs)
+        finally:
+            handler.cleanup()
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['upload_errors'] = getattr(self.request, 'upload_errors', {})
+        return kwargs
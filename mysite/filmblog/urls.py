@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import PostListView, PostCreateView, PostManageView
 
@@ -5,18 +6,42 @@ from . import views
 
 app_name = 'filmblog'
 
+# Под ASGI страницы чтения обслуживают асинхронные варианты представлений
+if getattr(settings, 'FILMBLOG_ASYNC_VIEWS', False):
+    post_list = views.AsyncPostListView.as_view()
+    post_detail = views.AsyncPostDetailView.as_view()
+    search_results = views.AsyncSearchResultsView.as_view()
+else:
+    post_list = PostListView.as_view()
+    post_detail = views.PostDetailView.as_view()
+    search_results = views.SearchResultsView.as_view()
+
 
 urlpatterns = [
-    path("", PostListView.as_view(), name="index"),
+    path("", post_list, name="index"),
     path('<int:year>/<int:month>/<int:day>/<slug:post>/',
-         views.PostDetailView.as_view(),
+         post_detail,
          name='post_detail'),
-    path('search/', views.SearchResultsView.as_view(), name='search_results'),
-    path('tag/<slug:tag_slug>/', PostListView.as_view(), name='post_list_by_tag'),
+    path('search/', search_results, name='search_results'),
+    path('tag/<slug:tag_slug>/', post_list, name='post_list_by_tag'),
+    path('photos/', views.PhotoFacetListView.as_view(), name='photo_facets'),
     path('post/create/', PostCreateView.as_view(), name='post_create'),
     path('posts/manage/', PostManageView.as_view(), name='post_manage'),
     path('post/<slug:slug>/edit/', views.PostEditView.as_view(), name='post_edit'),
     path('post/<slug:slug>/delete/', views.PostDeleteView.as_view(), name='post_delete'),
+    path('post/<int:pk>/download/', views.PostDownloadView.as_view(), name='post_download'),
+    path('uploads/', views.ChunkedUploadStartView.as_view(), name='upload_start'),
+    path('uploads/<uuid:pk>/', views.ChunkedUploadView.as_view(), name='upload_chunk'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('sitemap.xml', views.SitemapIndexView.as_view(), name='sitemap'),
+    path('sitemap-<str:section>-<int:shard>.xml', views.SitemapView.as_view(),
+         name='sitemap_section'),
+    path('rss.xml', views.FeedView.as_view(feed_format='rss'), name='rss_feed'),
+    path('atom.xml', views.FeedView.as_view(feed_format='atom'), name='atom_feed'),
+    path('tag/<slug:tag_slug>/rss.xml', views.FeedView.as_view(feed_format='rss'),
+         name='rss_feed_by_tag'),
+    path('tag/<slug:tag_slug>/atom.xml', views.FeedView.as_view(feed_format='atom'),
+         name='atom_feed_by_tag'),
 
 
 ]
\ No newline at end of file
@@ -1,12 +1,26 @@
+import os
+
 # Django core
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q
+from django.http import Http404, JsonResponse
+from django.core.paginator import InvalidPage
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
 from django.utils import timezone
 from django.utils.text import slugify
 
 # Django views
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import (
     CreateView,
     DetailView,
@@ -15,28 +29,71 @@ from django.views.generic import (
 )
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-# Third party
-from taggit.models import Tag
-
 # Local
+from . import (conditional, downloads, facets, fragments, instrumentation, navigation, pool,
+               syndication, tags)
 from .forms import PostForm
-from .models import Post
+from .models import ChunkedUpload, Job, Post
+from .pagination import KeysetPaginationMixin
+from .search import SearchResults, get_search_backend
+from .uploads import StreamingUploadMixin, is_image_header, max_upload_size
 
 
-class PostListView(ListView):
+@method_decorator(conditional.list_condition, name='get')
+class PostListView(KeysetPaginationMixin, ListView):
     """
     Представление для отображения списка постов с фильтрацией по тегам и пагинацией
 
+    Отрендеренные карточки и пагинация кэшируются по тегу и номеру страницы,
+    поэтому повторный запрос страницы не обращается к базе данных.
+    Дальние страницы открываются по курсору (см. KeysetPaginationMixin).
+
     Атрибуты:
         model (Post): Модель для получения данных
         template_name (str): Путь к шаблону index.html
+        fragment_template_name (str): Путь к шаблону кэшируемого фрагмента
         context_object_name (str): Имя переменной списка постов в шаблоне
         paginate_by (int): Количество постов на странице
+        query_budget (int): Допустимое число SQL-запросов (см. filmblog.instrumentation)
+        public (bool): Страница одинакова для анонимных посетителей (см. filmblog.anonymous)
     """
     model = Post
     template_name = 'filmblog/index.html'
-    context_object_name = 'page_obj'
-    paginate_by = 8
+    fragment_template_name = 'filmblog/includes/post_list.html'
+    context_object_name = 'posts'
+    paginate_by = fragments.POST_LIST_PAGE_SIZE
+    query_budget = 3
+    public = True
+
+    def get(self, request, *args, **kwargs):
+        """
+        Отдает страницу из кэша фрагментов, если она там есть
+        """
+        page = request.GET.get(self.page_kwarg) or '1'
+        if page.isdigit() and self.cursor_kwarg not in request.GET:
+            html = fragments.get_post_list(self.kwargs.get('tag_slug'), int(page))
+            if html is not None:
+                return render(request, self.template_name, {'post_list_html': mark_safe(html)})
+        return super().get(request, *args, **kwargs)
+
+    @cached_property
+    def tag(self):
+        """
+        Тег из URL по индексу тегов в памяти процесса (см. filmblog.tags)
+
+        Returns:
+            TagInfo|None: Тег или None для списка всех постов
+
+        Raises:
+            Http404: Если тега нет
+        """
+        tag_slug = self.kwargs.get('tag_slug')
+        if not tag_slug:
+            return None
+        tag = tags.tag_index.get(tag_slug)
+        if tag is None:
+            raise Http404('Тег не найден')
+        return tag
 
     def get_queryset(self):
         """
@@ -44,16 +101,13 @@ class PostListView(ListView):
 
         Returns:
             QuerySet: Опубликованные посты, отфильтрованные по тегу (если указан),
-                     с предзагруженными данными автора и тегов
+                     только с полями карточки и предзагруженными тегами
         """
-        queryset = Post.published.all()
-        tag_slug = self.kwargs.get('tag_slug')
+        queryset = Post.published.cards()
+        if self.tag:
+            queryset = queryset.filter(tags__id=self.tag.id)
 
-        if tag_slug:
-            tag = get_object_or_404(Tag, slug=tag_slug)
-            queryset = queryset.filter(tags__in=[tag])
-
-        return queryset.select_related('author').prefetch_related('tags')
+        return queryset
 
     def get_context_data(self, **kwargs):
         """
@@ -66,21 +120,22 @@ class PostListView(ListView):
             dict: Контекст с дополнительными данными:
                 - page_obj: Пагинированный список постов
                 - tag: Текущий тег (если указан)
-                - articles: Посты с указанным тегом
+                - post_list_html: Отрендеренный и закэшированный фрагмент списка
         """
         context = super().get_context_data(**kwargs)
         tag_slug = self.kwargs.get('tag_slug')
+        context['tag'] = self.tag
 
-        if tag_slug:
-            context['tag'] = get_object_or_404(Tag, slug=tag_slug)
-
-        context['articles'] = Post.objects.filter(
-            tags__name=context.get('tag')
-        ).distinct() if context.get('tag') else None
+        with instrumentation.span('template'):
+            html = render_to_string(self.fragment_template_name, context)
+        if context['page_obj'].number:
+            fragments.set_post_list(tag_slug, context['page_obj'].number, html)
+        context['post_list_html'] = html
 
         return context
 
 
+@method_decorator(conditional.post_condition, name='get')
 class PostDetailView(DetailView):
     """
     Представление для отображения детальной информации о посте
@@ -89,10 +144,14 @@ class PostDetailView(DetailView):
         model (Post): Модель поста
         template_name (str): Путь к шаблону детального просмотра
         context_object_name (str): Имя переменной поста в шаблоне
+        query_budget (int): Допустимое число SQL-запросов (см. filmblog.instrumentation)
+        public (bool): Страница одинакова для анонимных посетителей (см. filmblog.anonymous)
     """
     model = Post
     template_name = 'filmblog/single-standard.html'
     context_object_name = 'post'
+    query_budget = 5
+    public = True
 
     def get_object(self):
         """
@@ -101,88 +160,76 @@ class PostDetailView(DetailView):
         Returns:
             Post: Опубликованный пост с указанными параметрами или 404
 
+        Пост уже найден при проверке условного запроса (см. filmblog.conditional).
+
         Raises:
             Http404: Если пост не найден
         """
-        return get_object_or_404(
-            Post,
-            slug=self.kwargs['post'],
-            status='published',
-            publish__year=self.kwargs['year'],
-            publish__month=self.kwargs['month'],
-            publish__day=self.kwargs['day']
-        )
+        return conditional.get_post(self.request, **self.kwargs)
 
     def get_context_data(self, **kwargs):
         """
         Расширяет контекст шаблона навигационными данными
 
+        Навигация берется из кэша (см. filmblog.navigation), поэтому
+        при теплом кэше страница поста стоит один запрос к базе.
+
         Args:
             **kwargs: Дополнительные именованные аргументы
 
         Returns:
             dict: Контекст с дополнительными данными:
                 - post: Текущий пост
-                - prev_post: Предыдущий пост
-                - next_post: Следующий пост
+                - prev_post: Предыдущий пост ({'id', 'title', 'url'} или None)
+                - next_post: Следующий пост ({'id', 'title', 'url'} или None)
+                - tags: Теги поста
+                - photo_metadata: Камера, объектив, пленка и ISO снимка (см. filmblog.facets)
         """
         context = super().get_context_data(**kwargs)
-        post = self.get_object()
-
-        context.update({
-            'prev_post': self._get_adjacent_post(post, is_next=False),
-            'next_post': self._get_adjacent_post(post, is_next=True)
-        })
-
+        context.update(self.post_navigation)
+        context['photo_metadata'] = self.photo_metadata
         return context
 
-    def _get_adjacent_post(self, post, is_next=True):
-        """
-        Получает следующий или предыдущий пост относительно текущего
+    @cached_property
+    def post_navigation(self):
+        return navigation.get_navigation(self.object)
 
-        Args:
-            post (Post): Текущий пост
-            is_next (bool): True для следующего, False для предыдущего
+    @cached_property
+    def photo_metadata(self):
+        return facets.describe(self.object)
 
-        Returns:
-            Post|None: Соседний опубликованный пост или None если не существует
-        """
-        try:
-            if is_next:
-                return post.get_next_by_publish(status='published')
-            return post.get_previous_by_publish(status='published')
-        except Post.DoesNotExist:
-            return None
 
+@method_decorator(conditional.list_condition, name='get')
 class SearchResultsView(ListView):
     """
-    Представление для поиска постов по заголовку
+    Представление для полнотекстового поиска постов с ранжированием
 
     Атрибуты:
         model (Post): Модель для поиска
         template_name (str): Путь к шаблону результатов
         context_object_name (str): Имя переменной с результатами в контексте
         paginate_by (int): Количество результатов на странице
+        query_budget (int): Допустимое число SQL-запросов (см. filmblog.instrumentation)
+        public (bool): Страница одинакова для анонимных посетителей (см. filmblog.anonymous)
     """
     model = Post
     template_name = 'filmblog/search_results.html'
     context_object_name = 'results'
     paginate_by = 8
+    query_budget = 6
+    public = True
 
     def get_queryset(self):
         """
-        Возвращает отфильтрованный QuerySet на основе поискового запроса
+        Возвращает результаты поиска по индексу
 
         Returns:
-            QuerySet: Отфильтрованные посты или пустой QuerySet
+            SearchResults|QuerySet: Посты, упорядоченные по релевантности,
+                                    или пустой QuerySet
         """
         query = self.request.GET.get('query', '')
         if query:
-            return Post.objects.filter(
-                Q(title__icontains=query) |
-                Q(body__icontains=query) |
-                Q(preview__icontains=query)
-            ).select_related('author').prefetch_related('tags')
+            return get_search_backend().search(query)
         return Post.objects.none()
 
     def get_context_data(self, **kwargs):
@@ -194,9 +241,176 @@ class SearchResultsView(ListView):
         return context
 
 
-class PostCreateView(LoginRequiredMixin, CreateView):
+@method_decorator(conditional.list_condition, name='get')
+class PhotoFacetListView(KeysetPaginationMixin, ListView):
     """
-    Представление для создания новых постов
+    Представление для просмотра снимков по камере, объективу, пленке и ISO
+
+    Значения фасетов передаются слагами в query string (?camera=nikon-f3&film=portra-400).
+    Счетчики постов берутся из FacetCount (см. filmblog.facets), а посты
+    фильтруются по индексированным полям PhotoMetadata.
+
+    Атрибуты:
+        model (Post): Модель для получения данных
+        template_name (str): Путь к шаблону photo_facets.html
+        fragment_template_name (str): Путь к шаблону списка постов
+        context_object_name (str): Имя переменной списка постов в шаблоне
+        paginate_by (int): Количество постов на странице
+        query_budget (int): Допустимое число SQL-запросов (см. filmblog.instrumentation)
+        public (bool): Страница одинакова для анонимных посетителей (см. filmblog.anonymous)
+    """
+    model = Post
+    template_name = 'filmblog/photo_facets.html'
+    fragment_template_name = 'filmblog/includes/post_list.html'
+    context_object_name = 'posts'
+    paginate_by = fragments.POST_LIST_PAGE_SIZE
+    query_budget = 4
+    public = True
+
+    @cached_property
+    def selected(self):
+        """
+        Выбранные значения фасетов
+
+        Returns:
+            dict: Фасет -> FacetInfo
+
+        Raises:
+            Http404: Если у значения нет опубликованных постов
+        """
+        selected = {}
+        for facet in facets.FACETS:
+            slug = self.request.GET.get(facet)
+            if slug:
+                info = facets.find(facet, slug)
+                if info is None:
+                    raise Http404('Значение не найдено')
+                selected[facet] = info
+        return selected
+
+    def get_queryset(self):
+        """
+        Возвращает опубликованные посты с выбранными значениями фасетов
+
+        Returns:
+            QuerySet: Посты только с полями карточки и предзагруженными тегами
+        """
+        queryset = Post.published.cards()
+        for facet, info in self.selected.items():
+            value = int(info.value) if facet == 'iso' else info.value
+            queryset = queryset.filter(**{f'metadata__{facet}': value})
+        return queryset
+
+    def get_keyset_paginator(self, queryset, page_size):
+        paginator = super().get_keyset_paginator(queryset, page_size)
+        query = facets.facet_query(self.selected)
+        paginator.query_prefix = f'{query}&' if query else ''
+        return paginator
+
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет фасеты со счетчиками и выбранные значения
+
+        Returns:
+            dict: Контекст с дополнительными данными:
+                - facet_groups: Значения фасетов со ссылками (см. facets.facet_groups)
+                - selected_facets: Выбранные значения FacetInfo
+                - post_list_html: Отрендеренный список постов
+        """
+        context = super().get_context_data(**kwargs)
+        context['facet_groups'] = facets.facet_groups(self.selected)
+        context['selected_facets'] = list(self.selected.values())
+        with instrumentation.span('template'):
+            context['post_list_html'] = render_to_string(self.fragment_template_name, context)
+        return context
+
+
+class AsyncPostListView(PostListView):
+    """
+    Асинхронный вариант PostListView для запуска под ASGI
+
+    Фрагмент страницы читается из асинхронного кэша, при промахе посты
+    загружаются асинхронным ORM. Рендеринг шаблона ответа выполняет
+    обработчик Django в потоке.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await conditional.list_condition(self._get)(request, *args, **kwargs)
+
+    async def _get(self, request, *args, **kwargs):
+        page = request.GET.get(self.page_kwarg) or '1'
+        if page.isdigit() and self.cursor_kwarg not in request.GET:
+            html = await fragments.aget_post_list(self.kwargs.get('tag_slug'), int(page))
+            if html is not None:
+                return TemplateResponse(request, self.template_name,
+                                        {'post_list_html': mark_safe(html)})
+
+        # Индекс тегов может перечитать снимок из базы
+        await sync_to_async(getattr)(self, 'tag')
+        self.object_list = self.get_queryset()
+        await self.aload_keyset_page(self.object_list, self.paginate_by)
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncPostDetailView(PostDetailView):
+    """
+    Асинхронный вариант PostDetailView для запуска под ASGI
+
+    Пост и навигация загружаются асинхронным ORM и асинхронным кэшем
+    до проверки условного запроса.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        await conditional.aget_post(request, **kwargs)
+        return await conditional.post_condition(self._get)(request, *args, **kwargs)
+
+    async def _get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        self.post_navigation = await navigation.aget_navigation(self.object)
+        # Список фасетов может перечитать счетчики из базы
+        self.photo_metadata = await sync_to_async(facets.describe)(self.object)
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class AsyncSearchResultsView(SearchResultsView):
+    """
+    Асинхронный вариант SearchResultsView для запуска под ASGI
+
+    Срез результатов текущей страницы загружается заранее
+    (см. SearchResults.afetch), и пагинация обходится без базы.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await conditional.list_condition(self._get)(request, *args, **kwargs)
+
+    async def _get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        if isinstance(self.object_list, SearchResults):
+            await self.object_list.afetch(*await self._page_bounds(self.object_list))
+        return self.render_to_response(self.get_context_data())
+
+    async def _page_bounds(self, results):
+        """
+        Границы среза текущей страницы
+
+        Raises:
+            Http404: Если номер страницы неверен
+        """
+        await sync_to_async(results.count)()
+        paginator = self.get_paginator(results, self.paginate_by)
+        page = self.request.GET.get(self.page_kwarg) or 1
+        try:
+            number = paginator.num_pages if page == 'last' else paginator.validate_number(page)
+        except InvalidPage as e:
+            raise Http404(str(e))
+        start = (number - 1) * paginator.per_page
+        return start, start + paginator.per_page
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class PostCreateView(LoginRequiredMixin, StreamingUploadMixin, CreateView):
+    """
+    Представление для создания новых постов с потоковой загрузкой изображений
 
     Атрибуты:
         model (Post): Модель поста
@@ -237,20 +451,23 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         return self.object.get_absolute_url()
 
 
-class PostManageView(LoginRequiredMixin, ListView):
+class PostManageView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
-    Представление для управления постами
+    Представление для управления постами с курсорной пагинацией по дате создания
 
     Атрибуты:
         model (Post): Модель поста
         template_name (str): Путь к шаблону управления постами
         context_object_name (str): Имя переменной списка постов в контексте
         paginate_by (int): Количество постов на странице
+        query_budget (int): Допустимое число SQL-запросов (см. filmblog.instrumentation)
     """
     model = Post
     template_name = 'filmblog/post_manage.html'
     context_object_name = 'posts'
     paginate_by = 10
+    keyset_field = 'created'
+    query_budget = 6
 
     def get_queryset(self):
         """
@@ -258,19 +475,21 @@ class PostManageView(LoginRequiredMixin, ListView):
 
         Returns:
             QuerySet: Посты с предзагруженными связанными данными
+                      и незавершенными фоновыми задачами
         """
-        return Post.objects.select_related('author') \
-            .prefetch_related('tags') \
+        unfinished_jobs = Job.objects.exclude(status='done')
+        return Post.objects.only('title', 'slug', 'status', 'publish', 'created') \
+            .prefetch_related(Prefetch('jobs', queryset=unfinished_jobs)) \
             .order_by('-created')
 
     def get_context_data(self, **kwargs):
-        """Добавляет дополнительный контекст"""
+        """Добавляет счетчики постов по статусам одним запросом"""
         context = super().get_context_data(**kwargs)
-        context.update({
-            'total_posts': Post.objects.count(),
-            'published_posts': Post.published.count(),
-            'draft_posts': Post.objects.filter(status='draft').count()
-        })
+        context.update(Post.objects.aggregate(
+            total_posts=Count('pk'),
+            published_posts=Count('pk', filter=Q(status='published')),
+            draft_posts=Count('pk', filter=Q(status='draft')),
+        ))
         return context
 
     def get_queryset_by_status(self, status):
@@ -284,9 +503,10 @@ class PostManageView(LoginRequiredMixin, ListView):
         return queryset.filter(status=status)
 
 
-class PostEditView(LoginRequiredMixin, UpdateView):
+@method_decorator(csrf_exempt, name='dispatch')
+class PostEditView(LoginRequiredMixin, StreamingUploadMixin, UpdateView):
     """
-    Представление для редактирования постов
+    Представление для редактирования постов с потоковой загрузкой изображений
 
     Атрибуты:
         model (Post): Модель поста
@@ -342,6 +562,9 @@ class PostDeleteView(LoginRequiredMixin, DeleteView):
     """
     Представление для удаления постов
 
+    Файлы изображений не удаляются сразу: на них могут ссылаться другие посты.
+    Неиспользуемые файлы удаляет manage.py gc_media.
+
     Атрибуты:
         model (Post): Модель поста
         template_name (str): Путь к шаблону подтверждения удаления
@@ -366,16 +589,162 @@ class PostDeleteView(LoginRequiredMixin, DeleteView):
             return redirect('filmblog:post_manage')
         return super().dispatch(request, *args, **kwargs)
 
-    def delete(self, request, *args, **kwargs):
-        """
-        Переопределение метода удаления для сохранения файлов
-        """
-        obj = self.get_object()
 
-        # Удаление связанных изображений
-        if obj.image:
-            obj.image.delete(save=False)
-        if obj.image_preview:
-            obj.image_preview.delete(save=False)
+class ChunkedUploadStartView(LoginRequiredMixin, View):
+    """
+    Начинает возобновляемую загрузку файла частями
+
+    Ожидает POST с полями filename и size, возвращает id загрузки.
+    """
+
+    def post(self, request):
+        try:
+            size = int(request.POST['size'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Не указан размер файла'}, status=400)
+        if size <= 0 or size > max_upload_size():
+            return JsonResponse({'error': 'Файл слишком большой'}, status=413)
+
+        upload = ChunkedUpload.objects.create(
+            user=request.user,
+            filename=os.path.basename(request.POST.get('filename', 'upload'))[:255],
+            size=size
+        )
+        return JsonResponse({'id': str(upload.pk), 'offset': 0, 'size': size}, status=201)
+
+
+class ChunkedUploadView(LoginRequiredMixin, View):
+    """
+    Прием частей возобновляемой загрузки
+
+    GET возвращает текущее смещение, PUT дописывает тело запроса, если
+    заголовок Upload-Offset совпадает с уже принятым количеством байт.
+    """
+    chunk_size = 64 * 1024
+
+    def get_upload(self):
+        return get_object_or_404(ChunkedUpload, pk=self.kwargs['pk'], user=self.request.user)
+
+    def status(self, upload, status=200):
+        return JsonResponse({
+            'id': str(upload.pk),
+            'offset': upload.offset,
+            'size': upload.size,
+            'completed': upload.completed,
+        }, status=status)
+
+    def get(self, request, pk):
+        return self.status(self.get_upload())
+
+    def put(self, request, pk):
+        upload = self.get_upload()
+        offset = upload.offset
+        if request.headers.get('Upload-Offset') != str(offset):
+            return self.status(upload, status=409)
+
+        with open(upload.path, 'ab') as f:
+            while True:
+                chunk = request.read(self.chunk_size)
+                if not chunk:
+                    break
+                if f.tell() == 0 and not is_image_header(chunk):
+                    return JsonResponse({'error': 'Файл не является изображением'}, status=415)
+                if f.tell() + len(chunk) > upload.size:
+                    f.truncate(offset)
+                    return JsonResponse({'error': 'Данных больше, чем заявлено'}, status=413)
+                f.write(chunk)
+        return self.status(upload)
+
+
+class SitemapIndexView(View):
+    """Индекс карты сайта (см. filmblog.syndication)"""
+    public = True
+
+    def get(self, request):
+        return syndication.streaming_response(request, syndication.sitemap_index_parts(),
+                                              'application/xml')
+
+
+class SitemapView(View):
+    """
+    Файл карты сайта, который отдается потоком по фрагментам из кэша
+
+    Raises:
+        Http404: Если такого файла нет в индексе
+    """
+    public = True
+
+    def get(self, request, section, shard):
+        parts = syndication.sitemap_parts(section, shard)
+        if parts is None:
+            raise Http404('Нет такого файла карты сайта')
+        return syndication.streaming_response(request, parts, 'application/xml')
+
+
+class FeedView(View):
+    """
+    Лента RSS или Atom последних постов, общая или по тегу
+
+    Атрибуты:
+        feed_format (str): rss или atom
+    """
+    feed_format = 'rss'
+    public = True
+    content_types = {'rss': 'application/rss+xml', 'atom': 'application/atom+xml'}
+
+    def get(self, request, tag_slug=None):
+        tag = None
+        if tag_slug:
+            tag = tags.tag_index.get(tag_slug)
+            if tag is None:
+                raise Http404('Тег не найден')
+        return syndication.streaming_response(
+            request, [syndication.get_feed(self.feed_format, tag)],
+            self.content_types[self.feed_format]
+        )
+
+
+class PostDownloadView(View):
+    """
+    Скачивание исходного скана поста
+
+    Опубликованный скан доступен всем, неопубликованный - только автору.
+    Сам файл передает веб-сервер или sendfile (см. filmblog.downloads).
+
+    Raises:
+        Http404: Если поста или скана нет или скан недоступен пользователю
+    """
+
+    def get(self, request, pk):
+        post = get_object_or_404(Post.objects.only('slug', 'status', 'author', 'image'), pk=pk)
+        published = post.status == 'published'
+        if not post.image or not (published or post.author_id == request.user.pk):
+            raise Http404('Скан не найден')
+        filename = post.slug + os.path.splitext(post.image.name)[1].lower()
+        try:
+            response = downloads.download_response(request, post.image.storage, post.image.name, filename)
+        except FileNotFoundError:
+            raise Http404('Скан не найден')
+        if not published:
+            patch_cache_control(response, private=True)
+        return response
+
+
+class MetricsView(View):
+    """
+    Накопленные метрики представлений этого процесса в JSON
+
+    Доступно сотрудникам, а при DEBUG - и с адресов из INTERNAL_IPS
+    (за nginx все запросы приходят с 127.0.0.1). GET-параметр reset=1
+    обнуляет статистику после выдачи.
+    """
 
-        return super().delete(request, *args, **kwargs)
\ No newline at end of file
+    def get(self, request):
+        internal = settings.DEBUG and request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        if not internal and not request.user.is_staff:
+            raise Http404
+        snapshot = instrumentation.view_stats.snapshot()
+        if request.GET.get('reset'):
+            instrumentation.view_stats.reset()
+        return JsonResponse({'pid': os.getpid(), 'views': snapshot, 'db_pools': pool.all_stats()},
+                            json_dumps_params={'ensure_ascii': False, 'indent': 2})
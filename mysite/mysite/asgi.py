@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Представления чтения - асинхронные (см. FILMBLOG_ASYNC_VIEWS)
+os.environ.setdefault('FILMBLOG_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
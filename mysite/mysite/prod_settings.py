@@ -11,13 +11,31 @@ ALLOWED_HOSTS = ['127.0.0.1']
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'filmblog.backends.postgresql_pool',
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Соединение возвращается в пул в конце запроса (filmblog.pool)
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 5)),
+            'timeout': 10,
+            'recycle': 1800,
+            'check_after': 30,
+        },
     }
 }
 
-STATIC_ROOT = os.path.join(BASE_DIR, 'static')
\ No newline at end of file
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# Сканы отдает nginx (location /protected-images/ в config/nginx_static.conf)
+FILMBLOG_SENDFILE = 'nginx'
+
+# collectstatic собирает бандлы, добавляет хэш к именам и пишет .gz/.br (filmblog.assets)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'filmblog.assets.BundledStaticFilesStorage'},
+}
@@ -18,7 +18,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'filmblog.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # До SessionMiddleware: видит итоговые cookie и Vary ответа
+    'filmblog.anonymous.AnonymousFastPathMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -49,8 +52,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Шаблоны компилируются один раз на процесс, в том числе при DEBUG
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -72,6 +81,48 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'static/images/')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Алиас кэша для отрендеренных страниц списка постов.
+# Для одного сервера достаточно LocMemCache (LRU в памяти процесса)
+FILMBLOG_FRAGMENT_CACHE = 'default'
+
+# Выполнять фоновые задачи сразу, без очереди и manage.py run_jobs
+FILMBLOG_JOBS_SYNC = False
+
+# Максимальный размер загружаемого изображения, байт
+FILMBLOG_MAX_UPLOAD_SIZE = 300 * 1024 * 1024
+
+# Кто передает скачиваемые сканы: 'nginx' (X-Accel-Redirect во внутренний
+# location FILMBLOG_SENDFILE_URL), 'xsendfile' (X-Sendfile) или None -
+# Django через sendfile с поддержкой Range (см. filmblog.downloads)
+FILMBLOG_SENDFILE = None
+FILMBLOG_SENDFILE_URL = '/protected-images/'
+
+# Адреса, с которых при DEBUG доступна страница метрик /metrics/
+INTERNAL_IPS = ['127.0.0.1', '::1']
+
+# Превышение бюджета запросов представления вызывает исключение (для тестов)
+FILMBLOG_STRICT_BUDGETS = False
+
+# Каталог статической копии публичных страниц для nginx (None - не выгружать),
+# см. manage.py export_site и config/nginx_static.conf
+FILMBLOG_STATIC_EXPORT_ROOT = None
+
+# Асинхронные представления чтения (списки, пост, поиск) для запуска под ASGI,
+# mysite/asgi.py включает их сам
+FILMBLOG_ASYNC_VIEWS = os.getenv('FILMBLOG_ASYNC_VIEWS') == 'True'
+
+# Сколько секунд фронтовый прокси и браузер могут хранить публичную страницу,
+# отданную анонимному посетителю (см. filmblog.anonymous)
+FILMBLOG_PUBLIC_MAX_AGE = 60
+
+# Сообщения в подписанной cookie: страницы для анонимных посетителей
+# не обращаются к сессии
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Версия деплоя для кэша шапки, меню и подвала страниц (например, хэш коммита);
+# без нее общие части рендерятся заново после каждого перезапуска процесса
+FILMBLOG_DEPLOY_VERSION = os.getenv('FILMBLOG_DEPLOY_VERSION')
+
 try:
     from .local_settings import *
 except ImportError: